@@ -2,7 +2,7 @@
 # transmitted over the UART pins (UART 3)
 #
 
-import sensor, image, time, fir, pyb
+import sensor, image, time, fir, pyb, ustruct, ubinascii
 
 # If connected by USB, enable diagnostics
 # TODO: this detection doesn't work!
@@ -29,6 +29,36 @@ def send(text):
     if debug:
         print(text)
 
+# Binary frames (see camproto.py on the Pi side), sent instead of the
+# lux:/blob:/fps: lines once the Pi asks for them with "B"; "A" goes back
+# to ASCII.  Same layout as camproto.encodeFrame().
+PROTO_SYNC = 0xA5
+PROTO_VERSION = 1
+binary = False
+seq = 0
+
+def fixed(value, scale, low, high):
+    n = int(round(value * scale))
+    return min(max(n, low), high)
+
+def send_frame(lux, fps, blobs):
+    global uart, seq
+    blobs = blobs[:255]
+    frame = bytearray(11 + 6 * len(blobs) + 4)
+    ustruct.pack_into("<BBHH", frame, 0, PROTO_SYNC, PROTO_VERSION,
+        5 + 6 * len(blobs), seq & 0xFFFF)
+    ustruct.pack_into("<HHB", frame, 6, fixed(lux, 100, 0, 0xFFFF),
+        fixed(fps, 100, 0, 0xFFFF), len(blobs))
+    pos = 11
+    for x, y, s in blobs:
+        ustruct.pack_into("<hhH", frame, pos, fixed(x, 10000, -32768, 32767),
+            fixed(y, 10000, -32768, 32767), fixed(s, 10, 0, 0xFFFF))
+        pos += 6
+    crc = ubinascii.crc32(memoryview(frame)[:pos]) & 0xFFFFFFFF
+    ustruct.pack_into("<I", frame, pos, crc)
+    uart.write(frame)
+    seq += 1
+
 # Send an initial message
 send("")
 send("status:starting")
@@ -142,7 +172,8 @@ while(True):
         lux += stats.median()
     if lux > 100:
         lux = 100
-    send("lux:%d" % lux)
+    if not binary:
+        send("lux:%d" % lux)
 
     # Capture FIR data
     #   ta: Ambient temperature
@@ -162,6 +193,7 @@ while(True):
     # Do some detection on the FIR region of the image
     blob_count = 0
     blob_largest = None
+    blobs = []
     for blob in img.find_blobs([fir_threshold],
             pixels_threshold=4, area_threshold=4,
             merge=True, margin=16,
@@ -171,11 +203,13 @@ while(True):
             img.draw_rectangle(blob.rect(), color=(0x00, 0x00, 0xff))
 
         # tell rpi where the blob is
-        send("blob:x=%1.2f:y=%1.2f:s=%1.1f" % (
-           blob.cx() / sensor.width(),
-            (blob.cy() - fir_yoffset) / fir_height,
-            blob.area()/50
-        ))
+        b = (blob.cx() / sensor.width(),
+             (blob.cy() - fir_yoffset) / fir_height,
+             blob.area()/50)
+        if binary:
+            blobs.append(b)
+        else:
+            send("blob:x=%1.2f:y=%1.2f:s=%1.1f" % b)
 
         if debug:
             b = (blob.rect(), blob.area())
@@ -193,7 +227,10 @@ while(True):
 
     # Print FPS.
     fps = clock.fps()
-    send("fps:%1.1f" % fps)
+    if binary:
+        send_frame(lux, fps, blobs)
+    else:
+        send("fps:%1.1f" % fps)
 
     # Adjust FPS towards target
     if fps < fps_target:
@@ -219,5 +256,12 @@ while(True):
             # pi wants us to reset
             send("reset:")
             pyb.hard_reset()
+        elif b == b"B":
+            # pi wants binary frames
+            send("proto:bin%d" % PROTO_VERSION)
+            binary = True
+        elif b == b"A":
+            binary = False
+            send("proto:ascii")
         else:
             send("unknown:%s" % str(b))
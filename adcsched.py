@@ -0,0 +1,121 @@
+import threading
+import time
+from frametrace import tracer
+from smoothing import makeFilter
+
+# ADC sampling for the Snake Eyes Bonnet's ADS1015.  The old adcThread
+# read all four channels round-robin with blocking single-shot reads at
+# 250 samples/s, whether or not they were used.  AdcScheduler samples
+# only the channels asked for, each at its own rate:
+#
+# - one channel: the ADS1x15 is put in continuous-conversion mode and
+#   the latest conversion is just read back when a sample is due, with
+#   no waiting on a conversion;
+# - several: single-shot conversions, the most overdue channel first,
+#   sleeping when none is due; the data rate is picked fast enough that
+#   conversions take at most about half the time.
+#
+# Each sample is clipped and scaled to 0.0-1.0 as before, timestamped
+# (midpoint of the conversion) and optionally filtered (smoothing.py
+# spec) before it's stored.  stats() gives achieved samples/s per
+# channel.  tests/test_adcsched.py runs it against a fake ADS1015
+# (fakehw.py).
+
+DATA_RATES  = (128, 250, 490, 920, 1600, 2400, 3300) # ADS1015 options
+BUSY_SHARE  = 0.5    # Max share of time spent converting
+FULL_SCALE  = 1649.0 # 3.3V at gain 1 (+-4.096V = +-2048)
+
+
+# Slowest data rate that keeps conversions under BUSY_SHARE of the time
+def dataRateFor(totalRate):
+	for rate in DATA_RATES:
+		if totalRate <= rate * BUSY_SHARE: return rate
+	return DATA_RATES[-1]
+
+
+class AdcScheduler(threading.Thread):
+	# rates: {channel: samples/s}; filters: {channel: smoothing spec};
+	# dest: list to store values in (by channel number); mailbox:
+	# shmbox.Mailbox to publish all four channels to ("adc" slot)
+	def __init__(self, adc, rates, filters=None, dest=None, mailbox=None,
+	  gain=1):
+		super(AdcScheduler, self).__init__()
+		self.adc      = adc
+		self.channels = sorted(rates)
+		self.periods  = dict((c, 1.0 / rates[c]) for c in self.channels)
+		self.filters  = dict((c, makeFilter(f)) for c, f in
+		  (filters or {}).items() if f)
+		self.gain     = gain
+		self.dataRate = dataRateFor(sum(rates.values()))
+		self.dest     = dest if dest is not None else [0.0] * 4
+		self.mailbox  = mailbox
+		self.stamps   = [None] * 4 # Time of latest sample, by channel
+		self.counts   = [0] * 4
+		self.began    = None
+		self.running  = True
+
+	def run(self):
+		self.began = time.time()
+		if len(self.channels) == 1: self.runContinuous()
+		elif self.channels: self.runSingleShot()
+
+	def runContinuous(self):
+		c      = self.channels[0]
+		period = self.periods[c]
+		self.dataRate = dataRateFor(1.0 / period)
+		self.adc.start_adc(c, gain=self.gain, data_rate=self.dataRate)
+		try:
+			due = time.time()
+			while self.running:
+				now = time.time()
+				if now < due:
+					time.sleep(due - now)
+					now = due
+				with tracer.span("adc"):
+					n = self.adc.get_last_result()
+				# Conversion finished somewhere in the last period
+				self.store(c, n, now - 0.5 / self.dataRate)
+				due += period
+				if due < now: due = now + period # Fell behind; resync
+		finally:
+			self.adc.stop_adc()
+
+	def runSingleShot(self):
+		due = dict((c, time.time()) for c in self.channels)
+		while self.running:
+			c   = min(self.channels, key=lambda c: due[c])
+			now = time.time()
+			if due[c] > now:
+				time.sleep(due[c] - now)
+			with tracer.span("adc"):
+				t0 = time.time()
+				n  = self.adc.read_adc(c, gain=self.gain,
+				  data_rate=self.dataRate)
+				t1 = time.time()
+			self.store(c, n, (t0 + t1) * 0.5)
+			due[c] += self.periods[c]
+			if due[c] < t1: due[c] = t1 # Fell behind; resync
+
+	def store(self, c, n, stamp):
+		if   n <    0: n = 0
+		elif n > FULL_SCALE: n = FULL_SCALE
+		v = n / FULL_SCALE # Store as 0.0 to 1.0
+		f = self.filters.get(c)
+		if f: v = f.update(v, stamp)
+		self.dest[c]    = v
+		self.stamps[c]  = stamp
+		self.counts[c] += 1
+		if self.mailbox: self.mailbox.publish("adc", self.dest, stamp)
+
+	# Achieved samples/s, by channel sampled
+	def rates(self):
+		elapsed = time.time() - self.began if self.began else 0.0
+		if elapsed <= 0.0: return {}
+		return dict((c, self.counts[c] / elapsed) for c in self.channels)
+
+	def stats(self):
+		mode = "continuous" if len(self.channels) == 1 else "single-shot"
+		return "%s at %d SPS; %s" % (mode, self.dataRate, ", ".join(
+		  "ch%d %.1f/s (want %g)" % (c, r, 1.0 / self.periods[c])
+		  for c, r in sorted(self.rates().items())))
+
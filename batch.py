@@ -0,0 +1,119 @@
+import numpy as np
+import pi3d
+from math import cos, radians, sin
+
+# Batched drawing.  Left to pi3d, each part of an eye (iris, sclera) gets
+# its own rotateToX()/rotateToY() calls and its own chain of matrix
+# products in Shape.draw(), even though all parts of an eye share one gaze
+# rotation and one position.  EyeBatch builds each eye's matrices once per
+# frame, drops them into every part of that eye, and issues the buffer
+# draws itself in an order that keeps same-shader, same-texture parts
+# together (both irises, then both scleras, ...).  Shapes that don't move
+# with the gaze (eyelids) are drawn after the eyes, also grouped.
+#
+# The number of draw calls doesn't change, and pi3d's Buffer.draw() still
+# calls shader.use() every time (its 'fullset' argument is unused).  What
+# the grouping buys is texture binds: Buffer.draw() skips rebinding when
+# the shader and textures are the ones the previous draw used, which in
+# this order is all but the first draw of each group.
+#
+# drawCalls, and shaderRuns and textureRuns (runs of consecutive draws
+# with the same shader, same textures), hold the counts for the most
+# recent frame.
+
+
+# Shader and textures a Shape will draw with, for grouping
+def drawState(shape):
+	b = shape.buf[0]
+	return (b.shader or shape.shader, tuple(b.textures))
+
+
+class EyeBatch(object):
+	def __init__(self, camera=None):
+		self.camera         = camera
+		self.eyes           = [] # [gaze matrix, shapes] per eye
+		self.fixed          = [] # Shapes drawn as-is after the eyes
+		self.order          = None
+		self.drawCalls      = 0
+		self.shaderRuns     = 0
+		self.textureRuns    = 0
+		self.frames         = 0
+
+	# Add the shapes making up one eye; all must already be positioned
+	# at the same point (positionX() etc.), as they rotate about it
+	# together.  Returns index to pass to gaze().
+	def addEye(self, shapes):
+		m = np.identity(4)
+		m[3,0:3] = shapes[0].tr1[3,0:3]
+		self.eyes.append([m, list(shapes)])
+		self.order = None
+		return len(self.eyes) - 1
+
+	# Add shapes that don't follow the gaze (e.g. eyelids)
+	def addFixed(self, shapes):
+		self.fixed.extend(shapes)
+		self.order = None
+
+	# Set gaze of one eye: rotation about X, then Y, in degrees (same as
+	# rotateToX(x) and rotateToY(y) on each part).  Only the rotation
+	# rows change; row 3 (position) was set in addEye().
+	def gaze(self, index, x, y):
+		m = self.eyes[index][0]
+		sx, cx = sin(radians(x)), cos(radians(x))
+		sy, cy = sin(radians(y)), cos(radians(y))
+		m[0,0:3] = cy, sy * sx, -sy * cx
+		m[1,0:3] = 0.0, cx, sx
+		m[2,0:3] = sy, -cy * sx, cy * cx
+
+	# Draw sequence: (shape, eye index or None for fixed shapes, state),
+	# eye parts first, each group of equal state in order of first
+	# appearance.  Sorting is stable, so shapes with equal state keep the
+	# order they were added in.
+	def buildOrder(self):
+		def grouped(items):
+			keys = []
+			for shape, eye, state in items:
+				if state not in keys: keys.append(state)
+			return sorted(items, key=lambda i: keys.index(i[2]))
+		parts = []
+		for i in range(max([len(e[1]) for e in self.eyes] + [0])):
+			for e, eye in enumerate(self.eyes):
+				if i < len(eye[1]):
+					parts.append((eye[1][i], e, drawState(eye[1][i])))
+		self.order = (grouped(parts) + grouped([(shape, None,
+		  drawState(shape)) for shape in self.fixed]))
+
+	def draw(self):
+		if self.order is None: self.buildOrder()
+		camera = self.camera or pi3d.Camera.instance()
+		if not camera.mtrx_made: camera.make_mtrx()
+
+		mv = [np.dot(m, camera.mtrx) for m, shapes in self.eyes]
+
+		self.drawCalls = self.shaderRuns = self.textureRuns = 0
+		shader = textures = None
+		for shape, eye, state in self.order:
+			if state[0] is not shader:
+				self.shaderRuns += 1
+				shader = state[0]
+			if state[1] != textures:
+				self.textureRuns += 1
+				textures = state[1]
+			if eye is None:
+				shape.draw()
+			else:
+				shape.load_opengl()
+				shape.M[0,:,:] = self.eyes[eye][0]
+				shape.M[1,:,:] = mv[eye]
+				shape.MFlg     = False
+				if camera.was_moved: shape.unif[18:21] = camera.eye[0:3]
+				for b in shape.buf:
+					b.draw(shape, shape.M, shape.unif)
+			self.drawCalls += len(shape.buf)
+
+		self.frames += 1
+
+	def stats(self):
+		return ("%d draws in %d shader and %d texture runs per frame "
+		  "(%d frames)" % (self.drawCalls, self.shaderRuns,
+		  self.textureRuns, self.frames))
@@ -0,0 +1,306 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import os
+import platform
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+# Headless frame benchmark for eyes.py / cyclops.py.  Each scenario (see
+# fakehw.py) runs the real script in its own process with stand-in
+# hardware, rendering through Mesa's software GL under Xvfb when there's
+# no display.  Frame times are taken between successive
+# DISPLAY.loop_running() calls, after a warmup; regen counts come from
+# eyestate.step() (null for cyclops.py, which makes its regen decisions
+# inline and never calls it) and mesh uploads from DynamicMesh.update()
+# (both scripts).  Results go to a JSON file tagged with the git commit,
+# so runs can be compared:
+#
+#   bench.py                       all scenarios, eyes.py, 10 s each
+#   bench.py -s 5 idle targets     just these two, 5 s each
+#   bench.py --script cyclops.py --out cyclops.json
+#
+# "bench.py --uart" instead times the camera input path on its own, in
+# both of eyes.py's UART_MODEs, with fakehw.py's camera writing frames
+# down a pipe in this process at 30 fps: "process" runs the real uart.py
+# on that pipe and reads its output lines as eyes.py's uartThread does,
+# "thread" runs uartingest.py here.  Latency is from a frame being written
+# to its target reaching the render loop's side; CPU is the share of one
+# core used by everything involved, the fake camera included (the same
+# in both modes).
+
+SCREEN = "800x480x24" # Xvfb screen, as on the usual Pi displays
+
+
+def orDash(v): return "-" if v is None else v
+
+
+def percentile(sortedValues, fraction):
+	if not sortedValues: return 0.0
+	i = int(round(fraction * (len(sortedValues) - 1)))
+	return sortedValues[i]
+
+
+# In the scenario process: install hardware stand-ins and hooks, then run
+# the eye script until enough frames have been timed.
+def runScenario(args):
+	launched = time.time()
+	import fakehw
+	fakehw.install(args.scenario, args.seed)
+
+	import pi3d
+	import eyestate
+	import gfxutil
+
+	frameTimes = []
+	counts     = { "frames": 0, "irisRegens": 0, "lidRegens": 0,
+	               "meshUploads": 0 }
+	state      = { "first": None, "last": None, "steps": 0 }
+
+	def finish(now):
+		t  = sorted(frameTimes)
+		n  = len(t)
+		dt = now - state["first"] - args.warmup
+		result = dict(counts)
+		if not state["steps"]: # Not eyestate-driven; regens unknown
+			result["irisRegens"] = result["lidRegens"] = None
+		result.update({
+		  "scenario" : args.scenario,
+		  "script"   : args.script,
+		  "startup_s": round(state["first"] - launched, 3),
+		  "seconds"  : round(dt, 3),
+		  "timed"    : n,
+		  "fps"      : round(n / dt, 2) if dt > 0 else 0.0,
+		  "p50_ms"   : round(percentile(t, 0.50) * 1000.0, 3),
+		  "p99_ms"   : round(percentile(t, 0.99) * 1000.0, 3),
+		  "max_ms"   : round(t[-1] * 1000.0, 3) if n else 0.0 })
+		with open(args.out, "w") as f: json.dump(result, f)
+		os._exit(0) # Don't wait on the script's threads or display
+
+	loopRunning = pi3d.Display.Display.loop_running
+	def timedLoopRunning(self):
+		now = time.time()
+		counts["frames"] += 1
+		if state["first"] is None:
+			state["first"] = now
+		elif now - state["first"] >= args.warmup:
+			frameTimes.append(now - state["last"])
+			if now - state["first"] >= args.warmup + args.seconds:
+				finish(now)
+		state["last"] = now
+		return loopRunning(self)
+	pi3d.Display.Display.loop_running = timedLoopRunning
+
+	step = eyestate.step
+	def countedStep(s, now, inputs):
+		r = step(s, now, inputs)
+		state["steps"] += 1
+		counts["irisRegens"] += r.irisRegen
+		counts["lidRegens"]  += sum(r.lidRegen)
+		return r
+	eyestate.step = countedStep
+
+	update = gfxutil.DynamicMesh.update
+	def countedUpdate(self, pts, offset=0):
+		counts["meshUploads"] += 1
+		return update(self, pts, offset)
+	gfxutil.DynamicMesh.update = countedUpdate
+
+	sys.argv = [args.script]
+	runpy.run_path(args.script, run_name="__main__")
+
+
+# Command to run one scenario in a fresh process, under Xvfb if needed
+def scenarioCommand(args, scenario, out):
+	cmd = [sys.executable, os.path.abspath(__file__), "--run", scenario,
+	  "--script", args.script, "--seconds", str(args.seconds),
+	  "--warmup", str(args.warmup), "--out", out]
+	if args.seed is not None: cmd += ["--seed", str(args.seed)]
+	if not os.environ.get("DISPLAY"):
+		cmd = ["xvfb-run", "-a", "-s", "-screen 0 " + SCREEN] + cmd
+	return cmd
+
+
+# CPU seconds (user + system) used so far by process 'pid', from /proc
+def processCpu(pid):
+	with open("/proc/%d/stat" % pid) as f:
+		fields = f.read().rsplit(")", 1)[1].split()
+	return (int(fields[11]) + int(fields[12])) / float(
+	  os.sysconf("SC_CLK_TCK"))
+
+
+# Latencies (seconds) from each publish back to the newest frame written
+# before it
+def publishLatencies(writes, publishes):
+	import bisect
+	out = []
+	for p in publishes:
+		i = bisect.bisect_right(writes, p)
+		if i: out.append(p - writes[i - 1])
+	return out
+
+
+def runUart(mode, seconds, warmup):
+	import fakehw
+	import threading
+	fakehw.FakeSerial.feed = fakehw.Feed("targets", 1)
+	port        = fakehw.FakeSerial()
+	port.writes = []
+	publishes   = []
+	if mode == "thread":
+		ser = fakehw.FakeModule()
+		ser.Serial = lambda *args, **kwargs: port
+		sys.modules["serial"] = ser
+		from uartingest import UartIngest
+		class TimedIngest(UartIngest):
+			def feed(self, data, now):
+				frames = self.frames
+				UartIngest.feed(self, data, now)
+				if self.frames > frames: publishes.append(time.time())
+		reader = TimedIngest()
+		child  = None
+	else:
+		child = subprocess.Popen([sys.executable, "-u",
+		  os.path.abspath(fakehw.__file__), "uartpy", str(port.rfd)],
+		  stdout=subprocess.PIPE, close_fds=False, bufsize=1,
+		  universal_newlines=True)
+		def readLines(): # As eyes.py's uartThread
+			for line in iter(child.stdout.readline, ""):
+				fields = line.rstrip().split(",")
+				x, y, lux, fps = fields[:4]
+				t = None if x == "None" else (float(x), float(y))
+				lux, fps = float(lux), float(fps)
+				tracks = tuple(tuple(float(n) for n in tr.split(":"))
+				  for tr in fields[4].split(";") if tr)
+				publishes.append(time.time())
+		reader = threading.Thread(target=readLines)
+	reader.daemon = True
+	reader.start()
+
+	time.sleep(warmup)
+	began  = time.time()
+	first  = len(publishes)
+	cpu0   = sum(os.times()[:2])
+	child0 = processCpu(child.pid) if child else 0.0
+	time.sleep(seconds)
+	elapsed = time.time() - began
+	cpu     = sum(os.times()[:2]) - cpu0
+	if child:
+		cpu += processCpu(child.pid) - child0
+		child.kill()
+		child.wait()
+	else:
+		reader.stop()
+	port.close()
+
+	lat = sorted(publishLatencies(list(port.writes), publishes[first:]))
+	return { "mode": mode, "frames": len(lat),
+	  "mean_ms": round(sum(lat) / len(lat) * 1000.0, 3) if lat else 0.0,
+	  "p50_ms" : round(percentile(lat, 0.50) * 1000.0, 3),
+	  "p99_ms" : round(percentile(lat, 0.99) * 1000.0, 3),
+	  "cpu_pct": round(100.0 * cpu / elapsed, 2) }
+
+
+def gitCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"],
+		  stderr=open(os.devnull, "w")).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def runAll(args):
+	import fakehw
+	scenarios = args.scenarios or sorted(fakehw.SCENARIOS)
+	env = dict(os.environ)
+	env.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+	results = []
+	for scenario in scenarios:
+		fd, out = tempfile.mkstemp(suffix=".json")
+		os.close(fd)
+		cmd     = scenarioCommand(args, scenario, out)
+		timeout = time.time() + args.warmup + args.seconds + 120
+		proc    = subprocess.Popen(cmd, env=env)
+		while proc.poll() is None and time.time() < timeout:
+			time.sleep(0.2)
+		if proc.poll() is None: proc.kill()
+		try:
+			with open(out) as f: result = json.load(f)
+		except ValueError: # Script died before finishing
+			result = { "scenario": scenario, "error": proc.returncode }
+		os.remove(out)
+		results.append(result)
+		if "error" in result:
+			print "%-12s failed (exit %s)" % (scenario, result["error"])
+		else:
+			print ("%-12s %7.1f fps  p50 %6.2f ms  p99 %6.2f ms  "
+			  "iris %s  lids %s  uploads %d" % (scenario, result["fps"],
+			  result["p50_ms"], result["p99_ms"],
+			  orDash(result["irisRegens"]), orDash(result["lidRegens"]),
+			  result["meshUploads"]))
+
+	with open(args.out, "w") as f:
+		json.dump({ "commit": gitCommit(), "time": time.time(),
+		  "host": platform.node(), "machine": platform.machine(),
+		  "script": args.script, "seconds": args.seconds,
+		  "results": results }, f, indent=1, sort_keys=True)
+	print "Results written to %s" % args.out
+
+
+# Each UART mode in a fresh process of its own
+def runUartModes(args):
+	results = []
+	for mode in ("process", "thread"):
+		fd, out = tempfile.mkstemp(suffix=".json")
+		os.close(fd)
+		subprocess.call([sys.executable, os.path.abspath(__file__),
+		  "--uart-run", mode, "--seconds", str(args.seconds), "--warmup",
+		  str(args.warmup), "--out", out])
+		try:
+			with open(out) as f: result = json.load(f)
+		except ValueError:
+			result = { "mode": mode, "error": True }
+		os.remove(out)
+		results.append(result)
+		if "error" in result:
+			print "%-8s failed" % mode
+		else:
+			print ("%-8s %5d frames  latency mean %6.3f ms  p50 %6.3f ms  "
+			  "p99 %6.3f ms  CPU %5.2f%%" % (mode, result["frames"],
+			  result["mean_ms"], result["p50_ms"], result["p99_ms"],
+			  result["cpu_pct"]))
+
+	with open(args.out, "w") as f:
+		json.dump({ "commit": gitCommit(), "time": time.time(),
+		  "host": platform.node(), "machine": platform.machine(),
+		  "seconds": args.seconds, "uart": results }, f, indent=1,
+		  sort_keys=True)
+	print "Results written to %s" % args.out
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Eye frame benchmark")
+	parser.add_argument("scenarios", nargs="*",
+	  help="scenarios to run (default all; see fakehw.py)")
+	parser.add_argument("--script", default="eyes.py")
+	parser.add_argument("-s", "--seconds", type=float, default=10.0)
+	parser.add_argument("--warmup", type=float, default=2.0)
+	parser.add_argument("--seed", type=int, default=None)
+	parser.add_argument("--out", default="bench.json")
+	parser.add_argument("--uart", action="store_true",
+	  help="time camera input in each UART_MODE instead")
+	parser.add_argument("--run", dest="scenario", help=argparse.SUPPRESS)
+	parser.add_argument("--uart-run", dest="uartMode",
+	  help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.uartMode:
+		with open(args.out, "w") as f:
+			json.dump(runUart(args.uartMode, args.seconds, args.warmup), f)
+		os._exit(0) # Don't wait on reader threads
+	elif args.uart: runUartModes(args)
+	elif args.scenario: runScenario(args)
+	else: runAll(args)
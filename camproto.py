@@ -0,0 +1,140 @@
+import struct
+import zlib
+from uart import FrameParser
+
+# Binary framing for the OpenMV camera link.  The camera's ASCII lines
+# (lux:, one blob:x=..:y=..:s=.. per blob, fps:) run to ~100 bytes for a
+# three-blob frame, a good share of what 115200 baud carries at the
+# camera's frame rate, and each field costs a split and a float() on the
+# Pi.  A binary frame carries the same thing in 15 + 6 per blob bytes:
+#
+#   header  sync 0xA5, version, payload length (u16), sequence (u16)
+#   payload lux, fps (u16, 1/100 units), blob count (u8), then per blob
+#           x, y (s16, 1/10000 of the frame) and size (u16, 1/10 units)
+#   trailer CRC-32 of header and payload (u32)
+#
+# all little-endian.  ASCII stays the default: the Pi asks for binary by
+# writing REQUEST_BINARY ("B"), the camera answers "proto:bin<version>"
+# and switches; "A" switches back.  Camera firmware that doesn't know
+# the request just carries on in ASCII, so StreamDecoder takes both,
+# interleaved: a line is ASCII unless it starts with the sync byte, which
+# never appears in the text protocol.  A frame with a bad length or CRC
+# costs one byte; the decoder then rescans from the next byte on.
+
+SYNC    = 0xA5
+VERSION = 1
+HEADER  = struct.Struct("<BBHH")
+BODY    = struct.Struct("<HHB")
+BLOB    = struct.Struct("<hhH")
+CRC     = struct.Struct("<I")
+
+MAX_BLOBS   = 255
+MAX_PAYLOAD = BODY.size + BLOB.size * MAX_BLOBS
+
+REQUEST_BINARY = b"B"
+REQUEST_ASCII  = b"A"
+
+
+# Camera frame -> bytes; blobs as (x, y, size) with x and y 0.0 to 1.0.
+# The camera has its own copy of this (OpenMV/fir_lcd_detect.py).
+def encodeFrame(seq, lux, fps, blobs):
+	blobs = blobs[:MAX_BLOBS]
+	frame = bytearray(HEADER.size + BODY.size + BLOB.size * len(blobs) +
+	  CRC.size)
+	HEADER.pack_into(frame, 0, SYNC, VERSION,
+	  BODY.size + BLOB.size * len(blobs), seq & 0xFFFF)
+	pos = HEADER.size
+	BODY.pack_into(frame, pos, fixed(lux, 100, 0, 0xFFFF),
+	  fixed(fps, 100, 0, 0xFFFF), len(blobs))
+	pos += BODY.size
+	for x, y, s in blobs:
+		BLOB.pack_into(frame, pos, fixed(x, 10000, -32768, 32767),
+		  fixed(y, 10000, -32768, 32767), fixed(s, 10, 0, 0xFFFF))
+		pos += BLOB.size
+	crc = zlib.crc32(buffer(frame, 0, pos)) & 0xFFFFFFFF
+	CRC.pack_into(frame, pos, crc)
+	return bytes(frame)
+
+
+def fixed(value, scale, low, high):
+	n = int(round(value * scale))
+	if n < low: return low
+	if n > high: return high
+	return n
+
+
+# Splits camera frames out of a receive buffer, binary or ASCII.  feed()
+# decodes what it can of a bytearray and returns (frames, bytes used);
+# the caller drops the used bytes and keeps the rest (a partial frame or
+# line) for next time.  Frames are dicts as from uart.FrameParser, plus
+# 'seq' for binary ones.
+class StreamDecoder(object):
+	def __init__(self):
+		self.parser  = FrameParser()
+		self.binary  = 0 # Frames decoded, by type
+		self.ascii   = 0
+		self.bad     = 0 # Bytes skipped over resyncing
+		self.lost    = 0 # Frames missing by sequence number
+		self.lastSeq = None
+
+	def feed(self, buf):
+		frames = []
+		view   = memoryview(buf)
+		pos    = 0
+		end    = len(buf)
+		while pos < end:
+			if buf[pos] != SYNC:
+				# ASCII line, unless a sync byte turns up first
+				eol  = buf.find(b"\n", pos)
+				sync = buf.find(b"\xa5", pos, eol if eol >= 0 else end)
+				if sync >= 0:
+					self.bad += sync - pos
+					pos = sync
+					continue
+				if eol < 0: break
+				frame = self.parser.feed(str(buf[pos:eol]))
+				pos   = eol + 1
+				if frame:
+					self.ascii += 1
+					frames.append(frame)
+				continue
+
+			if end - pos < HEADER.size: break
+			sync, version, length, seq = HEADER.unpack_from(view, pos)
+			if (version != VERSION or length < BODY.size or
+			  length > MAX_PAYLOAD or (length - BODY.size) % BLOB.size):
+				self.bad += 1
+				pos      += 1
+				continue
+			crcPos = pos + HEADER.size + length
+			if end < crcPos + CRC.size: break
+			crc = zlib.crc32(buffer(buf, pos, crcPos - pos)) & 0xFFFFFFFF
+			if crc != CRC.unpack_from(view, crcPos)[0]:
+				self.bad += 1
+				pos      += 1
+				continue
+			frames.append(self.decode(view, pos + HEADER.size, seq))
+			pos = crcPos + CRC.size
+		del view # Caller can't resize buf while a view exists
+		return frames, pos
+
+	def decode(self, view, pos, seq):
+		lux, fps, count = BODY.unpack_from(view, pos)
+		pos  += BODY.size
+		blobs = []
+		for i in range(count):
+			x, y, s = BLOB.unpack_from(view, pos)
+			pos += BLOB.size
+			blobs.append({ 'x': x / 10000.0, 'y': y / 10000.0,
+			  's': s / 10.0 })
+		if self.lastSeq is not None:
+			gap = (seq - self.lastSeq - 1) & 0xFFFF
+			if gap < 0x8000: self.lost += gap # Else camera restarted
+		self.lastSeq = seq
+		self.binary += 1
+		return { 'lux': lux / 100.0, 'fps': fps / 100.0, 'blobs': blobs,
+		  'seq': seq }
+
+	def stats(self):
+		return "%d binary, %d ascii frames, %d lost, %d bytes skipped" % (
+		  self.binary, self.ascii, self.lost, self.bad)
@@ -10,12 +10,18 @@ import Adafruit_ADS1x15
 import math
 import pi3d
 import random
-import thread
 import time
 import RPi.GPIO as GPIO
 from svg.path import Path, parse_path
 from xml.dom.minidom import parse
+from batch import *
+from adcsched import AdcScheduler
+from eyestate import PupilSchedule
+from gpioinput import ButtonInput
 from gfxutil import *
+from meshcache import *
+from pacing import *
+from replay import openLog, LOG_CLOCK, LOG_ADC, LOG_BUTTONS
 
 # INPUT CONFIG for eye motion ----------------------------------------------
 # ANALOG INPUTS REQUIRE SNAKE EYES BONNET
@@ -32,47 +38,42 @@ PUPIL_MIN       = 0.0   # Lower analog range from PUPIL_IN
 PUPIL_MAX       = 1.0   # Upper "
 BLINK_PIN       = 23    # GPIO pin for blink button
 AUTOBLINK       = True  # If True, eye blinks autonomously
+IRIS_CACHE      = False # If True, prebuild iris meshes for all pupil sizes
+BATCH_DRAW      = False # If True, draw eye via batch.py
+FRAME_RATE      = 0     # Target frames/sec (0 = match fbx2, -1 = unpaced)
+ADC_RATE        = 60    # Samples/sec for each analog input used
+RECORD          = None  # Path to log all inputs to, for replay.py
+
+
+# Input log (see replay.py): outside inputs and the random seed are taken
+# through it, to be recorded or, under replay.py, played back.
+inputLog = openLog(RECORD)
+random.seed(inputLog.seed())
 
 
 # GPIO initialization ------------------------------------------------------
 
 GPIO.setmode(GPIO.BCM)
-if BLINK_PIN >= 0: GPIO.setup(BLINK_PIN , GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# Blink button is edge-triggered (see gpioinput.py)
+buttons = ButtonInput(GPIO, (BLINK_PIN,))
 
 
 # ADC stuff ----------------------------------------------------------------
 
-if JOYSTICK_X_IN >= 0 or JOYSTICK_Y_IN >= 0 or PUPIL_IN >= 0:
-	adc      = Adafruit_ADS1x15.ADS1015()
-	adcValue = [0] * 4
+# Only the inputs in use are sampled, each at ADC_RATE, in a thread of
+# its own so blocking ADC reads don't slow the animation loop; values go
+# to the global list adcValue[] as 0.0 to 1.0.  See adcsched.py.
+adcChannels = [c for c in (JOYSTICK_X_IN, JOYSTICK_Y_IN, PUPIL_IN) if c >= 0]
+if adcChannels:
+	adc        = Adafruit_ADS1x15.ADS1015()
+	adcValue   = [0] * 4
+	adc_thread = AdcScheduler(adc, dict((c, ADC_RATE) for c in adcChannels),
+	  dest=adcValue)
+	adc_thread.daemon = True
+	adc_thread.start()
 else:
 	adc = None
 
-# Because ADC reads are blocking operations, they normally would slow down
-# the animation loop noticably, especially when reading multiple channels
-# (even when using high data rate settings).  To avoid this, ADC channels
-# are read in a separate thread and stored in the global list adcValue[],
-# which the animation loop can read at its leisure (with immediate results,
-# no slowdown).  Since there's a finite limit to the animation frame rate,
-# we intentionally use a slower data rate (rather than sleep()) to lessen
-# the impact of this thread.  data_rate of 250 w/4 ADC channels provides
-# at most 75 Hz update from the ADC, which is plenty for this task.
-def adcThread(adc, dest):
-	while True:
-		for i in range(len(dest)):
-			# ADC input range is +- 4.096V
-			# ADC output is -2048 to +2047
-			# Analog inputs will be 0 to ~3.3V,
-			# thus 0 to 1649-ish.  Read & clip:
-			n = adc.read_adc(i, gain=1, data_rate=250)
-			if   n <    0: n =    0
-			elif n > 1649: n = 1649
-			dest[i] = n / 1649.0 # Store as 0.0 to 1.0
-
-# Start ADC sampling thread if needed:
-if adc:
-	thread.start_new_thread(adcThread, (adc, adcValue))
-
 
 # Load SVG file, extract paths & convert to point lists --------------------
 
@@ -182,33 +183,37 @@ if d > 0: lowerLidRegenThreshold = 0.5 / math.sqrt(d)
 
 # Generate initial iris mesh; vertex elements will get replaced on
 # a per-frame basis in the main loop, this just sets up textures, etc.
-iris = meshInit(32, 4, True, 0, 0.5/irisMap.iy, False)
+iris = DynamicMesh(32, 4, True, 0, 0.5/irisMap.iy, False)
 iris.set_textures([irisMap])
 iris.set_shader(shader)
 irisZ = zangle(irisPts, eyeRadius)[0] * 0.99 # Get iris Z depth, for later
 
+# Optional table of iris meshes (see meshcache.py) at the regen threshold
+# resolution; pupil changes then just select and upload a prebuilt array.
+if IRIS_CACHE:
+	irisCache = IrisMeshCache(pupilMinPts, pupilMaxPts, irisPts, 4, -irisZ,
+	  irisRegenThreshold)
+else:
+	irisCache = None
+
 # Eyelid meshes are likewise temporary; texture coordinates are
 # assigned here but geometry is dynamically regenerated in main loop.
-upperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
+upperEyelid = DynamicMesh(33, 5, False, 0, 0.5/lidMap.iy, True)
 upperEyelid.set_textures([lidMap])
 upperEyelid.set_shader(shader)
-lowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
+lowerEyelid = DynamicMesh(33, 5, False, 0, 0.5/lidMap.iy, True)
 lowerEyelid.set_textures([lidMap])
 lowerEyelid.set_shader(shader)
 
 # Generate sclera for eye...start with a 2D shape for lathing...
 angle1 = zangle(scleraFrontPts, eyeRadius)[1] # Sclera front angle
 angle2 = zangle(scleraBackPts , eyeRadius)[1] # " back angle
-aRange = 180 - angle1 - angle2
-pts    = []
-for i in range(24):
-	ca, sa = pi3d.Utility.from_polar((90 - angle1) - aRange * i / 23)
-	pts.append((ca * eyeRadius, sa * eyeRadius))
+pts    = scleraPoints(angle1, angle2, eyeRadius, 24)
 
-eye = pi3d.Lathe(path=pts, sides=64)
+# ...lathed directly in its final Z-symmetric orientation (see gfxutil)
+eye = latheInit(latheArrays(pts, 64), 0.0)
 eye.set_textures([scleraMap])
 eye.set_shader(shader)
-reAxis(eye, 0.0)
 
 
 # Init global stuff --------------------------------------------------------
@@ -237,7 +242,20 @@ upperEyelid.positionZ(-eyeRadius - 42)
 lowerEyelid.positionX(0.0)
 lowerEyelid.positionZ(-eyeRadius - 42)
 
+# Holds frame rate to what fbx2 will actually copy (see pacing.py)
+pacer = FrameScheduler(-1 if inputLog.replaying else FRAME_RATE)
+
+# Optional batched drawing (see batch.py): one gaze matrix shared by iris
+# and sclera.
+if BATCH_DRAW:
+	eyeBatch = EyeBatch()
+	eyeIndex = eyeBatch.addEye([iris, eye])
+	eyeBatch.addFixed([upperEyelid, lowerEyelid])
+else:
+	eyeBatch = None
+
 currentPupilScale  =  0.5
+pupilSchedule      = PupilSchedule(seed=random.getrandbits(32)) # Auto
 prevPupilScale     = -1.0 # Force regen on first frame
 prevUpperLidWeight = 0.5
 prevLowerLidWeight = 0.5
@@ -278,10 +296,12 @@ def frame(p):
 	global blinkStartTime
 	global trackingPos
 
-	DISPLAY.loop_running()
+	pacer.swap(DISPLAY.loop_running)
+	pacer.wait()
 
-	now = time.time()
+	now = inputLog.read(LOG_CLOCK, time.time)
 	dt  = now - startTime
+	btn = inputLog.read(LOG_BUTTONS, lambda: buttons.snapshot(now))
 
 	frames += 1
 #	if(now > beginningTime):
@@ -289,8 +309,9 @@ def frame(p):
 
 	if JOYSTICK_X_IN >= 0 and JOYSTICK_Y_IN >= 0:
 		# Eye position from analog inputs
-		curX = adcValue[JOYSTICK_X_IN]
-		curY = adcValue[JOYSTICK_Y_IN]
+		adcIn = inputLog.read(LOG_ADC, lambda: adcValue)
+		curX  = adcIn[JOYSTICK_X_IN]
+		curY  = adcIn[JOYSTICK_Y_IN]
 		if JOYSTICK_X_FLIP: curX = 1.0 - curX
 		if JOYSTICK_Y_FLIP: curY = 1.0 - curY
 		curX = -30.0 + curX * 60.0
@@ -327,11 +348,15 @@ def frame(p):
 
 	# Regenerate iris geometry only if size changed by >= 1/2 pixel
 	if abs(p - prevPupilScale) >= irisRegenThreshold:
-		# Interpolate points between min and max pupil sizes
-		interPupil = pointsInterp(pupilMinPts, pupilMaxPts, p)
-		# Generate mesh between interpolated pupil and iris bounds
-		mesh = pointsMesh(None, interPupil, irisPts, 4, -irisZ, True)
-		iris.re_init(pts=mesh)
+		if irisCache:
+			# Prebuilt mesh; None if same as what's already loaded
+			mesh = irisCache.mesh(p)
+		else:
+			# Interpolate points between min and max pupil sizes
+			interPupil = pointsInterp(pupilMinPts, pupilMaxPts, p)
+			# Generate mesh between interpolated pupil and iris bounds
+			mesh = pointsMesh(None, interPupil, irisPts, 4, -irisZ, True)
+		if mesh is not None: iris.update(mesh)
 		prevPupilScale = p
 
 	# Eyelid WIP
@@ -351,8 +376,7 @@ def frame(p):
 		if (now - blinkStartTime) >= blinkDuration:
 			# Yes...increment blink state, unless...
 			if (blinkState == 1 and # Enblinking and...
-			    (BLINK_PIN >= 0 and    # blink pin held
-			     GPIO.input(BLINK_PIN) == GPIO.LOW)):
+			    btn.isHeld(0)):     # blink button held
 				# Don't advance yet; eye is held closed
 				pass
 			else:
@@ -363,7 +387,7 @@ def frame(p):
 					blinkDuration *= 2.0
 					blinkStartTime = now
 	else:
-		if BLINK_PIN >= 0 and GPIO.input(BLINK_PIN) == GPIO.LOW:
+		if btn.down(0): # Held, or tapped since last frame
 			blinkState     = 1 # ENBLINK
 			blinkStartTime = now
 			blinkDuration  = random.uniform(0.035, 0.06)
@@ -389,11 +413,11 @@ def frame(p):
 		newUpperLidPts = pointsInterp(upperLidOpenPts,
 		  upperLidClosedPts, newUpperLidWeight)
 		if newUpperLidWeight > prevUpperLidWeight:
-			upperEyelid.re_init(pts=pointsMesh(
+			upperEyelid.update(pointsMesh(
 			  upperLidEdgePts, prevUpperLidPts,
 			  newUpperLidPts, 5, 0, False, True))
 		else:
-			upperEyelid.re_init(pts=pointsMesh(
+			upperEyelid.update(pointsMesh(
 			  upperLidEdgePts, newUpperLidPts,
 			  prevUpperLidPts, 5, 0, False, True))
 		prevUpperLidWeight = newUpperLidWeight
@@ -407,11 +431,11 @@ def frame(p):
 		newLowerLidPts = pointsInterp(lowerLidOpenPts,
 		  lowerLidClosedPts, newLowerLidWeight)
 		if newLowerLidWeight > prevLowerLidWeight:
-			lowerEyelid.re_init(pts=pointsMesh(
+			lowerEyelid.update(pointsMesh(
 			  lowerLidEdgePts, prevLowerLidPts,
 			  newLowerLidPts, 5, 0, False, True))
 		else:
-			lowerEyelid.re_init(pts=pointsMesh(
+			lowerEyelid.update(pointsMesh(
 			  lowerLidEdgePts, newLowerLidPts,
 			  prevLowerLidPts, 5, 0, False, True))
 		prevLowerLidWeight = newLowerLidWeight
@@ -422,44 +446,40 @@ def frame(p):
 
 	# Draw eye
 
-	iris.rotateToX(curY)
-	iris.rotateToY(curX)
-	iris.draw()
-	eye.rotateToX(curY)
-	eye.rotateToY(curX)
-	eye.draw()
-        upperEyelid.draw()
-        lowerEyelid.draw()
+	if eyeBatch:
+		eyeBatch.gaze(eyeIndex, curY, curX)
+		eyeBatch.draw()
+	else:
+		iris.rotateToX(curY)
+		iris.rotateToY(curX)
+		iris.draw()
+		eye.rotateToX(curY)
+		eye.rotateToY(curX)
+		eye.draw()
+		upperEyelid.draw()
+		lowerEyelid.draw()
 
 	k = mykeys.read()
-	if k==27:
-		mykeys.close()
-		DISPLAY.stop()
-		exit(0)
-
-
-def split( # Recursive simulated pupil response when no analog sensor
-  startValue, # Pupil scale starting value (0.0 to 1.0)
-  endValue,   # Pupil scale ending value (")
-  duration,   # Start-to-end time, floating-point seconds
-  range):     # +/- random pupil scale at midpoint
-	startTime = time.time()
-	if range >= 0.125: # Limit subdvision count, because recursion
-		duration *= 0.5 # Split time & range in half for subdivision,
-		range    *= 0.5 # then pick random center point within range:
-		midValue  = ((startValue + endValue - range) * 0.5 +
-		             random.uniform(0.0, range))
-		split(startValue, midValue, duration, range)
-		split(midValue  , endValue, duration, range)
-	else: # No more subdivisons, do iris motion...
-		dv = endValue - startValue
-		while True:
-			dt = time.time() - startTime
-			if dt >= duration: break
-			v = startValue + dv * dt / duration
-			if   v < PUPIL_MIN: v = PUPIL_MIN
-			elif v > PUPIL_MAX: v = PUPIL_MAX
-			frame(v) # Draw frame w/interim pupil scale value
+	if k==27: shutdown()
+
+
+# Print stats and exit (Esc, or the end of a replay)
+def shutdown():
+	buttons.close()
+	print "buttons: %s" % buttons.stats()
+	if irisCache:
+		print "iris cache: %s" % irisCache.stats()
+	if eyeBatch:
+		print "draw batch: %s" % eyeBatch.stats()
+	print "frame pacing: %s" % pacer.stats()
+	if RECORD or inputLog.replaying:
+		inputLog.close()
+		print "input log: %s" % inputLog.stats()
+	mykeys.close()
+	DISPLAY.stop()
+	exit(0)
+
+inputLog.atEnd = shutdown
 
 
 # MAIN LOOP -- runs continuously -------------------------------------------
@@ -467,7 +487,7 @@ def split( # Recursive simulated pupil response when no analog sensor
 while True:
 
 	if PUPIL_IN >= 0: # Pupil scale from sensor
-		v = adcValue[PUPIL_IN]
+		v = inputLog.read(LOG_ADC, lambda: adcValue)[PUPIL_IN]
 		if PUPIL_IN_FLIP: v = 1.0 - v
 		# If you need to calibrate PUPIL_MIN and MAX,
 		# add a 'print v' here for testing.
@@ -479,7 +499,10 @@ while True:
 			v = ((currentPupilScale * (PUPIL_SMOOTH - 1) + v) /
 			     PUPIL_SMOOTH)
 		frame(v)
-	else: # Fractal auto pupil scale
-		v = random.random()
-		split(currentPupilScale, v, 4.0, 1.0)
+	else: # Fractal auto pupil scale (see eyestate.py)
+		v = pupilSchedule.sample(inputLog.read(LOG_CLOCK, time.time),
+		  currentPupilScale)
+		if   v < PUPIL_MIN: v = PUPIL_MIN
+		elif v > PUPIL_MAX: v = PUPIL_MAX
+		frame(v)
 	currentPupilScale = v
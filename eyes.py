@@ -1,8 +1,8 @@
 #!/usr/bin/python
 
-# This is a hasty port of the Teensy eyes code to Python...all kludgey with
-# an embarrassing number of globals in the frame() function and stuff.
-# Needed to get SOMETHING working, can focus on improvements next.
+# This is a hasty port of the Teensy eyes code to Python...all kludgey
+# in places.  Animation state now lives in eyestate.py; frame() gathers
+# inputs, steps that state and draws the result.
 
 # With added UART input hackery -chrisy
 
@@ -13,9 +13,23 @@ import random
 import threading
 import time
 import RPi.GPIO as GPIO
-from svg.path import Path, parse_path
-from xml.dom.minidom import parse
+from batch import *
+from eyestate import *
+from frametrace import tracer
+from pacing import *
+from predict import *
+from replay import (openLog, LOG_CLOCK, LOG_CAMERA, LOG_TRACKS, LOG_ADC,
+                    LOG_BUTTONS, LOG_SYNC, LOG_LOD)
+from adcsched import AdcScheduler
+from shmbox import Mailbox
+from gazesync import *
+from gpioinput import ButtonInput
 from gfxutil import *
+from geomcache import *
+from keyframe import *
+from lod import *
+from meshcache import *
+from texbundle import *
 import io
 import subprocess
 
@@ -37,8 +51,27 @@ BLINK_PIN       = 18    # GPIO pin for blink button (BOTH eyes)
 WINK_R_PIN      = 27    # GPIO pin for RIGHT eye wink button
 AUTOBLINK       = True  # If True, eyes blink autonomously
 STEER_PIN       = 17    # Hold down to steer with joystick
-
-UART_BIN        = "./uart.py"
+LID_CACHE_MB    = 0     # If > 0, cache eyelid meshes up to this many MB
+LID_CACHE_SPAN  = 4     # Weight steps apart to prebuild at startup
+IRIS_CACHE      = False # If True, prebuild iris meshes for all pupil sizes
+GPU_DEFORM      = False # If True, blend lids & pupils in vertex shader
+BATCH_DRAW      = False # If True, draw both eyes via batch.py
+SYNC_MODE       = None  # "send"/"recv" to lead/follow other units' gaze
+TRACE_SIGNAL    = True  # If True, SIGUSR1 starts/stops frame tracing
+FRAME_RATE      = 0     # Target frames/sec (0 = match fbx2, -1 = unpaced)
+LOD             = False # If True, pick mesh detail by eye size & board
+PREDICT         = False # If True, lead camera target by its latency
+MAILBOX         = False # If True, sensor threads hand over via shmbox.py
+PREDICT_ALPHA   = 0.6   # Target tracker gains (see predict.py)
+PREDICT_BETA    = 0.2
+PREDICT_EXTRA   = 0.0   # Further latency to compensate, seconds
+ADC_RATE        = 60    # Samples/sec for each analog input used
+ADC_FILTER      = None  # Smoothing for them, e.g. ("ema", 0.5) (smoothing.py)
+RECORD          = None  # Path to log all inputs to, for replay.py
+
+UART_MODE       = "process" # Camera: "process" (UART_BIN) or "thread"
+UART_BIN        = "./uart.py" # (uartingest.py in-process); None = off
+CACHE_DIR       = "cache" # Compiled geometry & textures (None = disable)
 
 # Set of graphics we know about
 
@@ -66,6 +99,22 @@ graphics = {
 # choose the graphic set
 eyegfx = "cat"
 
+# Frame tracing (see frametrace.py): 'kill -USR1 <pid>' to start, again to
+# stop and write trace-<pid>-<n>.json for chrome://tracing or Perfetto.
+if TRACE_SIGNAL:
+    tracer.installSignal()
+
+# Input log (see replay.py): every outside input frame() reads is taken
+# through it, to be recorded or, under replay.py, played back.  Random
+# seeds come from it too, so a replay makes all the same choices.
+inputLog = openLog(RECORD)
+random.seed(inputLog.seed())
+
+# Sensor mailbox (see shmbox.py): the camera and ADC threads publish their
+# readings to shared memory, and frame() reads consistent snapshots of
+# them without taking a lock.
+mailbox = Mailbox(writes=("camera", "adc")) if MAILBOX else None
+
 # UART initialization ------------------------------------------------------
 
 class uartThread(threading.Thread):
@@ -74,11 +123,15 @@ class uartThread(threading.Thread):
     lock = None
     targets = None
     lux = None
+    fps = None
+    stamp = None
+    tracks = ()
 
-    def __init__(self, uart):
+    def __init__(self, uart, mailbox=None):
         super(uartThread, self).__init__()
         self.uart = uart
         self.lock = threading.Lock()
+        self.mailbox = mailbox
         self.running = True
 
     def run(self):
@@ -96,35 +149,69 @@ class uartThread(threading.Thread):
             if ',' not in line:
                 continue
 
-            x, y, lux, fps = line.rstrip().split(',')
+            with tracer.span("uart"):
+                fields = line.rstrip().split(',')
+                x, y, lux, fps = fields[:4]
 
-            if x == "None" or y == "None":
-                t = None
-            else:
-                t = (float(x), float(y))
-
-            lux = float(lux)
-            fps = float(fps)
-
-            if t:
-                print "new x:%1.1f y:%1.1f lux:%1.1f fps:%1.1f\r" % (
-                    t[0], t[1], lux, fps)
+                if x == "None" or y == "None":
+                    t = None
+                else:
+                    t = (float(x), float(y))
+
+                lux = float(lux)
+                fps = float(fps)
+
+                # Every confirmed track, as uartingest.py gives them (an
+                # older uart.py sends none)
+                tracks = ()
+                if len(fields) > 4 and fields[4]:
+                    tracks = tuple((int(i), float(tx), float(ty), float(ts))
+                                   for i, tx, ty, ts in
+                                   (tr.split(':')
+                                    for tr in fields[4].split(';')))
+
+                if t:
+                    print "new x:%1.1f y:%1.1f lux:%1.1f fps:%1.1f\r" % (
+                        t[0], t[1], lux, fps)
+
+                now = time.time()
+                with self.lock:
+                    self.targets = t
+                    self.tracks = tracks
+                    self.lux = lux
+                    self.fps = fps
+                    self.stamp = now
+                if self.mailbox:
+                    self.mailbox.publish("camera", (1.0,) + t + (lux, fps)
+                      if t else (0.0, 0.0, 0.0, lux, fps), now)
 
-            with self.lock:
-                self.targets = t
-                self.lux = lux
+        with self.lock:
+            if self.uart:
+                self.uart.kill()
+                self.uart = None
 
+    def stop(self):
+        self.running = False
         with self.lock:
             if self.uart:
                 self.uart.kill()
                 self.uart = None
 
+    def stats(self):
+        return "subprocess %s" % UART_BIN
+
 
-if UART_BIN:
+if UART_MODE == "thread":
+    # Read the serial port in this process (see uartingest.py)
+    from uartingest import UartIngest
+    uart_thread = UartIngest(mailbox=mailbox)
+    uart_thread.daemon = True
+    uart_thread.start()
+elif UART_MODE == "process" and UART_BIN:
     # Open a pipe for the uart process
     uart = subprocess.Popen([UART_BIN], stdout=subprocess.PIPE, close_fds=True, bufsize=1, universal_newlines=True)
 
-    uart_thread = uartThread(uart)
+    uart_thread = uartThread(uart, mailbox)
     uart_thread.daemon = True
     uart_thread.start()
 
@@ -136,70 +223,64 @@ else:
 # GPIO initialization ------------------------------------------------------
 
 GPIO.setmode(GPIO.BCM)
-if WINK_L_PIN >= 0: GPIO.setup(WINK_L_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-if BLINK_PIN  >= 0: GPIO.setup(BLINK_PIN , GPIO.IN, pull_up_down=GPIO.PUD_UP)
-if WINK_R_PIN >= 0: GPIO.setup(WINK_R_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-if STEER_PIN >= 0:  GPIO.setup(STEER_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# Buttons are edge-triggered (see gpioinput.py); frame() takes a snapshot
+BLINK_BTN, WINK_L_BTN, WINK_R_BTN, STEER_BTN = range(4)
+buttons = ButtonInput(GPIO, (BLINK_PIN, WINK_L_PIN, WINK_R_PIN, STEER_PIN))
 
 
 # ADC stuff ----------------------------------------------------------------
 
-if JOYSTICK_X_IN >= 0 or JOYSTICK_Y_IN >= 0 or PUPIL_IN >= 0:
-    adc      = Adafruit_ADS1x15.ADS1015()
-    adcValue = [0] * 4
-else:
-    adc = None
-
-# Because ADC reads are blocking operations, they normally would slow down
-# the animation loop noticably, especially when reading multiple channels
-# (even when using high data rate settings).  To avoid this, ADC channels
-# are read in a separate thread and stored in the global list adcValue[],
-# which the animation loop can read at its leisure (with immediate results,
-# no slowdown).  Since there's a finite limit to the animation frame rate,
-# we intentionally use a slower data rate (rather than sleep()) to lessen
-# the impact of this thread.  data_rate of 250 w/4 ADC channels provides
-# at most 75 Hz update from the ADC, which is plenty for this task.
-class adcThread(threading.Thread):
-    def __init__(self, adc, dest):
-        super(adcThread, self).__init__()
-        self.adc = adc
-        self.dest = dest
-        self.running = True
-
-    def run(self):
-        while self.running:
-            for i in range(len(self.dest)):
-                # ADC input range is +- 4.096V
-                # ADC output is -2048 to +2047
-                # Analog inputs will be 0 to ~3.3V,
-                # thus 0 to 1649-ish.  Read & clip:
-                n = self.adc.read_adc(i, gain=1, data_rate=250)
-                if   n <    0: n =    0
-                elif n > 1649: n = 1649
-                self.dest[i] = n / 1649.0 # Store as 0.0 to 1.0
-
-# Start ADC sampling thread if needed:
-if adc:
-    adc_thread = adcThread(adc, adcValue)
+# Only the inputs in use are sampled, each at ADC_RATE, in a thread of
+# its own so blocking ADC reads don't slow the animation loop; values go
+# to the global list adcValue[] (and the mailbox) as 0.0 to 1.0.  With a
+# single input the ADC converts continuously and is just read back.  See
+# adcsched.py.
+adcChannels = [c for c in (JOYSTICK_X_IN, JOYSTICK_Y_IN, PUPIL_IN) if c >= 0]
+if adcChannels:
+    adc        = Adafruit_ADS1x15.ADS1015()
+    adcValue   = [0] * 4
+    adc_thread = AdcScheduler(adc, dict((c, ADC_RATE) for c in adcChannels),
+                              dict((c, ADC_FILTER) for c in adcChannels),
+                              adcValue, mailbox)
     adc_thread.daemon = True
     adc_thread.start()
-
-
-# Load SVG file, extract paths & convert to point lists --------------------
-
-dom               = parse(graphics[eyegfx]["dom"])
-vb                = getViewBox(dom)
-pupilMinPts       = getPoints(dom, "pupilMin"      , 32, True , True )
-pupilMaxPts       = getPoints(dom, "pupilMax"      , 32, True , True )
-irisPts           = getPoints(dom, "iris"          , 32, True , True )
-scleraFrontPts    = getPoints(dom, "scleraFront"   ,  0, False, False)
-scleraBackPts     = getPoints(dom, "scleraBack"    ,  0, False, False)
-upperLidClosedPts = getPoints(dom, "upperLidClosed", 33, False, True )
-upperLidOpenPts   = getPoints(dom, "upperLidOpen"  , 33, False, True )
-upperLidEdgePts   = getPoints(dom, "upperLidEdge"  , 33, False, False)
-lowerLidClosedPts = getPoints(dom, "lowerLidClosed", 33, False, False)
-lowerLidOpenPts   = getPoints(dom, "lowerLidOpen"  , 33, False, False)
-lowerLidEdgePts   = getPoints(dom, "lowerLidEdge"  , 33, False, False)
+else:
+    adc        = None
+    adc_thread = None
+
+
+# Latest camera reading as (target or None, arrival time, camera fps, lux)
+# and ADC channels, from the mailbox if there is one, else from the
+# reader threads
+def readCamera():
+    if mailbox:
+        s = mailbox.read("camera")
+        if s is None: return None, None, None, None
+        has, x, y, lux, fps = s.values
+        return ((x, y) if has else None), s.stamp, fps, lux
+    with uart_thread.lock:
+        return (uart_thread.targets, uart_thread.stamp, uart_thread.fps,
+                uart_thread.lux)
+
+def readAdc():
+    s = mailbox.read("adc") if mailbox else None
+    return s.values if s else adcValue
+
+def cameraInput(): return inputLog.read(LOG_CAMERA, readCamera)
+def adcInput(): return inputLog.read(LOG_ADC, readAdc)
+
+
+# Gaze sync between units (see gazesync.py).  A sender multicasts its
+# gaze, pupil and eyelid state; receivers render that in place of their
+# own (falling back to it if the sender goes quiet).
+syncSender   = None
+syncReceiver = None
+if SYNC_MODE == "send":
+    syncSender = GazeSender()
+elif SYNC_MODE == "recv":
+    syncReceiver = GazeReceiver()
+    syncReceiver.daemon = True
+    syncReceiver.start()
 
 
 # Set up display and initialize pi3d ---------------------------------------
@@ -230,11 +311,19 @@ light  = pi3d.Light(lightpos=(0, -500, -500), lightamb=(0.2, 0.2, 0.2))
 
 # Load texture maps --------------------------------------------------------
 
-irisMap   = pi3d.Texture(graphics[eyegfx]["iris"], mipmap=False,
+# With a cache dir, maps come from a bundle of pixels already decoded and
+# sized for eyeRadius (built on first run for this graphics set, see
+# texbundle.py), else straight from the image files.
+if CACHE_DIR:
+    maps = bundleTextures(eyegfx, graphics[eyegfx], eyeRadius, CACHE_DIR)
+else:
+    maps = graphics[eyegfx]
+
+irisMap   = pi3d.Texture(maps["iris"], mipmap=False,
         filter=pi3d.GL_LINEAR)
-scleraMap = pi3d.Texture(graphics[eyegfx]["sclera"], mipmap=False,
+scleraMap = pi3d.Texture(maps["sclera"], mipmap=False,
         filter=pi3d.GL_LINEAR, blend=True)
-lidMap    = pi3d.Texture(graphics[eyegfx]["lid"], mipmap=False,
+lidMap    = pi3d.Texture(maps["lid"], mipmap=False,
         filter=pi3d.GL_LINEAR, blend=True)
 # U/V map may be useful for debugging texture placement; not normally used
 #uvMap     = pi3d.Texture("graphics/uv.png"    , mipmap=False,
@@ -243,507 +332,454 @@ lidMap    = pi3d.Texture(graphics[eyegfx]["lid"], mipmap=False,
 
 # Initialize static geometry -----------------------------------------------
 
-# Transform point lists to eye dimensions
-scalePoints(pupilMinPts      , vb, eyeRadius)
-scalePoints(pupilMaxPts      , vb, eyeRadius)
-scalePoints(irisPts          , vb, eyeRadius)
-scalePoints(scleraFrontPts   , vb, eyeRadius)
-scalePoints(scleraBackPts    , vb, eyeRadius)
-scalePoints(upperLidClosedPts, vb, eyeRadius)
-scalePoints(upperLidOpenPts  , vb, eyeRadius)
-scalePoints(upperLidEdgePts  , vb, eyeRadius)
-scalePoints(lowerLidClosedPts, vb, eyeRadius)
-scalePoints(lowerLidOpenPts  , vb, eyeRadius)
-scalePoints(lowerLidEdgePts  , vb, eyeRadius)
-
-# Regenerating flexible object geometry (such as eyelids during blinks, or
-# iris during pupil dilation) is CPU intensive, can noticably slow things
-# down, especially on single-core boards.  To reduce this load somewhat,
-# determine a size change threshold below which regeneration will not occur;
-# roughly equal to 1/4 pixel, since 4x4 area sampling is used.
-
-# Determine change in pupil size to trigger iris geometry regen
-irisRegenThreshold = 0.0
-a = pointsBounds(pupilMinPts) # Bounds of pupil at min size (in pixels)
-b = pointsBounds(pupilMaxPts) # " at max size
-maxDist = max(abs(a[0] - b[0]), abs(a[1] - b[1]), # Determine distance of max
-          abs(a[2] - b[2]), abs(a[3] - b[3])) # variance around each edge
-# maxDist is motion range in pixels as pupil scales between 0.0 and 1.0.
-# 1.0 / maxDist is one pixel's worth of scale range.  Need 1/4 that...
-if maxDist > 0: irisRegenThreshold = 0.25 / maxDist
-
-# Determine change in eyelid values needed to trigger geometry regen.
-# This is done a little differently than the pupils...instead of bounds,
-# the distance between the middle points of the open and closed eyelid
-# paths is evaluated, then similar 1/4 pixel threshold is determined.
-upperLidRegenThreshold = 0.0
-lowerLidRegenThreshold = 0.0
-p1 = upperLidOpenPts[len(upperLidOpenPts) / 2]
-p2 = upperLidClosedPts[len(upperLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: upperLidRegenThreshold = 0.25 / math.sqrt(d)
-p1 = lowerLidOpenPts[len(lowerLidOpenPts) / 2]
-p2 = lowerLidClosedPts[len(lowerLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: lowerLidRegenThreshold = 0.25 / math.sqrt(d)
-
-# Generate initial iris meshes; vertex elements will get replaced on
-# a per-frame basis in the main loop, this just sets up textures, etc.
-rightIris = meshInit(32, 4, True, 0, 0.5/irisMap.iy, False)
-rightIris.set_textures([irisMap])
-rightIris.set_shader(shader)
-# Left iris map U value is offset by 0.5; effectively a 180 degree
-# rotation, so it's less obvious that the same texture is in use on both.
-leftIris = meshInit(32, 4, True, 0.5, 0.5/irisMap.iy, False)
-leftIris.set_textures([irisMap])
-leftIris.set_shader(shader)
-irisZ = zangle(irisPts, eyeRadius)[0] * 0.99 # Get iris Z depth, for later
-
-# Eyelid meshes are likewise temporary; texture coordinates are
-# assigned here but geometry is dynamically regenerated in main loop.
-leftUpperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-leftUpperEyelid.set_textures([lidMap])
-leftUpperEyelid.set_shader(shader)
-leftLowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-leftLowerEyelid.set_textures([lidMap])
-leftLowerEyelid.set_shader(shader)
-
-rightUpperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-rightUpperEyelid.set_textures([lidMap])
-rightUpperEyelid.set_shader(shader)
-rightLowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-rightLowerEyelid.set_textures([lidMap])
-rightLowerEyelid.set_shader(shader)
-
-# Generate scleras for each eye...start with a 2D shape for lathing...
-angle1 = zangle(scleraFrontPts, eyeRadius)[1] # Sclera front angle
-angle2 = zangle(scleraBackPts , eyeRadius)[1] # " back angle
-aRange = 180 - angle1 - angle2
-pts    = []
-for i in range(24):
-    ca, sa = pi3d.Utility.from_polar((90 - angle1) - aRange * i / 23)
-    pts.append((ca * eyeRadius, sa * eyeRadius))
-
-# Scleras are generated independently (object isn't re-used) so each
-# may have a different image map (heterochromia, corneal scar, or the
-# same image map can be offset on one so the repetition isn't obvious).
-leftEye = pi3d.Lathe(path=pts, sides=64)
-leftEye.set_textures([scleraMap])
-leftEye.set_shader(shader)
-reAxis(leftEye, 0)
-rightEye = pi3d.Lathe(path=pts, sides=64)
-rightEye.set_textures([scleraMap])
-rightEye.set_shader(shader)
-reAxis(rightEye, 0.5) # Image map offset = 180 degree rotation
+# Load SVG file, extract paths & convert to point lists scaled to eye
+# dimensions, along with regen thresholds of roughly 1/4 pixel (since 4x4
+# area sampling is used) and Z depths.  After the first run this all comes
+# from a compiled file in CACHE_DIR; see geomcache.py.  Point lists
+# are NumPy arrays so eyelid and iris regen in frame() take the vectorized
+# paths in gfxutil.
+geom = loadGeometry(graphics[eyegfx]["dom"], eyeRadius, 0.25, CACHE_DIR)
+pupilMinPts       = geom["pupilMin"]
+pupilMaxPts       = geom["pupilMax"]
+irisPts           = geom["iris"]
+upperLidClosedPts = geom["upperLidClosed"]
+upperLidOpenPts   = geom["upperLidOpen"]
+upperLidEdgePts   = geom["upperLidEdge"]
+lowerLidClosedPts = geom["lowerLidClosed"]
+lowerLidOpenPts   = geom["lowerLidOpen"]
+lowerLidEdgePts   = geom["lowerLidEdge"]
+
+irisRegenThreshold     = geom["irisRegenThreshold"]
+upperLidRegenThreshold = geom["upperLidRegenThreshold"]
+lowerLidRegenThreshold = geom["lowerLidRegenThreshold"]
+
+irisZ = geom["irisZangle"][0] * 0.99 # Get iris Z depth, for later
+
+# Sclera profile angles, for lathing scleras at any level of detail
+scleraAngle1 = geom["scleraFrontZangle"][1] # Sclera front angle
+scleraAngle2 = geom["scleraBackZangle"][1]  # " back angle
+
+# Keyframed meshes (GPU_DEFORM) have their own shader
+meshShader = keyframeShader() if GPU_DEFORM else shader
+
+# Mesh resolution (see lod.py): from eye size and a quick benchmark of
+# this board (saved in CACHE_DIR, so only on first run), else full detail.
+lodFps = FRAME_RATE if FRAME_RATE > 0 else fbx2Fps()
+if LOD:
+    lodControl = LodController(chooseLevel(geom, eyeRadius, lodFps,
+      CACHE_DIR), lodFps)
+    lodLevel   = lodControl.level
+else:
+    lodControl = None
+    lodLevel   = 0
+
+
+# Iris, eyelid and sclera meshes, their mesh tables and the draw batch, at
+# one level of detail.  build() replaces the lot, as when the level
+# changes at runtime; geometry is the full-resolution point lists above
+# thinned to the level's resolution.
+class EyeMeshes(object):
+
+    def __init__(self, level):
+        self.build(level, True)
+
+    def build(self, level, prebuild=False):
+        lod = LOD_LEVELS[level]
+        n   = lod.pointStep
+        self.level       = level
+        self.lidSteps    = lod.lidSteps
+        self.irisSteps   = lod.irisSteps
+        self.pupilMinPts = decimate(pupilMinPts, n)
+        self.pupilMaxPts = decimate(pupilMaxPts, n)
+        self.irisPts     = decimate(irisPts, n)
+        upperOpenPts     = decimate(upperLidOpenPts, n)
+        upperClosedPts   = decimate(upperLidClosedPts, n)
+        upperEdgePts     = decimate(upperLidEdgePts, n)
+        lowerOpenPts     = decimate(lowerLidOpenPts, n)
+        lowerClosedPts   = decimate(lowerLidClosedPts, n)
+        lowerEdgePts     = decimate(lowerLidEdgePts, n)
+        irisCols         = len(self.irisPts) - 1 # Closed, ends repeat
+        upperCols        = len(upperOpenPts)
+        lowerCols        = len(lowerOpenPts)
+        irisV            = 0.5 / irisMap.iy
+        lidV             = 0.5 / lidMap.iy
+
+        # Generate initial iris meshes; vertex elements will get replaced
+        # on a per-frame basis in the main loop, this just sets up
+        # textures, etc.  With GPU_DEFORM, geometry is instead fixed here
+        # as a pair of keyframes blended by the vertex shader (see
+        # keyframe.py), no regen in main loop.
+        if GPU_DEFORM:
+            irisKf = irisKeyframes(self.pupilMinPts, self.pupilMaxPts,
+              self.irisPts, lod.irisSteps, -irisZ)
+            self.rightIris = KeyframeMesh(irisKf, irisCols, lod.irisSteps,
+              True, 0, irisV, False)
+            self.leftIris  = KeyframeMesh(irisKf, irisCols, lod.irisSteps,
+              True, 0.5, irisV, False)
+        else:
+            self.rightIris = DynamicMesh(irisCols, lod.irisSteps, True, 0,
+              irisV, False)
+            self.leftIris  = DynamicMesh(irisCols, lod.irisSteps, True, 0.5,
+              irisV, False)
+        self.rightIris.set_textures([irisMap])
+        self.rightIris.set_shader(meshShader)
+        # Left iris map U value is offset by 0.5; effectively a 180 degree
+        # rotation, so it's less obvious that the same texture is in use on
+        # both.
+        self.leftIris.set_textures([irisMap])
+        self.leftIris.set_shader(meshShader)
+
+        # Optional table of iris meshes (see meshcache.py) at the regen
+        # threshold resolution; pupil changes then just select and upload
+        # a prebuilt array.
+        if IRIS_CACHE and not GPU_DEFORM:
+            self.irisCache = IrisMeshCache(self.pupilMinPts,
+              self.pupilMaxPts, self.irisPts, lod.irisSteps, -irisZ,
+              irisRegenThreshold)
+        else:
+            self.irisCache = None
+
+        # Eyelid meshes are likewise temporary; texture coordinates are
+        # assigned here but geometry is dynamically regenerated in main
+        # loop.  Right eye keyframes are mirrored, as pointsMesh(flip=True)
+        # does.
+        if GPU_DEFORM:
+            leftUpper  = KeyframeMesh(lidKeyframes(upperOpenPts,
+              upperClosedPts, upperEdgePts, lod.lidSteps), upperCols,
+              lod.lidSteps, False, 0, lidV, True)
+            leftLower  = KeyframeMesh(lidKeyframes(lowerOpenPts,
+              lowerClosedPts, lowerEdgePts, lod.lidSteps), lowerCols,
+              lod.lidSteps, False, 0, lidV, True)
+            rightUpper = KeyframeMesh(lidKeyframes(upperOpenPts,
+              upperClosedPts, upperEdgePts, lod.lidSteps, True), upperCols,
+              lod.lidSteps, False, 0, lidV, True)
+            rightLower = KeyframeMesh(lidKeyframes(lowerOpenPts,
+              lowerClosedPts, lowerEdgePts, lod.lidSteps, True), lowerCols,
+              lod.lidSteps, False, 0, lidV, True)
+        else:
+            leftUpper  = DynamicMesh(upperCols, lod.lidSteps, False, 0, lidV,
+              True)
+            leftLower  = DynamicMesh(lowerCols, lod.lidSteps, False, 0, lidV,
+              True)
+            rightUpper = DynamicMesh(upperCols, lod.lidSteps, False, 0, lidV,
+              True)
+            rightLower = DynamicMesh(lowerCols, lod.lidSteps, False, 0, lidV,
+              True)
+        for lid in (leftUpper, leftLower, rightUpper, rightLower):
+            lid.set_textures([lidMap])
+            lid.set_shader(meshShader)
+
+        # Optional eyelid mesh tables (see meshcache.py), one per lid type
+        # and shared by both eyes; the right eye uses the mirrored entries.
+        # Weights are quantized to the same 1/4 pixel step as the regen
+        # thresholds.  Prebuilt only at startup; a runtime rebuild needs
+        # to be quick.  LID_CACHE_MB is split evenly between the two
+        # tables.
+        if LID_CACHE_MB > 0 and not GPU_DEFORM:
+            upperCache = LidMeshCache(upperOpenPts, upperClosedPts,
+              upperEdgePts, lod.lidSteps, upperLidRegenThreshold,
+              LID_CACHE_MB * 1048576 // 2)
+            lowerCache = LidMeshCache(lowerOpenPts, lowerClosedPts,
+              lowerEdgePts, lod.lidSteps, lowerLidRegenThreshold,
+              LID_CACHE_MB * 1048576 // 2)
+            if prebuild:
+                upperCache.prebuild(LID_CACHE_SPAN)
+                lowerCache.prebuild(LID_CACHE_SPAN)
+        else:
+            upperCache = None
+            lowerCache = None
+        self.upperLidCache = upperCache
+        self.lowerLidCache = lowerCache
+
+        # Eyelid shapes with what's needed to regenerate each, in
+        # eyestate.py's lid order (left upper, left lower, right upper,
+        # right lower).
+        self.eyelids = (
+          (leftUpper , upperCache, upperOpenPts, upperClosedPts,
+           upperEdgePts, False),
+          (leftLower , lowerCache, lowerOpenPts, lowerClosedPts,
+           lowerEdgePts, False),
+          (rightUpper, upperCache, upperOpenPts, upperClosedPts,
+           upperEdgePts, True),
+          (rightLower, lowerCache, lowerOpenPts, lowerClosedPts,
+           lowerEdgePts, True))
+
+        # Generate scleras for each eye...start with a 2D shape for
+        # lathing, lathed directly in its final Z-symmetric orientation
+        # (see gfxutil).
+        pts = scleraPoints(scleraAngle1, scleraAngle2, eyeRadius,
+          lod.scleraPoints)
+        scleraArrays = latheArrays(pts, lod.scleraSides)
+
+        # Scleras are separate objects so each may have a different image
+        # map (heterochromia, corneal scar, or the same image map can be
+        # offset on one so the repetition isn't obvious); geometry arrays
+        # are shared.
+        self.leftEye = latheInit(scleraArrays, 0)
+        self.leftEye.set_textures([scleraMap])
+        self.leftEye.set_shader(shader)
+        # Map offset = 180 degree rotation
+        self.rightEye = latheInit(scleraArrays, 0.5)
+        self.rightEye.set_textures([scleraMap])
+        self.rightEye.set_shader(shader)
+
+        self.rightEye.positionX(-eyePosition)
+        self.rightIris.positionX(-eyePosition)
+        rightUpper.positionX(-eyePosition)
+        rightUpper.positionZ(-eyeRadius - 42)
+        rightLower.positionX(-eyePosition)
+        rightLower.positionZ(-eyeRadius - 42)
+
+        self.leftEye.positionX(eyePosition)
+        self.leftIris.positionX(eyePosition)
+        leftUpper.positionX(eyePosition)
+        leftUpper.positionZ(-eyeRadius - 42)
+        leftLower.positionX(eyePosition)
+        leftLower.positionZ(-eyeRadius - 42)
+
+        # Optional batched drawing (see batch.py): one gaze matrix per eye
+        # shared by its iris and sclera, parts drawn grouped by texture.
+        if BATCH_DRAW:
+            self.batch = EyeBatch()
+            self.rightEyeIndex = self.batch.addEye([self.rightIris,
+              self.rightEye])
+            self.leftEyeIndex  = self.batch.addEye([self.leftIris,
+              self.leftEye])
+            self.batch.addFixed([leftUpper, leftLower, rightUpper,
+              rightLower])
+        else:
+            self.batch = None
+
+    # Regenerate iris geometry for pupil scale p (0.0 to 1.0)
+    def updateIris(self, p):
+        if GPU_DEFORM:
+            # Keyframed irises just need the new weight
+            self.leftIris.setWeights(p, p)
+            self.rightIris.setWeights(p, p)
+            return
+        if self.irisCache:
+            # Prebuilt mesh; None if same as what's already loaded
+            mesh = self.irisCache.mesh(p)
+        else:
+            # Interpolate points between min and max pupil sizes
+            interPupil = pointsInterp(self.pupilMinPts, self.pupilMaxPts, p)
+            # Generate mesh between interpolated pupil and iris bounds
+            mesh = pointsMesh(None, interPupil, self.irisPts,
+              self.irisSteps, -irisZ, True)
+        if mesh is not None:
+            # Assign to both eyes
+            self.leftIris.update(mesh)
+            self.rightIris.update(mesh)
+
+    # Regenerate eyelid i (eyestate.py order) swept between two weights
+    # (either order)
+    def updateLid(self, i, w1, w2):
+        lid, cache, openPts, closedPts, edgePts, flip = self.eyelids[i]
+        if GPU_DEFORM:
+            # Keyframed lids, entirely in the vertex shader
+            lid.setWeights(w1, w2)
+        elif cache:
+            lid.update(cache.mesh(w1, w2, flip))
+        else:
+            if w2 < w1: w1, w2 = w2, w1
+            lid.update(pointsMesh(edgePts,
+              pointsInterp(openPts, closedPts, w1),
+              pointsInterp(openPts, closedPts, w2),
+              self.lidSteps, 0, False, flip))
+
+    def draw(self, curX, curY):
+        convergence = 2.0
+
+        if self.batch:
+            # Right eye (on screen left), left eye (on screen right), lids
+            self.batch.gaze(self.rightEyeIndex, curY, curX - convergence)
+            self.batch.gaze(self.leftEyeIndex, curY, curX + convergence)
+            self.batch.draw()
+            return
+
+        # Right eye (on screen left)
+
+        self.rightIris.rotateToX(curY)
+        self.rightIris.rotateToY(curX - convergence)
+        self.rightIris.draw()
+        self.rightEye.rotateToX(curY)
+        self.rightEye.rotateToY(curX - convergence)
+        self.rightEye.draw()
+
+        # Left eye (on screen right)
+
+        self.leftIris.rotateToX(curY)
+        self.leftIris.rotateToY(curX + convergence)
+        self.leftIris.draw()
+        self.leftEye.rotateToX(curY)
+        self.leftEye.rotateToY(curX + convergence)
+        self.leftEye.draw()
+
+        for lid in self.eyelids:
+            lid[0].draw()
+
+meshes = EyeMeshes(lodLevel)
 
 
 # Init global stuff --------------------------------------------------------
 
 mykeys = pi3d.Keyboard() # For capturing key presses
 
-startX       = random.uniform(-30.0, 30.0)
-n            = math.sqrt(900.0 - startX * startX)
-startY       = random.uniform(-n, n)
-destX        = startX
-destY        = startY
-curX         = startX
-curY         = startY
-moveDuration = random.uniform(0.075, 0.175)
-holdDuration = random.uniform(0.1, 1.1)
-startTime    = 0.0
-isMoving     = False
-isTracking   = False
-
-frames        = 0
+# Animation state (see eyestate.py), and inputs to it, reused each frame
+eyeState = EyeState(irisRegenThreshold, upperLidRegenThreshold,
+                    lowerLidRegenThreshold, AUTOBLINK, TRACKING, GPU_DEFORM,
+                    random.getrandbits(32))
+inputs   = Inputs()
+
+# Holds frame rate to what fbx2 will actually copy (see pacing.py), rather
+# than drawing frames that are never displayed.  A replay paces itself.
+pacer = FrameScheduler(-1 if inputLog.replaying else FRAME_RATE)
+
 beginningTime = time.time()
 
-rightEye.positionX(-eyePosition)
-rightIris.positionX(-eyePosition)
-rightUpperEyelid.positionX(-eyePosition)
-rightUpperEyelid.positionZ(-eyeRadius - 42)
-rightLowerEyelid.positionX(-eyePosition)
-rightLowerEyelid.positionZ(-eyeRadius - 42)
-
-leftEye.positionX(eyePosition)
-leftIris.positionX(eyePosition)
-leftUpperEyelid.positionX(eyePosition)
-leftUpperEyelid.positionZ(-eyeRadius - 42)
-leftLowerEyelid.positionX(eyePosition)
-leftLowerEyelid.positionZ(-eyeRadius - 42)
-
-currentPupilScale       =  0.5
-prevPupilScale          = -1.0 # Force regen on first frame
-prevLeftUpperLidWeight  = 0.5
-prevLeftLowerLidWeight  = 0.5
-prevRightUpperLidWeight = 0.5
-prevRightLowerLidWeight = 0.5
-prevLeftUpperLidPts  = pointsInterp(upperLidOpenPts, upperLidClosedPts, 0.5)
-prevLeftLowerLidPts  = pointsInterp(lowerLidOpenPts, lowerLidClosedPts, 0.5)
-prevRightUpperLidPts = pointsInterp(upperLidOpenPts, upperLidClosedPts, 0.5)
-prevRightLowerLidPts = pointsInterp(lowerLidOpenPts, lowerLidClosedPts, 0.5)
-
-luRegen = True
-llRegen = True
-ruRegen = True
-rlRegen = True
-
-timeOfLastBlink = 0.0
-timeToNextBlink = 1.0
-# These are per-eye (left, right) to allow winking:
-blinkStateLeft      = 0 # NOBLINK
-blinkStateRight     = 0
-blinkDurationLeft   = 0.1
-blinkDurationRight  = 0.1
-blinkStartTimeLeft  = 0
-blinkStartTimeRight = 0
-
-trackingPos = 0.3
+currentPupilScale = 0.5
+pupilSchedule     = PupilSchedule(seed=random.getrandbits(32)) # Auto pupil
+
+# Camera target tracking and latency compensation (see predict.py); the
+# camera side delay is a frame to capture and send plus uart.py's
+# smoothing, the display side this loop's frame period plus easing.
+if PREDICT and uart_thread:
+    from smoothing import delaySamples
+    from uart import FILTER_X, FILTER_Y
+    predictor = TargetPredictor(
+      sourceFrames=1.0 + max(delaySamples(FILTER_X), delaySamples(FILTER_Y)),
+      sourceTime=PREDICT_EXTRA, displayTime=displayDelay(lodFps),
+      alpha=PREDICT_ALPHA, beta=PREDICT_BETA)
+else:
+    predictor = None
+
 
 # Generate one frame of imagery
 def frame(p):
 
-    global startX, startY, destX, destY, curX, curY
-    global moveDuration, holdDuration, startTime, isMoving, isTracking
-    global frames
-    global leftIris, rightIris
-    global pupilMinPts, pupilMaxPts, irisPts, irisZ
-    global leftEye, rightEye
-    global leftUpperEyelid, leftLowerEyelid, rightUpperEyelid, rightLowerEyelid
-    global upperLidOpenPts, upperLidClosedPts, lowerLidOpenPts, lowerLidClosedPts
-    global upperLidEdgePts, lowerLidEdgePts
-    global prevLeftUpperLidPts, prevLeftLowerLidPts, prevRightUpperLidPts, prevRightLowerLidPts
-    global leftUpperEyelid, leftLowerEyelid, rightUpperEyelid, rightLowerEyelid
-    global prevLeftUpperLidWeight, prevLeftLowerLidWeight, prevRightUpperLidWeight, prevRightLowerLidWeight
-    global prevPupilScale
-    global irisRegenThreshold, upperLidRegenThreshold, lowerLidRegenThreshold
-    global luRegen, llRegen, ruRegen, rlRegen
-    global timeOfLastBlink, timeToNextBlink
-    global blinkStateLeft, blinkStateRight
-    global blinkDurationLeft, blinkDurationRight
-    global blinkStartTimeLeft, blinkStartTimeRight
-    global trackingPos
-
-    DISPLAY.loop_running()
-
-    now = time.time()
-    dt  = now - startTime
-
-    frames += 1
+    with tracer.span("loop_running"):
+        pacer.swap(DISPLAY.loop_running)
+    with tracer.span("pacing"):
+        pacer.wait()
+
+    now = inputLog.read(LOG_CLOCK, time.time)
+
 #    if(now > beginningTime):
-#        print(frames/(now-beginningTime))
-
-    if STEER_PIN >= 0:
-        steer = (GPIO.input(STEER_PIN) == GPIO.LOW)
-    else:
-        steer = False
-
-    if steer and JOYSTICK_X_IN >= 0 and JOYSTICK_Y_IN >= 0:
-        # Eye position from analog inputs
-        curX = adcValue[JOYSTICK_X_IN]
-        curY = adcValue[JOYSTICK_Y_IN]
-        if JOYSTICK_X_FLIP: curX = 1.0 - curX
-        if JOYSTICK_Y_FLIP: curY = 1.0 - curY
-        curX = -30.0 + curX * 60.0
-        curY = -30.0 + curY * 60.0
-    elif isMoving == True:
-        # Autonomous eye position, moving towards a destination
-        if dt <= moveDuration:
-            scale        = (now - startTime) / moveDuration
-            # Ease in/out curve: 3*t^2-2*t^3
-            scale = 3.0 * scale * scale - 2.0 * scale * scale * scale
-            curX         = startX + (destX - startX) * scale
-            curY         = startY + (destY - startY) * scale
+#        print(eyeState.frames/(now-beginningTime))
+
+    # Gather inputs for this frame
+
+    with tracer.span("inputs"):
+        inputs.pupil = p
+        btn = inputLog.read(LOG_BUTTONS, lambda: buttons.snapshot(now))
+
+        if (btn.isHeld(STEER_BTN) and
+          JOYSTICK_X_IN >= 0 and JOYSTICK_Y_IN >= 0):
+            # Eye position from analog inputs
+            adcIn = adcInput()
+            x = adcIn[JOYSTICK_X_IN]
+            y = adcIn[JOYSTICK_Y_IN]
+            if JOYSTICK_X_FLIP: x = 1.0 - x
+            if JOYSTICK_Y_FLIP: y = 1.0 - y
+            inputs.joystick = (x, y)
         else:
-            startX       = destX
-            startY       = destY
-            curX         = destX
-            curY         = destY
-            if isTracking:
-                holdDuration = random.uniform(0.1, 1.1)
-                #holdDuration = 0.2
+            inputs.joystick = None
+
+        inputs.target = None
+        if uart_thread:
+            target, stamp, fps, lux = cameraInput()
+            inputs.tracks = inputLog.read(LOG_TRACKS,
+                                          lambda: uart_thread.tracks)
+            if not target: # do we have current uart data?
+                if predictor: predictor.reset()
+            elif predictor:
+                # Extrapolated to when this frame will be seen, once per
+                # camera frame
+                inputs.target = predictor.update(target[0], target[1],
+                  stamp, 1.0 / fps if fps > 0 else 0.0, now)
             else:
-                holdDuration = random.uniform(0.1, 1.1)
-            startTime    = now
-            isMoving     = False
-    else:
-        # Get next destination, either from uart data or ramdonly
-        if dt >= holdDuration:
-            isTracking = False
-            if not isTracking:
-                destX        = random.uniform(-30.0, 30.0)
-                n            = math.sqrt(900.0 - destX * destX)
-                destY        = random.uniform(-n, n)
-                moveDuration = random.uniform(0.075, 0.175)
-
-            startTime    = now
-            isMoving     = True
+                inputs.target = target
 
-    if uart_thread:
-        newX, newY = None, None
-        with uart_thread.lock:
-            if uart_thread.targets: # do we have current uart data?
-                newX, newY = uart_thread.targets
+        # Down now, or tapped since last frame
+        inputs.blink     = btn.down(BLINK_BTN)
+        inputs.winkLeft  = btn.down(WINK_L_BTN)
+        inputs.winkRight = btn.down(WINK_R_BTN)
 
-        if newX is not None:
-            # see if we've moved enough to warrant a new destination
-            if abs(newX - destX) > 0.1 or abs(newY - destY) > 0.1:
-                destX, destY = newX, newY
-                isMoving     = True
+        # Following another unit? Its state overrides gaze, pupil and lids
+        inputs.synced = (inputLog.read(LOG_SYNC,
+                                       lambda: syncReceiver.state(now))
+                         if syncReceiver else None)
 
-                print "dx:%f dy:%f\r" % (destX, destY)
-                isTracking = True
-                moveDuration = 0.05
-                startTime    = now
+    with tracer.span("step"):
+        params = step(eyeState, now, inputs)
 
+    if syncSender:
+        syncSender.send(now, params.x, params.y, params.pupil, params.lidTo)
 
     # Regenerate iris geometry only if size changed by >= 1/4 pixel
-    if abs(p - prevPupilScale) >= irisRegenThreshold:
-        # Interpolate points between min and max pupil sizes
-        interPupil = pointsInterp(pupilMinPts, pupilMaxPts, p)
-        # Generate mesh between interpolated pupil and iris bounds
-        mesh = pointsMesh(None, interPupil, irisPts, 4, -irisZ, True)
-        # Assign to both eyes
-        leftIris.re_init(pts=mesh)
-        rightIris.re_init(pts=mesh)
-        prevPupilScale = p
-
-    # Eyelid WIP
-
-    if AUTOBLINK and (now - timeOfLastBlink) >= timeToNextBlink:
-        timeOfLastBlink = now
-        duration        = random.uniform(0.035, 0.06)
-        if blinkStateLeft != 1:
-            blinkStateLeft     = 1 # ENBLINK
-            blinkStartTimeLeft = now
-            blinkDurationLeft  = duration
-        if blinkStateRight != 1:
-            blinkStateRight     = 1 # ENBLINK
-            blinkStartTimeRight = now
-            blinkDurationRight  = duration
-        timeToNextBlink = duration * 3 + random.uniform(0.0, 4.0)
-
-    if blinkStateLeft: # Left eye currently winking/blinking?
-        # Check if blink time has elapsed...
-        if (now - blinkStartTimeLeft) >= blinkDurationLeft:
-            # Yes...increment blink state, unless...
-            if (blinkStateLeft == 1 and # Enblinking and...
-                ((BLINK_PIN >= 0 and    # blink pin held, or...
-                  GPIO.input(BLINK_PIN) == GPIO.LOW) or
-                (WINK_L_PIN >= 0 and    # wink pin held
-                  GPIO.input(WINK_L_PIN) == GPIO.LOW))):
-                # Don't advance yet; eye is held closed
-                pass
-            else:
-                blinkStateLeft += 1
-                if blinkStateLeft > 2:
-                    blinkStateLeft = 0 # NOBLINK
-                else:
-                    blinkDurationLeft *= 2.0
-                    blinkStartTimeLeft = now
-    else:
-        if WINK_L_PIN >= 0 and GPIO.input(WINK_L_PIN) == GPIO.LOW:
-            blinkStateLeft     = 1 # ENBLINK
-            blinkStartTimeLeft = now
-            blinkDurationLeft  = random.uniform(0.035, 0.06)
-
-    if blinkStateRight: # Right eye currently winking/blinking?
-        # Check if blink time has elapsed...
-        if (now - blinkStartTimeRight) >= blinkDurationRight:
-            # Yes...increment blink state, unless...
-            if (blinkStateRight == 1 and # Enblinking and...
-                ((BLINK_PIN >= 0 and    # blink pin held, or...
-                  GPIO.input(BLINK_PIN) == GPIO.LOW) or
-                (WINK_R_PIN >= 0 and    # wink pin held
-                  GPIO.input(WINK_R_PIN) == GPIO.LOW))):
-                # Don't advance yet; eye is held closed
-                pass
-            else:
-                blinkStateRight += 1
-                if blinkStateRight > 2:
-                    blinkStateRight = 0 # NOBLINK
-                else:
-                    blinkDurationRight *= 2.0
-                    blinkStartTimeRight = now
-    else:
-        if WINK_R_PIN >= 0 and GPIO.input(WINK_R_PIN) == GPIO.LOW:
-            blinkStateRight     = 1 # ENBLINK
-            blinkStartTimeRight = now
-            blinkDurationRight  = random.uniform(0.035, 0.06)
-
-    if BLINK_PIN >= 0 and GPIO.input(BLINK_PIN) == GPIO.LOW:
-        duration = random.uniform(0.035, 0.06)
-        if blinkStateLeft == 0:
-            blinkStateLeft     = 1
-            blinkStartTimeLeft = now
-            blinkDurationLeft  = duration
-        if blinkStateRight == 0:
-            blinkStateRight     = 1
-            blinkStartTimeRight = now
-            blinkDurationRight  = duration
-
-    if TRACKING:
-        n = 0.4 - curY / 60.0
-        if   n < 0.0: n = 0.0
-        elif n > 1.0: n = 1.0
-        trackingPos = (trackingPos * 3.0 + n) * 0.25
-
-    if blinkStateLeft:
-        n = (now - blinkStartTimeLeft) / blinkDurationLeft
-        if n > 1.0: n = 1.0
-        if blinkStateLeft == 2: n = 1.0 - n
-    else:
-        n = 0.0
-    newLeftUpperLidWeight = trackingPos + (n * (1.0 - trackingPos))
-    newLeftLowerLidWeight = (1.0 - trackingPos) + (n * trackingPos)
-
-    if blinkStateRight:
-        n = (now - blinkStartTimeRight) / blinkDurationRight
-        if n > 1.0: n = 1.0
-        if blinkStateRight == 2: n = 1.0 - n
-    else:
-        n = 0.0
-    newRightUpperLidWeight = trackingPos + (n * (1.0 - trackingPos))
-    newRightLowerLidWeight = (1.0 - trackingPos) + (n * trackingPos)
-
-    if (luRegen or (abs(newLeftUpperLidWeight - prevLeftUpperLidWeight) >=
-      upperLidRegenThreshold)):
-        newLeftUpperLidPts = pointsInterp(upperLidOpenPts,
-          upperLidClosedPts, newLeftUpperLidWeight)
-        if newLeftUpperLidWeight > prevLeftUpperLidWeight:
-            leftUpperEyelid.re_init(pts=pointsMesh(
-              upperLidEdgePts, prevLeftUpperLidPts,
-              newLeftUpperLidPts, 5, 0, False))
-        else:
-            leftUpperEyelid.re_init(pts=pointsMesh(
-              upperLidEdgePts, newLeftUpperLidPts,
-              prevLeftUpperLidPts, 5, 0, False))
-        prevLeftUpperLidPts    = newLeftUpperLidPts
-        prevLeftUpperLidWeight = newLeftUpperLidWeight
-        luRegen = True
-    else:
-        luRegen = False
-
-    if (llRegen or (abs(newLeftLowerLidWeight - prevLeftLowerLidWeight) >=
-      lowerLidRegenThreshold)):
-        newLeftLowerLidPts = pointsInterp(lowerLidOpenPts,
-          lowerLidClosedPts, newLeftLowerLidWeight)
-        if newLeftLowerLidWeight > prevLeftLowerLidWeight:
-            leftLowerEyelid.re_init(pts=pointsMesh(
-              lowerLidEdgePts, prevLeftLowerLidPts,
-              newLeftLowerLidPts, 5, 0, False))
-        else:
-            leftLowerEyelid.re_init(pts=pointsMesh(
-              lowerLidEdgePts, newLeftLowerLidPts,
-              prevLeftLowerLidPts, 5, 0, False))
-        prevLeftLowerLidWeight = newLeftLowerLidWeight
-        prevLeftLowerLidPts    = newLeftLowerLidPts
-        llRegen = True
-    else:
-        llRegen = False
-
-    if (ruRegen or (abs(newRightUpperLidWeight - prevRightUpperLidWeight) >=
-      upperLidRegenThreshold)):
-        newRightUpperLidPts = pointsInterp(upperLidOpenPts,
-          upperLidClosedPts, newRightUpperLidWeight)
-        if newRightUpperLidWeight > prevRightUpperLidWeight:
-            rightUpperEyelid.re_init(pts=pointsMesh(
-              upperLidEdgePts, prevRightUpperLidPts,
-              newRightUpperLidPts, 5, 0, False, True))
-        else:
-            rightUpperEyelid.re_init(pts=pointsMesh(
-              upperLidEdgePts, newRightUpperLidPts,
-              prevRightUpperLidPts, 5, 0, False, True))
-        prevRightUpperLidWeight = newRightUpperLidWeight
-        prevRightUpperLidPts    = newRightUpperLidPts
-        ruRegen = True
-    else:
-        ruRegen = False
-
-    if (rlRegen or (abs(newRightLowerLidWeight - prevRightLowerLidWeight) >=
-      lowerLidRegenThreshold)):
-        newRightLowerLidPts = pointsInterp(lowerLidOpenPts,
-          lowerLidClosedPts, newRightLowerLidWeight)
-        if newRightLowerLidWeight > prevRightLowerLidWeight:
-            rightLowerEyelid.re_init(pts=pointsMesh(
-              lowerLidEdgePts, prevRightLowerLidPts,
-              newRightLowerLidPts, 5, 0, False, True))
-        else:
-            rightLowerEyelid.re_init(pts=pointsMesh(
-              lowerLidEdgePts, newRightLowerLidPts,
-              prevRightLowerLidPts, 5, 0, False, True))
-        prevRightLowerLidWeight = newRightLowerLidWeight
-        prevRightLowerLidPts    = newRightLowerLidPts
-        rlRegen = True
-    else:
-        rlRegen = False
-
-    convergence = 2.0
-
-    # Right eye (on screen left)
-
-    rightIris.rotateToX(curY)
-    rightIris.rotateToY(curX - convergence)
-    rightIris.draw()
-    rightEye.rotateToX(curY)
-    rightEye.rotateToY(curX - convergence)
-    rightEye.draw()
-
-    # Left eye (on screen right)
-
-    leftIris.rotateToX(curY)
-    leftIris.rotateToY(curX + convergence)
-    leftIris.draw()
-    leftEye.rotateToX(curY)
-    leftEye.rotateToY(curX + convergence)
-    leftEye.draw()
-
-    leftUpperEyelid.draw()
-    leftLowerEyelid.draw()
-    rightUpperEyelid.draw()
-    rightLowerEyelid.draw()
+    with tracer.span("iris"):
+        if params.irisRegen: meshes.updateIris(params.pupil)
+
+    # Eyelid meshes span last regen's weight to this frame's
+    with tracer.span("lids"):
+        for i in range(LIDS):
+            if params.lidRegen[i]:
+                meshes.updateLid(i, params.lidFrom[i], params.lidTo[i])
+
+    with tracer.span("draw"):
+        meshes.draw(params.x, params.y)
+
+    # Change mesh detail if frames are persistently over budget (or have
+    # had headroom for a while); new meshes need regenerating in full.
+    if lodControl:
+        level = inputLog.read(LOG_LOD,
+                              lambda: lodControl.update(pacer.work))
+        if level is not None:
+            with tracer.span("lod"):
+                meshes.build(level)
+            eyeState.prevPupilScale = -1.0
+            eyeState.lidRegen       = [True] * LIDS
 
     k = mykeys.read()
-    if k==27:
-        if uart_thread:
-            uart_thread.running = False
-            with uart_thread.lock:
-                if uart_thread.uart:
-                    uart_thread.uart.kill()
-                    uart_thread.uart = None
-
-        if adc_thread:
-            adc_thread.running = False
-        mykeys.close()
-        DISPLAY.stop()
-        exit(0)
-
-
-def split( # Recursive simulated pupil response when no analog sensor
-  startValue, # Pupil scale starting value (0.0 to 1.0)
-  endValue,   # Pupil scale ending value (")
-  duration,   # Start-to-end time, floating-point seconds
-  range):     # +/- random pupil scale at midpoint
-    startTime = time.time()
-    if range >= 0.125: # Limit subdvision count, because recursion
-        duration *= 0.5 # Split time & range in half for subdivision,
-        range    *= 0.5 # then pick random center point within range:
-        midValue  = ((startValue + endValue - range) * 0.5 +
-                     random.uniform(0.0, range))
-        split(startValue, midValue, duration, range)
-        split(midValue  , endValue, duration, range)
-    else: # No more subdivisons, do iris motion...
-        dv = endValue - startValue
-        while True:
-            dt = time.time() - startTime
-            if dt >= duration: break
-            v = startValue + dv * dt / duration
-            if   v < PUPIL_MIN: v = PUPIL_MIN
-            elif v > PUPIL_MAX: v = PUPIL_MAX
-            frame(v) # Draw frame w/interim pupil scale value
+    if k==27: shutdown()
+
+
+# Print each module's stats and exit (Esc, or the end of a replay)
+def shutdown():
+    if uart_thread:
+        uart_thread.stop()
+        print "camera input: %s\r" % uart_thread.stats()
+
+    if adc_thread:
+        adc_thread.running = False
+        print "analog input: %s\r" % adc_thread.stats()
+    buttons.close()
+    print "buttons: %s\r" % buttons.stats()
+    if meshes.irisCache:
+        print "iris cache: %s\r" % meshes.irisCache.stats()
+    if meshes.upperLidCache:
+        print "upper lid cache: %s\r" % meshes.upperLidCache.stats()
+        print "lower lid cache: %s\r" % meshes.lowerLidCache.stats()
+    if meshes.batch:
+        print "draw batch: %s\r" % meshes.batch.stats()
+    print "frame pacing: %s\r" % pacer.stats()
+    if lodControl:
+        print "mesh detail: %s\r" % lodControl.stats()
+    if predictor:
+        print "target prediction: %s\r" % predictor.stats()
+    if syncSender:
+        print "gaze sync: %s\r" % syncSender.stats()
+    if syncReceiver:
+        syncReceiver.running = False
+        print "gaze sync: %s\r" % syncReceiver.stats()
+    if RECORD or inputLog.replaying:
+        inputLog.close()
+        print "input log: %s\r" % inputLog.stats()
+    mykeys.close()
+    DISPLAY.stop()
+    exit(0)
+
+inputLog.atEnd = shutdown
 
 
 # MAIN LOOP -- runs continuously -------------------------------------------
@@ -751,7 +787,7 @@ def split( # Recursive simulated pupil response when no analog sensor
 while True:
 
     if PUPIL_IN >= 0: # Pupil scale from sensor
-        v = adcValue[PUPIL_IN]
+        v = adcInput()[PUPIL_IN]
         # If you need to calibrate PUPIL_MIN and MAX,
         # add a 'print v' here for testing.
         if   v < PUPIL_MIN: v = PUPIL_MIN
@@ -765,8 +801,7 @@ while True:
         frame(v)
 
     elif PUPIL_IN == -2 and uart_thread: # read from uart
-        with uart_thread.lock:
-            v = uart_thread.lux
+        v = cameraInput()[3]
 
         #print("v: %f\r" % v)
         if   v < PUPIL_MIN: v = PUPIL_MIN
@@ -781,8 +816,11 @@ while True:
 
         frame(v)
 
-    else: # Fractal auto pupil scale
-        v = random.random()
-        split(currentPupilScale, v, 4.0, 1.0)
+    else: # Fractal auto pupil scale (see eyestate.py)
+        v = pupilSchedule.sample(inputLog.read(LOG_CLOCK, time.time),
+                                 currentPupilScale)
+        if   v < PUPIL_MIN: v = PUPIL_MIN
+        elif v > PUPIL_MAX: v = PUPIL_MAX
+        frame(v)
 
     currentPupilScale = v
@@ -0,0 +1,361 @@
+#!/usr/bin/python
+
+import math
+import random
+import sys
+import time
+
+# Eye animation state and logic, apart from any drawing.  step() advances
+# the saccade, blink and eyelid tracking state machines by one frame and
+# says what to render; eyes.py turns that into mesh updates and draws.
+# All state lives in one slotted object rather than ~40 module globals,
+# which makes the per-frame attribute access cheaper and lets the whole
+# thing run headless (see the profile at the end of this file).
+
+# Eyelid order used throughout: left upper, left lower, right upper,
+# right lower.
+LIDS = 4
+
+
+class EyeState(object):
+	__slots__ = (
+	  # Settings
+	  "rng", "autoblink", "tracking", "deform", "irisRegenThreshold",
+	  "lidRegenThreshold",
+	  # Saccades
+	  "startX", "startY", "destX", "destY", "curX", "curY",
+	  "moveDuration", "holdDuration", "startTime", "isMoving", "isTracking",
+	  # Blinks; per-eye (left, right) to allow winking
+	  "timeOfLastBlink", "timeToNextBlink",
+	  "blinkStateLeft", "blinkDurationLeft", "blinkStartTimeLeft",
+	  "blinkStateRight", "blinkDurationRight", "blinkStartTimeRight",
+	  "trackingPos",
+	  # Regen bookkeeping: values the current meshes were built for
+	  "prevPupilScale", "prevLidWeight", "lidRegen",
+	  "frames")
+
+	# Thresholds are the pupil and eyelid weight changes below which
+	# meshes aren't regenerated (see geomcache.py).  deform=True for
+	# keyframed meshes (GPU_DEFORM), which take new weights every frame.
+	def __init__(self, irisRegenThreshold, upperLidRegenThreshold,
+	  lowerLidRegenThreshold, autoblink=True, tracking=True, deform=False,
+	  seed=None):
+		rng = random.Random(seed)
+		self.rng                = rng
+		self.autoblink          = autoblink
+		self.tracking           = tracking
+		self.deform             = deform
+		self.irisRegenThreshold = irisRegenThreshold
+		self.lidRegenThreshold  = (upperLidRegenThreshold,
+		  lowerLidRegenThreshold, upperLidRegenThreshold,
+		  lowerLidRegenThreshold)
+
+		self.startX       = rng.uniform(-30.0, 30.0)
+		n                 = math.sqrt(900.0 - self.startX * self.startX)
+		self.startY       = rng.uniform(-n, n)
+		self.destX        = self.startX
+		self.destY        = self.startY
+		self.curX         = self.startX
+		self.curY         = self.startY
+		self.moveDuration = rng.uniform(0.075, 0.175)
+		self.holdDuration = rng.uniform(0.1, 1.1)
+		self.startTime    = 0.0
+		self.isMoving     = False
+		self.isTracking   = False
+
+		self.timeOfLastBlink     = 0.0
+		self.timeToNextBlink     = 1.0
+		self.blinkStateLeft      = 0 # NOBLINK
+		self.blinkDurationLeft   = 0.1
+		self.blinkStartTimeLeft  = 0
+		self.blinkStateRight     = 0
+		self.blinkDurationRight  = 0.1
+		self.blinkStartTimeRight = 0
+		self.trackingPos         = 0.3
+
+		self.prevPupilScale = -1.0 # Force regen on first frame
+		self.prevLidWeight  = [0.5] * LIDS
+		self.lidRegen       = [True] * LIDS
+		self.frames         = 0
+
+
+# Per-frame inputs, filled in by the caller from sensors/GPIO/network.
+# One instance can be reused from frame to frame.
+class Inputs(object):
+	__slots__ = ("pupil", "joystick", "target", "tracks", "blink",
+	  "winkLeft", "winkRight", "synced")
+
+	def __init__(self):
+		self.pupil     = 0.5   # Pupil scale, 0.0 to 1.0
+		self.joystick  = None  # (x, y), 0.0 to 1.0, when steering
+		self.target    = None  # (x, y) gaze target in degrees, e.g. uart
+		self.tracks    = ()    # Everything the camera is tracking, as
+		                       # (id, x, y, size), degrees (multitrack.py);
+		                       # step() follows target, the one picked
+		self.blink     = False # Blink button held
+		self.winkLeft  = False # Wink buttons held
+		self.winkRight = False
+		self.synced    = None  # GazeState when following (gazesync.py)
+
+
+# What to draw.  lidFrom/lidTo are the pair of weights each eyelid mesh
+# spans (last regen to now); only those with lidRegen set need rebuilding.
+class RenderParams(object):
+	__slots__ = ("x", "y", "pupil", "irisRegen", "lidRegen", "lidFrom",
+	  "lidTo")
+
+
+# Eyelid weight for blink progress of one eye (0.0 to 1.0 closed)
+def blinkWeight(state, startTime, duration, now):
+	if not state: return 0.0
+	n = (now - startTime) / duration
+	if n > 1.0: n = 1.0
+	if state == 2: n = 1.0 - n
+	return n
+
+
+# Advance state 's' to time 'now' (seconds) with given inputs; returns
+# RenderParams for this frame.
+def step(s, now, inputs):
+	rng    = s.rng
+	dt     = now - s.startTime
+	synced = inputs.synced
+	s.frames += 1
+
+	if synced is not None:
+		# Following another unit; its state overrides gaze, pupil, lids
+		s.curX = synced.x
+		s.curY = synced.y
+	elif inputs.joystick is not None:
+		# Eye position from analog inputs
+		x, y   = inputs.joystick
+		s.curX = -30.0 + x * 60.0
+		s.curY = -30.0 + y * 60.0
+	elif s.isMoving:
+		# Autonomous eye position, moving towards a destination
+		if dt <= s.moveDuration:
+			scale = dt / s.moveDuration
+			# Ease in/out curve: 3*t^2-2*t^3
+			scale  = 3.0 * scale * scale - 2.0 * scale * scale * scale
+			s.curX = s.startX + (s.destX - s.startX) * scale
+			s.curY = s.startY + (s.destY - s.startY) * scale
+		else:
+			s.startX       = s.destX
+			s.startY       = s.destY
+			s.curX         = s.destX
+			s.curY         = s.destY
+			s.holdDuration = rng.uniform(0.1, 1.1)
+			s.startTime    = now
+			s.isMoving     = False
+	elif dt >= s.holdDuration:
+		# Get next destination randomly
+		s.isTracking   = False
+		s.destX        = rng.uniform(-30.0, 30.0)
+		n              = math.sqrt(900.0 - s.destX * s.destX)
+		s.destY        = rng.uniform(-n, n)
+		s.moveDuration = rng.uniform(0.075, 0.175)
+		s.startTime    = now
+		s.isMoving     = True
+
+	if inputs.target is not None:
+		newX, newY = inputs.target
+		# See if we've moved enough to warrant a new destination; the move
+		# starts from wherever the eye is now, which may be partway
+		# through the last one
+		if abs(newX - s.destX) > 0.1 or abs(newY - s.destY) > 0.1:
+			s.startX, s.startY = s.curX, s.curY
+			s.destX, s.destY = newX, newY
+			s.isMoving       = True
+			s.isTracking     = True
+			s.moveDuration   = 0.05
+			s.startTime      = now
+
+	p = synced.pupil if synced is not None else inputs.pupil
+
+	# Blinks
+
+	if s.autoblink and (now - s.timeOfLastBlink) >= s.timeToNextBlink:
+		s.timeOfLastBlink = now
+		duration          = rng.uniform(0.035, 0.06)
+		if s.blinkStateLeft != 1:
+			s.blinkStateLeft     = 1 # ENBLINK
+			s.blinkStartTimeLeft = now
+			s.blinkDurationLeft  = duration
+		if s.blinkStateRight != 1:
+			s.blinkStateRight     = 1 # ENBLINK
+			s.blinkStartTimeRight = now
+			s.blinkDurationRight  = duration
+		s.timeToNextBlink = duration * 3 + rng.uniform(0.0, 4.0)
+
+	if s.blinkStateLeft: # Left eye currently winking/blinking?
+		# Check if blink time has elapsed...
+		if (now - s.blinkStartTimeLeft) >= s.blinkDurationLeft:
+			# Yes...increment blink state, unless eye is held closed
+			if not (s.blinkStateLeft == 1 and
+			  (inputs.blink or inputs.winkLeft)):
+				s.blinkStateLeft += 1
+				if s.blinkStateLeft > 2:
+					s.blinkStateLeft = 0 # NOBLINK
+				else:
+					s.blinkDurationLeft *= 2.0
+					s.blinkStartTimeLeft = now
+	elif inputs.winkLeft:
+		s.blinkStateLeft     = 1 # ENBLINK
+		s.blinkStartTimeLeft = now
+		s.blinkDurationLeft  = rng.uniform(0.035, 0.06)
+
+	if s.blinkStateRight: # Right eye currently winking/blinking?
+		if (now - s.blinkStartTimeRight) >= s.blinkDurationRight:
+			if not (s.blinkStateRight == 1 and
+			  (inputs.blink or inputs.winkRight)):
+				s.blinkStateRight += 1
+				if s.blinkStateRight > 2:
+					s.blinkStateRight = 0 # NOBLINK
+				else:
+					s.blinkDurationRight *= 2.0
+					s.blinkStartTimeRight = now
+	elif inputs.winkRight:
+		s.blinkStateRight     = 1 # ENBLINK
+		s.blinkStartTimeRight = now
+		s.blinkDurationRight  = rng.uniform(0.035, 0.06)
+
+	if inputs.blink:
+		duration = rng.uniform(0.035, 0.06)
+		if s.blinkStateLeft == 0:
+			s.blinkStateLeft     = 1
+			s.blinkStartTimeLeft = now
+			s.blinkDurationLeft  = duration
+		if s.blinkStateRight == 0:
+			s.blinkStateRight     = 1
+			s.blinkStartTimeRight = now
+			s.blinkDurationRight  = duration
+
+	# Eyelids
+
+	if s.tracking:
+		n = 0.4 - s.curY / 60.0
+		if   n < 0.0: n = 0.0
+		elif n > 1.0: n = 1.0
+		s.trackingPos = (s.trackingPos * 3.0 + n) * 0.25
+	t = s.trackingPos
+
+	if synced is not None:
+		lids = synced.lids
+	else:
+		nl = blinkWeight(s.blinkStateLeft, s.blinkStartTimeLeft,
+		  s.blinkDurationLeft, now)
+		nr = blinkWeight(s.blinkStateRight, s.blinkStartTimeRight,
+		  s.blinkDurationRight, now)
+		lids = (t + (nl * (1.0 - t)), (1.0 - t) + (nl * t),
+		        t + (nr * (1.0 - t)), (1.0 - t) + (nr * t))
+
+	# Regen bookkeeping.  A lid rebuilt last frame is always rebuilt
+	# again (as the original frame() code did), so the mesh catches up to
+	# the final weight when motion stops; in practice this means a lid
+	# that has moved once keeps regenerating every frame.
+
+	r           = RenderParams()
+	r.x         = s.curX
+	r.y         = s.curY
+	r.pupil     = p
+	r.irisRegen = (s.deform or
+	  abs(p - s.prevPupilScale) >= s.irisRegenThreshold)
+	if r.irisRegen: s.prevPupilScale = p
+	r.lidFrom   = tuple(s.prevLidWeight)
+	r.lidTo     = lids
+	prev        = s.prevLidWeight
+	regen       = s.lidRegen
+	threshold   = s.lidRegenThreshold
+	for i in range(LIDS):
+		w = lids[i]
+		if s.deform or regen[i] or abs(w - prev[i]) >= threshold[i]:
+			prev[i]  = w
+			regen[i] = True
+		else:
+			regen[i] = False
+	r.lidRegen  = tuple(regen)
+	return r
+
+
+# Autonomous pupil motion, as the recursive split() in eyes.py and
+# cyclops.py used to make it: every PUPIL_PERIOD seconds a new random
+# target, the path there built by midpoint displacement (random midpoint
+# within a range that halves at each level, down to PUPIL_MIN_RANGE) and
+# followed linearly between points.  split() rendered frames from inside
+# its recursion, so the main loop didn't get control back for 4 seconds;
+# here each period's 17 points are computed when it starts, and sample()
+# just interpolates, once per frame from the main loop.
+PUPIL_PERIOD    = 4.0
+PUPIL_RANGE     = 1.0
+PUPIL_MIN_RANGE = 0.125
+
+class PupilSchedule(object):
+	def __init__(self, period=PUPIL_PERIOD, seed=None):
+		self.rng       = random.Random(seed)
+		self.period    = period
+		self.points    = None
+		self.segment   = period
+		self.startTime = 0.0
+		self.endTime   = None
+
+	# Midpoint-displaced path from start to end, subdividing breadth-first
+	# (split() went depth-first; the distribution is the same)
+	def plan(self, start, end):
+		points = [start, end]
+		r      = PUPIL_RANGE
+		while r >= PUPIL_MIN_RANGE:
+			r     *= 0.5
+			split  = [start]
+			for i in range(1, len(points)):
+				a = points[i - 1]
+				b = points[i]
+				split.append((a + b - r) * 0.5 + self.rng.uniform(0.0, r))
+				split.append(b)
+			points = split
+		self.points  = points
+		self.segment = self.period / (len(points) - 1)
+
+	# Pupil scale (0.0 to 1.0) at time 'now'.  'current' is the scale in
+	# use, which a new schedule starts from if this one wasn't the one
+	# driving the pupil (first call, or sampling stopped for a while);
+	# otherwise each period carries on from the end of the last, on the
+	# same clock.
+	def sample(self, now, current):
+		if self.endTime is None or now >= self.endTime:
+			if self.endTime is None or now - self.endTime >= self.segment:
+				start          = current
+				self.startTime = now
+			else:
+				start          = self.points[-1]
+				self.startTime = self.endTime
+			self.plan(start, self.rng.random())
+			self.endTime = self.startTime + self.period
+		n = (now - self.startTime) / self.segment
+		i = min(int(n), len(self.points) - 2)
+		a = self.points[i]
+		return a + (self.points[i + 1] - a) * (n - i)
+
+
+# Headless profile: run the state machine with simulated time and the
+# autonomous pupil, report frames per second and how often meshes would be
+# regenerated.  Usage: eyestate.py [frames] [fps]
+if __name__ == "__main__":
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	fps   = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+	state = EyeState(0.01, 0.01, 0.01, seed=1)
+	inp   = Inputs()
+	pupil = PupilSchedule(seed=1)
+	irisRegens = 0
+	lidRegens  = 0
+	begin = time.time()
+	for f in range(count):
+		now        = f / fps
+		inp.pupil  = pupil.sample(now, inp.pupil)
+		r          = step(state, now, inp)
+		irisRegens += r.irisRegen
+		lidRegens  += sum(r.lidRegen)
+	elapsed = time.time() - begin
+	print "%d frames in %.3f s (%.0f frames/s)" % (count, elapsed,
+	  count / elapsed)
+	print "iris regens %.1f%% of frames, lid regens %.2f per frame" % (
+	  100.0 * irisRegens / count, float(lidRegens) / count)
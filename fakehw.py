@@ -0,0 +1,381 @@
+#!/usr/bin/python
+
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+# Stand-ins for the hardware eyes.py and cyclops.py talk to: the GPIO
+# buttons (RPi.GPIO), the ADS1015 analog inputs (Adafruit_ADS1x15), the
+# OpenMV camera's UART feed (serial port, or uart.py's output) and the
+# keyboard.  install() puts them in
+# place before the eye script is run, driven by one of the scripted
+# scenarios below, so the scripts can run on any Linux box (display via
+# Xvfb + Mesa, see bench.py).
+#
+# Scenario inputs are functions of time since install() (seconds) and a
+# random.Random, so a scenario plays out the same way each run:
+#   "blink"  - blink button held
+#   "winkL"  - left wink button held, "winkR" likewise
+#   "target" - camera gaze target in degrees (x, y), or None
+#   "lux"    - camera light level
+#   "adc"    - the four ADC channels, 0.0 to 1.0
+
+BLINK_PINS = (18, 23) # eyes.py, cyclops.py
+WINK_L_PIN = 4
+WINK_R_PIN = 27
+TAP_PERIOD = 0.25 # "taps" scenario
+
+def noTarget(t, rng): return None
+def steadyLux(t, rng): return 50.0
+def midAdc(t, rng): return (0.5, 0.5, 0.5, 0.5)
+def released(t): return False
+
+SCENARIOS = {
+	# Autonomous saccades and blinks only
+	"idle": {},
+	# Blink button pressed for 40 ms every 150 ms, winks in between
+	"blinkstorm": {
+		"blink": lambda t: (t % 0.15) < 0.04,
+		"winkL": lambda t: 0.07 < (t % 0.3) < 0.1,
+		"winkR": lambda t: 0.22 < (t % 0.3) < 0.25,
+	},
+	# Blink button tapped for 8 ms at a time, shorter than a frame
+	"taps": {
+		"blink": lambda t: (t % TAP_PERIOD) < 0.008,
+	},
+	# Pupil driven by a noisy light level
+	"luxnoise": {
+		"lux": lambda t, rng: max(0.0, 50.0 + rng.gauss(0.0, 30.0)),
+		"adc": lambda t, rng: tuple(min(max(0.5 + rng.gauss(0.0, 0.2),
+		  0.0), 1.0) for i in range(4)),
+	},
+	# Thermal target darting around the field of view
+	"targets": {
+		"target": lambda t, rng: (25.0 * math.sin(t * 6.0),
+		  20.0 * math.cos(t * 4.3)),
+		"lux": lambda t, rng: 40.0 + 20.0 * math.sin(t * 0.5),
+	},
+}
+
+
+class Feed(object):
+	def __init__(self, scenario, seed=None):
+		s = SCENARIOS[scenario]
+		self.rng    = random.Random(seed)
+		self.start  = time.time()
+		self.blink  = s.get("blink", released)
+		self.winkL  = s.get("winkL", released)
+		self.winkR  = s.get("winkR", released)
+		self.target = s.get("target", noTarget)
+		self.lux    = s.get("lux", steadyLux)
+		self.adc    = s.get("adc", midAdc)
+
+	def t(self):
+		return time.time() - self.start
+
+
+# RPi.GPIO: buttons are active low, anything else reads as released.
+# Pins with edge detection are watched by a thread that calls back on
+# each change, after 'chatter' bounces of the contacts if asked.
+class FakeGPIO(object):
+	BCM, BOARD         = 11, 10
+	IN, OUT            = 1, 0
+	LOW, HIGH          = 0, 1
+	PUD_UP, PUD_DOWN   = 22, 21
+	RISING, FALLING    = 31, 32
+	BOTH               = 33
+	WATCH_TIME         = 0.0005 # Seconds between looks at watched pins
+	CHATTER_TIME       = 0.0001 # Seconds per contact bounce
+
+	def __init__(self, feed, chatter=0):
+		self.feed      = feed
+		self.chatter   = chatter
+		self.pins      = {}
+		self.levels    = {} # Watched pins: level, as callbacks last saw
+		self.callbacks = {} # Watched pins: (edge, callback)
+		self.watcher   = None
+
+	def setmode(self, mode): pass
+	def setwarnings(self, flag): pass
+
+	def cleanup(self, *args):
+		self.callbacks.clear()
+
+	def setup(self, pin, direction, pull_up_down=None, initial=None):
+		self.pins[pin] = direction
+
+	def level(self, pin):
+		t = self.feed.t()
+		if pin in BLINK_PINS: held = self.feed.blink(t)
+		elif pin == WINK_L_PIN: held = self.feed.winkL(t)
+		elif pin == WINK_R_PIN: held = self.feed.winkR(t)
+		else: held = False
+		return self.LOW if held else self.HIGH
+
+	def input(self, pin):
+		if pin in self.levels: return self.levels[pin]
+		return self.level(pin)
+
+	def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+		self.levels[pin]    = self.level(pin)
+		self.callbacks[pin] = (edge, callback)
+		if not self.watcher:
+			self.watcher = threading.Thread(target=self.watch)
+			self.watcher.daemon = True
+			self.watcher.start()
+
+	def remove_event_detect(self, pin):
+		self.callbacks.pop(pin, None)
+		self.levels.pop(pin, None)
+
+	def change(self, pin, level):
+		self.levels[pin] = level
+		edge, callback = self.callbacks.get(pin, (None, None))
+		if callback and (edge == self.BOTH or
+		  edge == (self.FALLING if level == self.LOW else self.RISING)):
+			callback(pin)
+
+	def watch(self):
+		while self.callbacks:
+			for pin in list(self.callbacks):
+				level = self.level(pin)
+				old   = self.levels.get(pin)
+				if old is None or level == old: continue
+				for i in range(self.chatter):
+					self.change(pin, level)
+					time.sleep(self.CHATTER_TIME)
+					self.change(pin, old)
+					time.sleep(self.CHATTER_TIME)
+				self.change(pin, level)
+			time.sleep(self.WATCH_TIME)
+		self.watcher = None
+
+
+# Adafruit_ADS1x15: single-shot conversions block for one sample period,
+# like the real part, so the ADC thread's pacing is realistic.  In
+# continuous mode (start_adc) a conversion completes every sample period
+# and get_last_result() returns the latest without waiting.  Each call
+# also costs an I2C transfer.  'busy' totals the time callers were held.
+class FakeADS1015(object):
+	feed = None
+	I2C_TIME = 0.0003 # Seconds per register transfer at 100 kHz
+
+	def __init__(self, address=0x48, busnum=None):
+		self.channel = None # Converting continuously, if not None
+		self.busy       = 0.0
+
+	def sample(self, channel):
+		v = self.feed.adc(self.feed.t(), self.feed.rng)[channel]
+		return int(v * 1649)
+
+	def wait(self, seconds):
+		time.sleep(seconds)
+		self.busy += seconds
+
+	def read_adc(self, channel, gain=1, data_rate=None):
+		self.wait(1.0 / (data_rate or 1600) + self.I2C_TIME)
+		return self.sample(channel)
+
+	def start_adc(self, channel, gain=1, data_rate=None):
+		self.wait(1.0 / (data_rate or 1600) + self.I2C_TIME) # First one
+		self.channel = channel
+		return self.sample(channel)
+
+	def get_last_result(self):
+		if self.channel is None: return 0
+		self.wait(self.I2C_TIME)
+		return self.sample(self.channel)
+
+	def stop_adc(self):
+		self.channel = None
+
+
+# pyserial, for the camera port: the camera's own line protocol (see
+# uart.py) written down a pipe at its frame rate, so select() and reads
+# on fileno() behave as with a real port.  Writing "B" switches it to
+# binary frames and "A" back, as the camera does (see camproto.py).
+class FakeSerial(object):
+	feed = None
+	fps  = 30.0
+
+	def __init__(self, port=None, baudrate=9600, timeout=None, **kwargs):
+		self.port     = port
+		self.baudrate = baudrate
+		self.timeout  = timeout
+		self.binary   = False
+		self.seq      = 0
+		self.writes   = None # Set to a list to log frame write times
+		self.rfd, self.wfd = os.pipe()
+		writer = threading.Thread(target=self.camera)
+		writer.daemon = True
+		writer.start()
+
+	def camera(self):
+		next = time.time()
+		while self.wfd is not None:
+			try:
+				os.write(self.wfd, cameraFrame(self.feed, self.fps,
+				  self.seq if self.binary else None))
+			except (OSError, TypeError): # Closed
+				return
+			if self.writes is not None: self.writes.append(time.time())
+			self.seq += 1
+			next += 1.0 / self.fps
+			time.sleep(max(0.0, next - time.time()))
+
+	def fileno(self):
+		return self.rfd
+
+	def read(self, size=1):
+		return os.read(self.rfd, size)
+
+	def readline(self):
+		line = ""
+		while not line.endswith("\n"):
+			c = os.read(self.rfd, 1)
+			if not c: break
+			line += c
+		return line
+
+	def write(self, data):
+		if "B" in data: self.binary = True
+		if "A" in data: self.binary = False
+		return len(data)
+
+	def reset_input_buffer(self): pass
+
+	def close(self):
+		wfd, self.wfd = self.wfd, None
+		if wfd is not None: os.close(wfd)
+		os.close(self.rfd)
+
+
+# The reading end of a FakeSerial in another process, which passes down
+# its pipe's fd: the real uart.py reads the camera feed from it (bench.py
+# --uart), the frames being written, and timed, in the parent.
+class InheritedSerial(FakeSerial):
+	fd = None
+
+	def __init__(self, port=None, baudrate=9600, timeout=None, **kwargs):
+		self.port     = port
+		self.baudrate = baudrate
+		self.timeout  = timeout
+		self.binary   = False
+		self.rfd      = self.fd
+		self.wfd      = None
+
+
+# One frame of the camera's output: light level, a blob at the target
+# (position 0.0 to 1.0, as uart.py maps back to degrees) if there is one,
+# and its frame rate.  ASCII lines, or a binary frame if given a sequence
+# number.
+def cameraFrame(feed, fps, seq=None):
+	t      = feed.t()
+	target = feed.target(t, feed.rng)
+	lux    = feed.lux(t, feed.rng)
+	blobs  = []
+	if target:
+		blobs.append(((target[0] + 30.0) / 60.0,
+		  (30.0 - target[1]) / 60.0, 400))
+	if seq is not None:
+		import camproto
+		return camproto.encodeFrame(seq, lux, fps, blobs)
+	lines = "lux:%f\r\n" % lux
+	for blob in blobs:
+		lines += "blob:x=%f:y=%f:s=%d\r\n" % blob
+	return lines + "fps:%f\r\n" % fps
+
+
+class FakeKeyboard(object):
+	def read(self): return -1
+	def close(self): pass
+
+
+class FakeModule(object):
+	pass
+
+
+# Install stand-ins in sys.modules (and pi3d's keyboard), and redirect
+# the eye scripts' launch of uart.py to the scripted feed below.
+def install(scenario, seed=None):
+	feed = Feed(scenario, seed)
+
+	gpio = FakeGPIO(feed)
+	rpi  = FakeModule()
+	rpi.GPIO = gpio
+	sys.modules["RPi"]      = rpi
+	sys.modules["RPi.GPIO"] = gpio
+
+	FakeADS1015.feed = feed
+	ads = FakeModule()
+	ads.ADS1015 = ads.ADS1115 = FakeADS1015
+	sys.modules["Adafruit_ADS1x15"] = ads
+
+	FakeSerial.feed = feed
+	ser = FakeModule()
+	ser.Serial = FakeSerial
+	sys.modules["serial"] = ser
+
+	import pi3d
+	pi3d.Keyboard = FakeKeyboard
+
+	popen = subprocess.Popen
+	def fakePopen(args, *more, **kwargs):
+		if (isinstance(args, (list, tuple)) and
+		  os.path.basename(args[0]) == "uart.py"):
+			args = [sys.executable, os.path.abspath(__file__), "uart",
+			  scenario, str(seed)]
+		return popen(args, *more, **kwargs)
+	subprocess.Popen = fakePopen
+	return feed
+
+
+# Stand-in for uart.py: writes "x,y,lux,fps" lines as it does, at the
+# camera's frame rate.
+def runUart(scenario, seed, fps=30.0):
+	feed = Feed(scenario, seed)
+	next = time.time()
+	while True:
+		t = feed.t()
+		target = feed.target(t, feed.rng)
+		x, y = target if target else (None, None)
+		sys.stdout.write("%s,%s,%s,%s\n" % (x, y, feed.lux(t, feed.rng),
+		  fps))
+		sys.stdout.flush()
+		next += 1.0 / fps
+		time.sleep(max(0.0, next - time.time()))
+
+
+# The real uart.py, its serial port being inherited fd 'fd'
+def runUartScript(fd):
+	import runpy
+	InheritedSerial.fd = fd
+	ser = FakeModule()
+	ser.Serial = InheritedSerial
+	sys.modules["serial"] = ser
+	sys.argv = ["uart.py"]
+	runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	  "uart.py"), run_name="__main__")
+
+
+if __name__ == "__main__":
+	if len(sys.argv) == 3 and sys.argv[1] == "uartpy":
+		try:
+			runUartScript(int(sys.argv[2]))
+		except (IOError, KeyboardInterrupt): # Reader went away
+			pass
+	elif len(sys.argv) >= 3 and sys.argv[1] == "uart":
+		seed = None
+		if len(sys.argv) > 3 and sys.argv[3] != "None":
+			seed = int(sys.argv[3])
+		try:
+			runUart(sys.argv[2], seed)
+		except (IOError, KeyboardInterrupt): # Reader went away
+			pass
+	else:
+		print "usage: fakehw.py uart <scenario> [seed] | uartpy <fd>"
+		print "scenarios: %s" % ", ".join(sorted(SCENARIOS))
@@ -0,0 +1,134 @@
+import itertools
+import json
+import os
+import signal
+import threading
+import time
+
+try:
+	from thread import get_ident
+except ImportError:
+	from _thread import get_ident
+
+# Frame stage tracer.  Code wraps the stages worth seeing (input polling,
+# mesh regen, draw, buffer swap, the uart and ADC threads) in
+#
+#   with tracer.span("name"):
+#
+# and when tracing is on, each span is recorded into a fixed-size ring
+# buffer (oldest spans overwritten; nothing allocated per span beyond the
+# context object).  When it's off, span() hands back one shared do-nothing
+# object, so the cost is a method call and an attribute test.  dump()
+# writes the buffer as Chrome trace-event JSON, which loads straight into
+# chrome://tracing or ui.perfetto.dev.
+#
+# Tracing can be toggled from outside a running process: after
+# installSignal(), SIGUSR1 starts tracing, and the next SIGUSR1 stops it
+# and dumps to trace-<pid>-<n>.json.
+
+TRACE_SIZE = 65536 # Spans kept; oldest are overwritten
+
+
+class NullSpan(object):
+	__slots__ = ()
+	def __enter__(self): return self
+	def __exit__(self, *exc): return False
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+	__slots__ = ("tracer", "name", "start")
+
+	def __init__(self, tracer, name):
+		self.tracer = tracer
+		self.name   = name
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.tracer.record(self.name, self.start, time.time())
+		return False
+
+
+class FrameTracer(object):
+	def __init__(self, size=TRACE_SIZE):
+		self.size    = size
+		self.names   = [None] * size
+		self.starts  = [0.0] * size
+		self.ends    = [0.0] * size
+		self.threads = [0] * size
+		self.counter = itertools.count() # next() is atomic under the GIL
+		self.count   = 0
+		self.enabled = False
+		self.dumps   = 0
+		self.dumpDir = "."
+
+	def span(self, name):
+		if not self.enabled: return NULL_SPAN
+		return Span(self, name)
+
+	def record(self, name, start, end):
+		n = next(self.counter)
+		i = n % self.size
+		self.names[i]   = name
+		self.starts[i]  = start
+		self.ends[i]    = end
+		self.threads[i] = get_ident()
+		self.count      = n + 1
+
+	def start(self):
+		self.counter = itertools.count()
+		self.count   = 0
+		self.enabled = True
+
+	def stop(self):
+		self.enabled = False
+
+	# Spans in buffer, oldest first, as trace-event dicts
+	def events(self):
+		n      = min(self.count, self.size)
+		first  = self.count - n
+		pid    = os.getpid()
+		events = []
+		for k in range(first, first + n):
+			i = k % self.size
+			if self.names[i] is None: continue
+			events.append({ "name": self.names[i], "ph": "X",
+			  "ts": self.starts[i] * 1e6,
+			  "dur": (self.ends[i] - self.starts[i]) * 1e6,
+			  "pid": pid, "tid": self.threads[i] })
+		for t in threading.enumerate():
+			events.append({ "name": "thread_name", "ph": "M", "pid": pid,
+			  "tid": t.ident, "args": { "name": t.name } })
+		return events
+
+	def dump(self, fileName):
+		with open(fileName, "w") as f:
+			json.dump({ "traceEvents": self.events(),
+			  "displayTimeUnit": "ms" }, f)
+
+	# SIGUSR1 handler: toggle tracing, dumping when it's switched off
+	def toggle(self, signum=None, frame=None):
+		if not self.enabled:
+			self.start()
+			return
+		self.stop()
+		self.dumps += 1
+		fileName = os.path.join(self.dumpDir, "trace-%d-%d.json" % (
+		  os.getpid(), self.dumps))
+		try:
+			self.dump(fileName)
+			print "frame trace written to %s\r" % fileName
+		except (IOError, OSError) as e:
+			print "frame trace not written: %s\r" % e
+
+	def installSignal(self, signum=signal.SIGUSR1, dumpDir="."):
+		self.dumpDir = dumpDir
+		signal.signal(signum, self.toggle)
+
+
+# One tracer shared by the frame loop and its threads
+tracer = FrameTracer()
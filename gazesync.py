@@ -0,0 +1,284 @@
+#!/usr/bin/python
+
+import argparse
+import collections
+import json
+import math
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+# Gaze sync for installations with several eye units.  One unit (or a
+# headless controller) runs the gaze/blink/pupil state machine and
+# multicasts its result, a few dozen bytes, at a fixed rate; every other
+# unit renders that instead of its own random motion.  Multicast means
+# the sender's bandwidth is the same for one receiver or fifty, and
+# receivers never send anything, so there's no per-node cost anywhere.
+#
+# Clocks aren't assumed to agree.  Each receiver takes the smallest
+# (arrival time - send time) seen recently as the offset between sender
+# and local clock (that's the offset plus the fastest network transit),
+# then plays packets back a fixed delay behind that, interpolating
+# between the two packets either side of the playback time.  Since all
+# receivers play the same sender timeline at the same delay, they show
+# the same state at the same instant, to within network jitter.
+
+SYNC_GROUP   = "239.255.42.99"
+SYNC_PORT    = 5005
+SYNC_RATE    = 60    # Packets per second from sender
+SYNC_DELAY   = 0.05  # Playback delay at receivers, seconds
+SYNC_TIMEOUT = 1.0   # No packets for this long = not synced
+SYNC_MAGIC   = b"PEGZ"
+SYNC_VERSION = 1
+
+# magic, version, flags (unused, 0), sequence number, send time (sender
+# clock, seconds), gaze X, gaze Y, pupil scale, then eyelid weights for
+# left upper, left lower, right upper, right lower.  44 bytes.
+PACKET = struct.Struct("<4sBBHdfffffff")
+
+GazeState = collections.namedtuple("GazeState", "x y pupil lids")
+
+
+# Multicast socket.  iface is the local address of the interface to use
+# (e.g. "127.0.0.1" to test on one machine), None for the default.
+def syncSocket(group, port, iface, receive):
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+	  socket.IPPROTO_UDP)
+	ifaddr = socket.inet_aton(iface or "0.0.0.0")
+	if receive:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		if hasattr(socket, "SO_REUSEPORT"): # Several receivers on one host
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		sock.bind(("", port))
+		sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+		  socket.inet_aton(group) + ifaddr)
+	else:
+		sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+		sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+		if iface:
+			sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, ifaddr)
+	return sock
+
+
+class GazeSender(object):
+	def __init__(self, group=SYNC_GROUP, port=SYNC_PORT, rate=SYNC_RATE,
+	  iface=None):
+		self.sock     = syncSocket(group, port, iface, False)
+		self.dest     = (group, port)
+		self.interval = 1.0 / rate
+		self.next     = 0.0
+		self.seq      = 0
+		self.sent     = 0
+		self.errors   = 0
+
+	# Call every frame with current state; only sends when the next
+	# packet is due, so the rate doesn't depend on frame rate.  Returns
+	# True if a packet went out.
+	def send(self, now, x, y, pupil, lids):
+		if now < self.next: return False
+		self.next += self.interval
+		if self.next < now: self.next = now + self.interval # Stalled
+		data = PACKET.pack(SYNC_MAGIC, SYNC_VERSION, 0, self.seq, now,
+		  x, y, pupil, *lids)
+		self.seq = (self.seq + 1) & 0xFFFF
+		try:
+			self.sock.sendto(data, self.dest)
+			self.sent += 1
+		except socket.error: # Network down, etc.; receivers will time out
+			self.errors += 1
+		return True
+
+	def stats(self):
+		return "%d sent, %d errors" % (self.sent, self.errors)
+
+
+class GazeReceiver(threading.Thread):
+	def __init__(self, group=SYNC_GROUP, port=SYNC_PORT, delay=SYNC_DELAY,
+	  iface=None, window=128):
+		super(GazeReceiver, self).__init__()
+		self.sock     = syncSocket(group, port, iface, True)
+		self.sock.settimeout(0.5)
+		self.delay    = delay
+		self.lock     = threading.Lock()
+		self.samples  = collections.deque(maxlen=16) # (send time, state)
+		self.offsets  = collections.deque(maxlen=window)
+		self.offset   = None
+		self.lastSeq  = None
+		self.lastRecv = 0.0
+		self.received = 0
+		self.lost     = 0  # Sequence gaps
+		self.late     = 0  # Duplicate or out-of-order, discarded
+		self.bad      = 0  # Wrong size, magic or version
+		self.running  = True
+
+	def run(self):
+		while self.running:
+			try:
+				data, addr = self.sock.recvfrom(256)
+			except socket.timeout:
+				continue
+			except socket.error:
+				time.sleep(0.1)
+				continue
+			self.receive(data, time.time())
+
+	# Handle one packet arriving at local time 'now'
+	def receive(self, data, now):
+		if len(data) != PACKET.size:
+			self.bad += 1
+			return
+		fields = PACKET.unpack(data)
+		if fields[0] != SYNC_MAGIC or fields[1] != SYNC_VERSION:
+			self.bad += 1
+			return
+		seq, sendTime = fields[3], fields[4]
+		state = GazeState(fields[5], fields[6], fields[7], fields[8:12])
+		with self.lock:
+			if self.lastSeq is not None:
+				d = (seq - self.lastSeq) & 0xFFFF
+				if d == 0 or d >= 0x8000:
+					self.late += 1
+					return
+				self.lost += d - 1
+			self.lastSeq  = seq
+			self.lastRecv = now
+			self.received += 1
+			self.samples.append((sendTime, state))
+			# Minimum over a window rather than all time, so drift or a
+			# step in either clock is picked up again within a few secs.
+			self.offsets.append(now - sendTime)
+			self.offset = min(self.offsets)
+
+	# State to show at local time 'now', or None if no recent packets
+	# (caller falls back to its own state machine).
+	def state(self, now):
+		with self.lock:
+			if not self.samples or now - self.lastRecv > SYNC_TIMEOUT:
+				return None
+			t = now - self.offset - self.delay # Playback time, sender clock
+			t1, s1 = self.samples[-1]
+			if t >= t1: return s1 # Ran out of packets; hold last
+			for t0, s0 in reversed(self.samples):
+				if t0 <= t: break
+				t1, s1 = t0, s0
+			else:
+				return s1 # Older than anything buffered
+		if t1 <= t0: return s1
+		a = (t - t0) / (t1 - t0)
+		return GazeState(s0.x + (s1.x - s0.x) * a,
+		  s0.y + (s1.y - s0.y) * a,
+		  s0.pupil + (s1.pupil - s0.pupil) * a,
+		  tuple(l0 + (l1 - l0) * a for l0, l1 in zip(s0.lids, s1.lids)))
+
+	def stats(self):
+		return ("%d received, %d lost, %d late, %d bad, offset %.4f s" % (
+		  self.received, self.lost, self.late, self.bad, self.offset or 0.0))
+
+
+# Test controller: eyes.py-like random saccades, blinks and pupil drift,
+# so receivers can be exercised without a display.
+def testState(now, rng, st):
+	if now >= st["until"]:
+		if st["moving"]:
+			st["x0"], st["y0"] = st["x1"], st["y1"]
+			st["until"] = now + rng.uniform(0.1, 1.1)
+		else:
+			st["x1"] = rng.uniform(-30.0, 30.0)
+			n        = math.sqrt(900.0 - st["x1"] * st["x1"])
+			st["y1"] = rng.uniform(-n, n)
+			st["dur"]   = rng.uniform(0.075, 0.175)
+			st["until"] = now + st["dur"]
+		st["start"]  = now
+		st["moving"] = not st["moving"]
+	x, y = st["x0"], st["y0"]
+	if st["moving"]:
+		s = (now - st["start"]) / st["dur"]
+		s = 3.0 * s * s - 2.0 * s * s * s
+		x += (st["x1"] - st["x0"]) * s
+		y += (st["y1"] - st["y0"]) * s
+	if now >= st["blink"] + 4.0: st["blink"] = now + rng.uniform(0.0, 4.0)
+	b = max(0.0, 1.0 - abs(now - st["blink"]) / 0.1)
+	t = min(max(0.4 - y / 60.0, 0.0), 1.0)
+	pupil = 0.5 + 0.4 * math.sin(now * 0.7)
+	upper = t + b * (1.0 - t)
+	lower = (1.0 - t) + b * t
+	return x, y, pupil, (upper, lower, upper, lower)
+
+
+def runSender(args):
+	sender = GazeSender(args.group, args.port, args.rate, args.iface)
+	rng    = random.Random(args.seed)
+	st     = { "x0": 0.0, "y0": 0.0, "x1": 0.0, "y1": 0.0, "dur": 0.1,
+	           "start": 0.0, "until": 0.0, "moving": False, "blink": 0.0 }
+	end    = time.time() + args.seconds if args.seconds else None
+	while end is None or time.time() < end:
+		now = time.time()
+		x, y, pupil, lids = testState(now, rng, st)
+		sender.send(now, x, y, pupil, lids)
+		time.sleep(max(0.0, sender.next - time.time()))
+	print >> sys.stderr, "sender: %s" % sender.stats()
+
+
+# Receive for a while; print stats and gaze X sampled on a 0.1 s grid of
+# local time as JSON, so several receivers can be compared.
+def runReceiver(args):
+	receiver = GazeReceiver(args.group, args.port, args.delay, args.iface)
+	receiver.daemon = True
+	receiver.start()
+	grid = {}
+	end  = time.time() + (args.seconds or 1e12)
+	t    = math.ceil(time.time() * 10.0) / 10.0
+	while t < end:
+		time.sleep(max(0.0, t - time.time()))
+		s = receiver.state(t)
+		if s is not None: grid["%.1f" % t] = round(s.x, 4)
+		t += 0.1
+	receiver.running = False
+	print json.dumps({ "stats": receiver.stats(), "x": grid })
+
+
+# One sender, several receiver processes, all on loopback; reports the
+# worst disagreement in gaze X between any two receivers.
+def runLoopback(args):
+	cmd = [sys.executable, __file__, "--iface", "127.0.0.1",
+	  "--port", str(args.port), "--group", args.group]
+	procs = [subprocess.Popen(cmd + ["recv", "--seconds",
+	  str(args.seconds)], stdout=subprocess.PIPE)
+	  for i in range(args.nodes)]
+	time.sleep(0.5)
+	args.seconds -= 1.0
+	args.iface = "127.0.0.1"
+	runSender(args)
+	results = [json.loads(p.communicate()[0]) for p in procs]
+	worst, common = 0.0, 0
+	for key in results[0]["x"]:
+		xs = [r["x"][key] for r in results if key in r["x"]]
+		if len(xs) == len(results):
+			common += 1
+			worst   = max(worst, max(xs) - min(xs))
+	for i, r in enumerate(results): print "node %d: %s" % (i, r["stats"])
+	print "%d common samples, max gaze X spread %.4f deg" % (common, worst)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Gaze sync test tool")
+	parser.add_argument("--group", default=SYNC_GROUP)
+	parser.add_argument("--port", type=int, default=SYNC_PORT)
+	parser.add_argument("--iface", default=None,
+	  help="local interface address, e.g. 127.0.0.1")
+	parser.add_argument("--rate", type=float, default=SYNC_RATE)
+	parser.add_argument("--delay", type=float, default=SYNC_DELAY)
+	parser.add_argument("--seed", type=int, default=None)
+	parser.add_argument("--seconds", type=float, default=0)
+	parser.add_argument("--nodes", type=int, default=4)
+	parser.add_argument("mode", choices=("send", "recv", "loopback"))
+	args = parser.parse_args()
+	if args.mode == "send": runSender(args)
+	elif args.mode == "recv": runReceiver(args)
+	else:
+		if not args.seconds: args.seconds = 5.0
+		runLoopback(args)
@@ -0,0 +1,131 @@
+import hashlib
+import math
+import numpy as np
+import os
+from gfxutil import *
+
+# Parsing the eye SVG (minidom), sampling its paths (svg.path) and scaling
+# the results is a sizable chunk of cold boot, and the output only depends
+# on the SVG contents, the point counts and the eye size.  loadGeometry()
+# stores everything derived from the SVG in a .npz file keyed on those, so
+# a warm start is a single np.load() and never imports either library.
+
+GEOMETRY_VERSION = 1 # Bump if the stored contents change
+
+# Paths pulled from the eye SVG: (id, number of points, closed, reverse)
+EYE_PATHS = (
+	("pupilMin"      , 32, True , True ),
+	("pupilMax"      , 32, True , True ),
+	("iris"          , 32, True , True ),
+	("scleraFront"   ,  0, False, False),
+	("scleraBack"    ,  0, False, False),
+	("upperLidClosed", 33, False, True ),
+	("upperLidOpen"  , 33, False, True ),
+	("upperLidEdge"  , 33, False, False),
+	("lowerLidClosed", 33, False, False),
+	("lowerLidOpen"  , 33, False, False),
+	("lowerLidEdge"  , 33, False, False))
+
+# Paths whose Z depth / angle (see zangle()) are needed at startup
+ZANGLE_PATHS = ("iris", "scleraFront", "scleraBack")
+
+
+# Parse SVG file and compute all derived geometry.  Returns a dict with
+# one (N,2) float32 array per path id, scaled to eyeRadius, plus "vb",
+# the three regen thresholds and "<id>Zangle" (z, angle) tuples.
+# regenPixels is the geometry change below which meshes aren't rebuilt
+# (0.25 for eyes.py's 4x4 sampling, 0.5 for cyclops.py's 2x2).
+def compileGeometry(svgFile, eyeRadius, regenPixels, paths=EYE_PATHS):
+	from xml.dom.minidom import parse
+	dom  = parse(svgFile)
+	vb   = getViewBox(dom)
+	geom = { "vb": vb }
+	for id, numPoints, closed, reverse in paths:
+		pts = getPointsArray(dom, id, numPoints, closed, reverse)
+		scalePoints(pts, vb, eyeRadius)
+		geom[id] = pts
+
+	# Regenerating flexible object geometry (such as eyelids during
+	# blinks, or iris during pupil dilation) is CPU intensive, can
+	# noticably slow things down, especially on single-core boards.  To
+	# reduce this load somewhat, determine a size change threshold below
+	# which regeneration will not occur; roughly equal to regenPixels.
+
+	# Determine change in pupil size to trigger iris geometry regen
+	irisRegenThreshold = 0.0
+	a = pointsBounds(geom["pupilMin"]) # Bounds of pupil at min size
+	b = pointsBounds(geom["pupilMax"]) # " at max size
+	maxDist = max(abs(a[0] - b[0]), abs(a[1] - b[1]), # Max distance of
+	              abs(a[2] - b[2]), abs(a[3] - b[3])) # variance on edges
+	# maxDist is motion range in pixels as pupil scales between 0.0
+	# and 1.0.  1.0 / maxDist is one pixel's worth of scale range.
+	if maxDist > 0: irisRegenThreshold = regenPixels / maxDist
+	geom["irisRegenThreshold"] = irisRegenThreshold
+
+	# Determine change in eyelid values needed to trigger geometry regen.
+	# This is done a little differently than the pupils...instead of
+	# bounds, the distance between the middle points of the open and
+	# closed eyelid paths is evaluated, then similar threshold determined.
+	for lid in ("upperLid", "lowerLid"):
+		openPts   = geom[lid + "Open"]
+		closedPts = geom[lid + "Closed"]
+		p1 = openPts[len(openPts) // 2]
+		p2 = closedPts[len(closedPts) // 2]
+		dx = float(p2[0] - p1[0])
+		dy = float(p2[1] - p1[1])
+		d  = dx * dx + dy * dy
+		threshold = 0.0
+		if d > 0: threshold = regenPixels / math.sqrt(d)
+		geom[lid + "RegenThreshold"] = threshold
+
+	for id in ZANGLE_PATHS:
+		if id in geom: geom[id + "Zangle"] = zangle(geom[id], eyeRadius)
+
+	return geom
+
+
+# Cache file name for a given set of inputs.  SVG is hashed by contents,
+# not name or mtime, so an edited file is always recompiled.
+def geometryCacheFile(svgFile, eyeRadius, regenPixels, paths, cacheDir):
+	h = hashlib.sha1()
+	with open(svgFile, "rb") as f: h.update(f.read())
+	h.update(repr((GEOMETRY_VERSION, float(eyeRadius), float(regenPixels),
+	  tuple(paths))).encode("utf-8"))
+	base = os.path.splitext(os.path.basename(svgFile))[0]
+	return os.path.join(cacheDir, "%s-%s.npz" % (base, h.hexdigest()[:16]))
+
+
+# Return geometry dict as from compileGeometry(), loading it from cacheDir
+# if a matching compiled file exists, else compiling it and saving there.
+# cacheDir of None disables the cache.  A corrupt or unreadable cache file
+# is not fatal, it just means a cold start.
+def loadGeometry(svgFile, eyeRadius, regenPixels, cacheDir,
+  paths=EYE_PATHS):
+	if cacheDir is None:
+		return compileGeometry(svgFile, eyeRadius, regenPixels, paths)
+
+	fileName = geometryCacheFile(svgFile, eyeRadius, regenPixels, paths,
+	  cacheDir)
+	try:
+		data = np.load(fileName)
+		geom = {}
+		for key in data.files:
+			value = data[key]
+			if value.ndim == 2: geom[key] = value # Point list
+			elif value.ndim == 1: geom[key] = tuple(float(v) for v in value)
+			else: geom[key] = float(value)
+		data.close()
+		return geom
+	except (IOError, OSError, ValueError, KeyError):
+		pass
+
+	geom = compileGeometry(svgFile, eyeRadius, regenPixels, paths)
+	try:
+		if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+		tmpName = fileName + ".tmp"
+		with open(tmpName, "wb") as f:
+			np.savez(f, **dict((k, np.asarray(v)) for k, v in geom.items()))
+		os.rename(tmpName, fileName) # Atomic; never leave a partial file
+	except (IOError, OSError):
+		pass # Read-only filesystem, etc.; cache is just an optimization
+	return geom
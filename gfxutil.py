@@ -1,6 +1,8 @@
+import ctypes
 import pi3d
 import math
-from svg.path import Path, parse_path
+import numpy as np
+from pi3d.constants import opengles, GL_ARRAY_BUFFER
 
 # Get artboard bounds (to use Illustrator terminology) from SVG DOM tree:
 def getViewBox(root):
@@ -15,8 +17,11 @@ def getViewBox(root):
 	return None
 
 
-# Search for and return a specific path (by name) in SVG DOM tree:
+# Search for and return a specific path (by name) in SVG DOM tree.
+# svg.path is only imported here, so code loading precompiled geometry
+# (see geomcache.py) never pays for it.
 def getPath(root, id):
+	from svg.path import parse_path
 	for node in root.childNodes:
 		if node.nodeType == node.ELEMENT_NODE:
 			p = getPath(node, id)
@@ -49,9 +54,27 @@ def getPoints(root, id, numPoints, closed, reverse):
 	return pathToPoints(getPath(root, id), numPoints, closed, reverse)
 
 
+# Convert a 2D point list (as returned by getPoints()) to a contiguous
+# (N,2) float32 NumPy array.  The point functions below check for arrays
+# and take a vectorized path for them; plain lists of tuples still work
+# the old way (cyclops.py relies on that).
+def pointsArray(points):
+	return np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 2)
+
+
+# Combo wrapper for pointsArray(getPoints(...))
+def getPointsArray(root, id, numPoints, closed, reverse):
+	return pointsArray(getPoints(root, id, numPoints, closed, reverse))
+
+
 # Scale a given 2D point list by normalizing to a given view box (returned
 # by getViewBox()) then expanding to a given size centered on (0,0).
+# Lists and arrays are both modified in place.
 def scalePoints(p, vb, radius):
+	if isinstance(p, np.ndarray):
+		p[:,0] = ((p[:,0] - vb[0]) / vb[2] - 0.5) * radius *  2.0
+		p[:,1] = ((p[:,1] - vb[1]) / vb[3] - 0.5) * radius * -2.0
+		return
 	for i, pt in enumerate(p): # Each point in path
 		xx = ((p[i][0] - vb[0]) / vb[2] - 0.5) * radius *  2.0
 		yy = ((p[i][1] - vb[1]) / vb[3] - 0.5) * radius * -2.0
@@ -65,6 +88,11 @@ def scalePoints(p, vb, radius):
 def pointsInterp(points1, points2, p2weight):
 	if   p2weight < 0.0: p2weight = 0.0
 	elif p2weight > 1.0: p2weight = 1.0
+	if isinstance(points1, np.ndarray):
+		n = min(len(points1), len(points2))
+		if n < 1: return None
+		p1 = points1[:n]
+		return p1 + (points2[:n] - p1) * np.float32(p2weight)
 	p1weight = 1.0 - p2weight
 	points   = []
 	np1      = len(points1)
@@ -80,6 +108,10 @@ def pointsInterp(points1, points2, p2weight):
 
 # Return bounding rect of 2D point list
 def pointsBounds(points):
+	if isinstance(points, np.ndarray):
+		lo = points.min(axis=0)
+		hi = points.max(axis=0)
+		return [float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])]
 	b = [ points[0][0], points[0][1], points[0][0], points[0][1] ]
 	n = len(points)
 	for p in range(1, n):
@@ -90,29 +122,91 @@ def pointsBounds(points):
 	return b # 4-element list: min X, min Y, max X, max Y
 
 
-# This function rotates a model 90 degrees on the X axis and applies an
-# offset to the texture map's U axis.  pi3d.Lathe() operates around the Y
-# axis, but the eyes need symmetry around the Z axis and applying that
-# transformation along with the eye rotation produced undesirable motion
-# paths.  This is a hacky workaround.  It messes around with some pi3d
-# data structures that it probably shouldn't, and could break with future
-# releases of that code.
-# vertices = buf[0,1,2]
-# normals = buf[3,4,5]
-# tex_coords = buf[6,7,8]
-def reAxis(shape, texOffset):
-	buf = shape.buf[0].array_buffer
-	for i, v in enumerate(buf):
-		# Rotate vertex
-		tmp        = buf[i][1]
-		buf[i][1]  = buf[i][2]
-		buf[i][2]  = -tmp
-		# Rotate normal
-		tmp        = buf[i][4]
-		buf[i][4]  = buf[i][5]
-		buf[i][5]  = -tmp
-		# Offset texture map on U axis
-		buf[i][6] += texOffset
+# 2D profile of the sclera for latheArrays(): an arc of the eye's radius
+# from angle1 off the front of the Z axis to angle2 off the back (degrees,
+# from zangle() of the scleraFront and scleraBack paths).
+def scleraPoints(angle1, angle2, radius, numPoints):
+	aRange = 180 - angle1 - angle2
+	a = np.radians((90 - angle1) - aRange * np.arange(numPoints) /
+	  float(numPoints - 1))
+	return np.column_stack((np.cos(a), np.sin(a))) * radius
+
+
+# Lathe a 2D profile (as passed to pi3d.Lathe()) around an axis, producing
+# the same vertices, normals, texture coordinates and faces as pi3d's
+# Shape._lathe() would, except rotated 90 degrees on the X axis: pi3d's
+# lathe operates around the Y axis, but the eyes need symmetry around the
+# Z axis, and applying that transformation along with the eye rotation
+# produced undesirable motion paths.  Everything is computed as whole
+# arrays in the final orientation, rather than building a Lathe and
+# swapping components in its buffer afterward.  Returns (verts, norms,
+# tex, idx); tex has no U offset applied, see latheInit().
+def latheArrays(path, sides):
+	path  = np.asarray(path, dtype=np.float64)
+	rows  = len(path)
+	px    = path[:,0].reshape(-1, 1)
+	py    = path[:,1].reshape(-1, 1)
+	r     = np.arange(sides + 1)
+	theta = ((math.pi / sides) * 2.0) * r # As pi3d, last column = seam
+	sinr  = np.sin(theta).reshape(1, -1)
+	cosr  = np.cos(theta).reshape(1, -1)
+
+	# As in pi3d: each ring's normal comes from the unit vector from the
+	# previous profile point (none for the first), and texture V is the
+	# distance along the profile as a fraction of its length
+	d      = np.zeros_like(path)
+	d[1:]  = np.diff(path, axis=0)
+	seg    = np.sqrt(d[:,0] ** 2 + d[:,1] ** 2)
+	d     /= np.where(seg > 0.0, seg, 1.0).reshape(-1, 1)
+	dx     = d[:,0].reshape(-1, 1)
+	dy     = d[:,1].reshape(-1, 1)
+	length = np.cumsum(seg)
+	tcy    = (np.cumsum(seg / length[-1])).reshape(-1, 1)
+
+	# Lathe vertex (x*sin, y, x*cos) becomes (x*sin, x*cos, -y), and
+	# likewise normal (-sin*dy, dx, -cos*dy) becomes (-sin*dy, -cos*dy, -dx)
+	verts = np.empty((rows, sides + 1, 3), dtype=np.float32)
+	verts[:,:,0] = px * sinr
+	verts[:,:,1] = px * cosr
+	verts[:,:,2] = -py
+	norms = np.empty((rows, sides + 1, 3), dtype=np.float32)
+	norms[:,:,0] = -sinr * dy
+	norms[:,:,1] = -cosr * dy
+	norms[:,:,2] = -dx
+
+	tex = np.empty((rows, sides + 1, 2), dtype=np.float32)
+	tex[:,:,0] = 1.0 - (1.0 / sides) * r.reshape(1, -1)
+	tex[:,:,1] = tcy
+
+	pp  = (np.arange(rows - 1) * (sides + 1)).reshape(-1, 1) + r[:-1]
+	pn  = pp + sides + 1
+	idx = np.empty((rows - 1, sides, 2, 3), dtype=np.int32)
+	idx[:,:,0,0] = pp + 1
+	idx[:,:,0,1] = pp
+	idx[:,:,0,2] = pn
+	idx[:,:,1,0] = pn
+	idx[:,:,1,1] = pn + 1
+	idx[:,:,1,2] = pp + 1
+
+	return (verts.reshape(-1, 3), norms.reshape(-1, 3), tex.reshape(-1, 2),
+	  idx.reshape(-1, 3))
+
+
+# Make shape from latheArrays() output.  The same arrays can be passed for
+# several shapes (e.g. both eyes) with only the texture map's U axis
+# offset differing.
+def latheInit(arrays, uOffset):
+	verts, norms, tex, idx = arrays
+	if uOffset != 0:
+		tex = tex.copy()
+		tex[:,0] += uOffset
+
+	shape = pi3d.Shape(None, None, "lathe", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+	  1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+	shape.buf = []
+	shape.buf.append(pi3d.Buffer(shape, verts, tex, idx, norms, False))
+
+	return shape
 
 
 
@@ -136,6 +230,20 @@ def reAxis(shape, texOffset):
 # If it's an eyelid, add an extra row with V=0.0
 
 def meshInit(uSteps, vSteps, closed, uOffset, vOffset, lid):
+	verts, tex, idx, norms = meshArrays(uSteps, vSteps, closed,
+	  uOffset, vOffset, lid)
+
+	shape = pi3d.Shape(None, None, "foo", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+	  1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+	shape.buf = []
+	shape.buf.append(pi3d.Buffer(shape, verts, tex, idx, norms, False))
+
+	return shape
+
+
+# Vertex, texture coordinate, index and normal lists for meshInit() and
+# DynamicMesh, same arguments as those.
+def meshArrays(uSteps, vSteps, closed, uOffset, vOffset, lid):
 	verts = []
 	tex   = []
 	idx   = []
@@ -166,12 +274,36 @@ def meshInit(uSteps, vSteps, closed, uOffset, vOffset, lid):
  			idx.append((s+uSteps, s         , s+1     ))
  			idx.append((s+1     , s+uSteps+1, s+uSteps))
 
-	shape = pi3d.Shape(None, None, "foo", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
-	  1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
-	shape.buf = []
-	shape.buf.append(pi3d.Buffer(shape, verts, tex, idx, norms, False))
-
-	return shape
+	return verts, tex, idx, norms
+
+
+# meshInit() shape for geometry that's replaced at runtime (irises and
+# eyelids).  Faces, texture coordinates and normals never change after
+# init, so instead of re_init(), which converts its input and re-sends the
+# whole buffer each time, update() writes new positions into the existing
+# float32 vertex array in place and sends only the vertex range given, via
+# glBufferSubData.  Pass it the (N,3) arrays from pointsMesh().
+class DynamicMesh(pi3d.Shape):
+	def __init__(self, uSteps, vSteps, closed, uOffset, vOffset, lid):
+		super(DynamicMesh, self).__init__(None, None, "dynamic",
+		  0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+		verts, tex, idx, norms = meshArrays(uSteps, vSteps, closed,
+		  uOffset, vOffset, lid)
+		self.buf = [pi3d.Buffer(self, verts, tex, idx, norms, False)]
+		# Interleaved x,y,z, nx,ny,nz, u,v per vertex, kept for the
+		# life of the shape; positions are columns 0-2
+		self.vertices = self.buf[0].array_buffer
+
+	def update(self, pts, offset=0):
+		n = len(pts)
+		self.vertices[offset:offset + n, 0:3] = pts
+		buf = self.buf[0]
+		if not buf.opengl_loaded: return # First draw() sends it all
+		stride = self.vertices.strides[0]
+		buf._select()
+		opengles.glBufferSubData(GL_ARRAY_BUFFER, offset * stride,
+		  n * stride, ctypes.c_void_p(self.vertices.ctypes.data +
+		  offset * stride))
 
 
 # Generate mesh between two point lists. U axis steps are determined
@@ -183,6 +315,10 @@ def pointsMesh(points0, points1, points2, steps, z, closed, flip=False):
 	if np2 < np1: np1 = np2
 	if np1 < 1  : return None
 
+	if isinstance(points1, np.ndarray):
+		return pointsMeshArray(points0, points1[:np1], points2[:np1],
+		  steps, z, flip)
+
 	verts = []
 
 	if flip is True:
@@ -209,6 +345,34 @@ def pointsMesh(points0, points1, points2, steps, z, closed, flip=False):
 	return verts
 
 
+# Array flavor of pointsMesh(), used when it's passed NumPy point arrays.
+# All V steps are interpolated at once (one broadcast over a (steps,1,1)
+# weight column) and written straight into a contiguous (rows*cols,3)
+# float32 vertex array, in the same order the list version produces.
+def pointsMeshArray(points0, points1, points2, steps, z, flip=False):
+	n     = len(points1)
+	w     = np.linspace(0.0, 1.0, steps).astype(np.float32).reshape(-1, 1, 1)
+	rows  = points1 + (points2 - points1) * w # (steps, n, 2)
+	first = 0 if points0 is None else len(points0)
+	verts = np.empty((first + steps * n, 3), dtype=np.float32)
+
+	if points0 is not None:
+		verts[:first,0:2] = points0
+		verts[:first,2]   = 0
+	verts[first:,0:2] = rows.reshape(-1, 2)
+	verts[first:,2]   = z
+
+	if flip is True:
+		# Mirror on X and reverse point order within each row
+		if points0 is not None:
+			verts[:first] = verts[:first][::-1].copy()
+		body = verts[first:].reshape(steps, n, 3)
+		body[:] = body[:,::-1].copy()
+		verts[:,0] *= -1.0
+
+	return verts
+
+
 # This function determines the Z depth and angle-from-Z axis of an SVG
 # feature (ostensibly a circle, polygonalized by getPoints()); for example,
 # the depth of the iris, or the start and end angles for the curve that's
@@ -0,0 +1,114 @@
+import collections
+import threading
+import time
+
+# Button input by edge detection.  The eye scripts used to call
+# GPIO.input() on each button pin, several times a frame, and a tap that
+# started and ended between two frames was never seen.  ButtonInput
+# registers an edge callback on every pin instead and keeps the state of
+# all buttons as a bitmask (bit i = pins[i]); frame() takes one snapshot
+# of it per frame, which costs no GPIO calls at all.
+#
+# - Presses are latched: a button pressed since the last snapshot shows
+#   as down in the next one (ButtonSnapshot.down()) even if it has since
+#   been released.  isHeld() is the state right now.
+# - Debouncing is done here, not by RPi.GPIO's bouncetime, which drops
+#   any edge within that time of the last one -- including the final one
+#   of a short tap, leaving the button stuck down.  Each callback reads
+#   the pin, so the held state always settles on the real level; contact
+#   chatter only can't count as a new press within BOUNCE of the button's
+#   last change either way (a press, or chatter on release).
+# - Pins edge detection can't be set up on (some kernels refuse) are read
+#   with GPIO.input() at each snapshot, as before.
+#
+# Buttons are active low with the pull-ups on, as on the Snake Eyes
+# Bonnet.  tests/test_gpioinput.py taps a fake button (fakehw.py) between
+# frames and checks what polling and edge detection each see.
+
+BOUNCE = 0.02 # Seconds after a press or release before a press counts
+
+
+class ButtonSnapshot(collections.namedtuple("ButtonSnapshot",
+  "held pressed stamps time")):
+	__slots__ = ()
+
+	# Held now, or pressed since the last snapshot
+	def down(self, i):
+		return bool((self.held | self.pressed) >> i & 1)
+
+	def isHeld(self, i):
+		return bool(self.held >> i & 1)
+
+
+class ButtonInput(object):
+	# pins: GPIO pin numbers (BCM), -1 for a button that isn't fitted
+	def __init__(self, gpio, pins, bounce=BOUNCE):
+		self.gpio    = gpio
+		self.pins    = tuple(pins)
+		self.bounce  = bounce
+		self.lock    = threading.Lock()
+		self.bits    = {}
+		self.held    = 0
+		self.pressed = 0 # Latched since last snapshot
+		self.stamps  = [None] * len(self.pins) # Time of last press
+		self.changes = [None] * len(self.pins) # ...and of press or release
+		self.polled  = [] # (bit, pin) without edge detection
+		self.edges   = 0
+		self.presses = 0
+		for i, pin in enumerate(self.pins):
+			if pin < 0: continue
+			gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+			self.bits[pin] = i
+			if gpio.input(pin) == gpio.LOW: self.held |= 1 << i
+			try:
+				gpio.add_event_detect(pin, gpio.BOTH, callback=self.edge)
+			except (RuntimeError, AttributeError):
+				self.polled.append((i, pin))
+
+	# RPi.GPIO's callback thread, on either edge
+	def edge(self, pin):
+		i    = self.bits[pin]
+		bit  = 1 << i
+		down = self.gpio.input(pin) == self.gpio.LOW
+		now  = time.time()
+		with self.lock:
+			self.edges += 1
+			if not down:
+				if self.held & bit: self.changes[i] = now
+				self.held &= ~bit
+			elif not self.held & bit:
+				self.held |= bit
+				last = self.changes[i]
+				self.changes[i] = now
+				if last is None or now - last >= self.bounce:
+					self.pressed   |= bit
+					self.stamps[i]  = now
+					self.presses   += 1
+
+	def snapshot(self, now=None):
+		if now is None: now = time.time()
+		for i, pin in self.polled:
+			bit = 1 << i
+			with self.lock:
+				if self.gpio.input(pin) == self.gpio.LOW:
+					if not self.held & bit:
+						self.pressed  |= bit
+						self.stamps[i] = now
+					self.held |= bit
+				else:
+					self.held &= ~bit
+		with self.lock:
+			snap = ButtonSnapshot(self.held, self.pressed,
+			  tuple(self.stamps), now)
+			self.pressed = 0
+		return snap
+
+	def close(self):
+		for pin in self.bits:
+			if (self.bits[pin], pin) not in self.polled:
+				self.gpio.remove_event_detect(pin)
+
+	def stats(self):
+		return "%d edges, %d presses, %d of %d pins polled" % (self.edges,
+		  self.presses, len(self.polled), len(self.bits))
+
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pi3d
+from gfxutil import *
+
+# GPU keyframe deformation.  Eyelids only ever blend between their open
+# and closed paths, and the iris between its min and max pupil paths, so
+# rather than rebuilding those meshes on the CPU, both keyframes are
+# uploaded once and blended in a vertex shader (shaders/uv_keyframe.vs).
+# A blink or pupil change is then a uniform update, no mesh regen at all.
+# Only core GLSL ES 1.00 / GLSL 1.20 is used, so this runs the same on
+# the Pi's VideoCore as under Mesa's llvmpipe software renderer.
+#
+# Each vertex carries its weight 0.0 position in 'vertex' and its weight
+# 1.0 position in normal.xy; normal.z selects between a low and a high
+# weight, which lets one mesh span a sweep between two weights the way
+# pointsMesh() does for eyelids.
+
+# Found next to this file, not relative to whatever directory the eye
+# script was started from
+KEYFRAME_SHADER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  "shaders", "uv_keyframe")
+
+# Float offset of unif[16] in a Shape's uniform array; unif[16] through
+# unif[19] are left free by pi3d for custom shaders.
+KEYFRAME_UNIF = 48
+
+
+# Shader with keyframe blending, otherwise same lighting as uv_light
+def keyframeShader():
+	return pi3d.Shader(KEYFRAME_SHADER)
+
+
+# Mesh with same layout and texture mapping as a DynamicMesh of the given
+# dimensions, but whose geometry is fixed at init.  'keyframes' is a tuple
+# from irisKeyframes() or lidKeyframes(): (N,3) vertex arrays at weights
+# 0.0 and 1.0, and the per-vertex low/high weight selector.
+class KeyframeMesh(pi3d.Shape):
+	def __init__(self, keyframes, uSteps, vSteps, closed, uOffset, vOffset,
+	  lid):
+		super(KeyframeMesh, self).__init__(None, None, "keyframe",
+		  0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+		mesh0, mesh1, rowWeights = keyframes
+		verts, tex, idx, norms = meshArrays(uSteps, vSteps, closed,
+		  uOffset, vOffset, lid)
+		norms = np.column_stack((mesh1[:,0:2], rowWeights))
+		self.buf = [pi3d.Buffer(self, mesh0, tex, idx, norms, False)]
+
+	# Set weight range; vertices with row weight 0.0 get the lesser
+	# weight, 1.0 the greater (order of arguments doesn't matter).
+	def setWeights(self, weight1, weight2):
+		if weight2 < weight1: weight1, weight2 = weight2, weight1
+		self.set_custom_data(KEYFRAME_UNIF, [weight1, weight2, 0.0])
+
+
+# Keyframes for iris mesh as made by pointsMesh(None, pupil, irisPts, ...)
+# with the pupil interpolated between pupilMinPts and pupilMaxPts.  Each
+# row of that mesh is linear in the pupil weight, so it's exactly a blend
+# of the meshes at the two extremes.  Use setWeights(p, p).
+def irisKeyframes(pupilMinPts, pupilMaxPts, irisPts, steps, z):
+	pupilMinPts = pointsArray(pupilMinPts)
+	pupilMaxPts = pointsArray(pupilMaxPts)
+	irisPts     = pointsArray(irisPts)
+	mesh0 = pointsMesh(None, pupilMinPts, irisPts, steps, z, True)
+	mesh1 = pointsMesh(None, pupilMaxPts, irisPts, steps, z, True)
+	return mesh0, mesh1, np.ones(len(mesh0), dtype=np.float32)
+
+
+# Keyframes for eyelid mesh as made by pointsMesh(edgePts, lo, hi, ...)
+# where lo and hi are the lid interpolated between open and closed at
+# two weights.  Row v of the lid sits at weight lo + (hi - lo) * v / (steps
+# - 1), so its row weight is v / (steps - 1); the edge row doesn't move.
+# Use setWeights(lo, hi).
+def lidKeyframes(openPts, closedPts, edgePts, steps, flip=False):
+	openPts   = pointsArray(openPts)
+	closedPts = pointsArray(closedPts)
+	edgePts   = pointsArray(edgePts)
+	mesh0 = pointsMesh(edgePts, openPts, openPts, steps, 0, False, flip)
+	mesh1 = pointsMesh(edgePts, closedPts, closedPts, steps, 0, False, flip)
+	n     = min(len(openPts), len(closedPts))
+	rows  = np.repeat(np.linspace(0.0, 1.0, steps), n)
+	rowWeights = np.concatenate((np.zeros(len(edgePts)), rows))
+	return mesh0, mesh1, rowWeights.astype(np.float32)
+
+
+# What the vertex shader computes, on the CPU: positions for keyframes
+# and weights as above.  Not used for drawing; handy for checking the
+# keyframes against pointsMesh() output without a GL context.
+def keyframeBlend(mesh0, mesh1, rowWeights, weight1, weight2):
+	if weight2 < weight1: weight1, weight2 = weight2, weight1
+	w = (weight1 + (weight2 - weight1) * rowWeights).reshape(-1, 1)
+	out = mesh0.copy()
+	out[:,0:2] = mesh0[:,0:2] + (mesh1[:,0:2] - mesh0[:,0:2]) * w
+	return out
@@ -0,0 +1,205 @@
+import collections
+import json
+import math
+import os
+import platform
+import time
+import numpy as np
+from gfxutil import *
+
+# Level of detail.  Mesh resolution used to be fixed (32-point iris, 33-
+# point eyelids, 4 and 5 V steps, 24x64 sclera) whatever the screen size
+# or board.  Here it comes from a table of levels, each coarser one
+# thinning the SVG point lists and cutting the V steps and sclera rings:
+#
+# - levelForRadius() gives the coarsest level that still looks the same at
+#   a given eye size (no iris/lid edge segment over SEGMENT_PIXELS long);
+# - calibrate() times each level's per-frame CPU work (iris and eyelid
+#   regen) on this board, and the finest level within REGEN_BUDGET of a
+#   frame is picked; the result is saved per board model so later boots
+#   skip the benchmark (chooseLevel() does both);
+# - LodController steps down at runtime while frames are over budget and
+#   back up (never past the startup choice) once there's headroom again.
+#
+# Level 0 is the original resolution.  Point lists are thinned by taking
+# every Nth point, keeping the end points (for closed paths the last point
+# repeats the first, so loops stay closed), and the mid points used by the
+# regen thresholds stay where they were.
+
+LodLevel = collections.namedtuple("LodLevel",
+  "pointStep irisSteps lidSteps scleraPoints scleraSides")
+
+LOD_LEVELS = (
+  LodLevel(1, 4, 5, 24, 64), # 32-point iris, 33-point lids
+  LodLevel(2, 3, 4, 16, 48), # 16, 17
+  LodLevel(4, 2, 3, 12, 32)) # 8, 9
+
+LOD_VERSION    = 1    # Bump if LOD_LEVELS or calibration changes
+SEGMENT_PIXELS = 10.0 # Longest acceptable edge segment, screen pixels
+SUPERSAMPLE    = 4    # Framebuffer pixels per screen pixel (fbx2 4x4 area)
+REGEN_BUDGET   = 0.25 # Share of frame period allowed for mesh regen
+LOD_PROFILES   = "lod-profiles.json" # In cache dir
+
+# Runtime control: exponential average of frame work time against the
+# frame period, with separate thresholds and hold times for stepping down
+# (quick, it's visible as stutter) and up (slow, to avoid flapping).  If
+# a step up has to be undone soon after, the hold time before trying
+# again doubles, up to UP_BACKOFF times.
+DOWN_LOAD   = 0.95 # Over this share of period = overloaded
+UP_LOAD     = 0.60 # Under this = headroom
+DOWN_FRAMES = 30
+UP_FRAMES   = 600
+UP_BACKOFF  = 16
+EMA_WEIGHT  = 0.1
+
+
+# Every 'step'th point of a path, plus the last point
+def decimate(pts, step):
+	if step <= 1: return pts
+	out = pts[::step]
+	if (len(pts) - 1) % step:
+		out = np.vstack((out, pts[-1:]))
+	return np.ascontiguousarray(out)
+
+
+# Coarsest level whose outline segments stay under SEGMENT_PIXELS once
+# fbx2 has scaled the framebuffer down to the screens; segment length is
+# taken from the eye's circumference, the outer bound for the iris and
+# eyelid paths.
+def levelForRadius(eyeRadius, irisPoints=32):
+	segment = 2.0 * math.pi * eyeRadius / (irisPoints * SUPERSAMPLE)
+	best    = 0
+	for i, lod in enumerate(LOD_LEVELS):
+		if segment * lod.pointStep <= SEGMENT_PIXELS:
+			best = i
+	return best
+
+
+# Board model, e.g. "Raspberry Pi 3 Model B Rev 1.2"; CPU type elsewhere
+def boardModel():
+	try:
+		with open("/proc/device-tree/model") as f:
+			return f.read().rstrip("\0\n")
+	except (IOError, OSError):
+		return platform.machine() or "unknown"
+
+
+# Per-frame regen work for one level, in seconds: one iris and four
+# eyelid meshes built from scratch (no mesh tables), averaged over
+# 'repeat' runs.  geom is a dict as from geomcache.loadGeometry().
+def regenCost(geom, level, repeat=20):
+	lod = LOD_LEVELS[level]
+	s   = lod.pointStep
+	pupilMin = decimate(geom["pupilMin"], s)
+	pupilMax = decimate(geom["pupilMax"], s)
+	iris     = decimate(geom["iris"], s)
+	lids     = [[decimate(geom[lid + part], s) for part in
+	  ("Open", "Closed", "Edge")] for lid in ("upperLid", "lowerLid")]
+	begin = time.time()
+	for r in range(repeat):
+		w = (r + 0.5) / repeat
+		pointsMesh(None, pointsInterp(pupilMin, pupilMax, w), iris,
+		  lod.irisSteps, 0, True)
+		for openPts, closedPts, edgePts in lids + lids:
+			pointsMesh(edgePts, pointsInterp(openPts, closedPts, w),
+			  pointsInterp(openPts, closedPts, w * 0.9), lod.lidSteps, 0,
+			  False)
+	return (time.time() - begin) / repeat
+
+
+# Time every level and return (finest level within budget at fps, never
+# finer than 'finest'; list of costs)
+def calibrate(geom, fps, finest=0):
+	budget = REGEN_BUDGET / fps
+	costs  = [regenCost(geom, level) for level in range(len(LOD_LEVELS))]
+	for level in range(finest, len(LOD_LEVELS)):
+		if costs[level] <= budget: return level, costs
+	return len(LOD_LEVELS) - 1, costs
+
+
+# Level to start at for this eye size, frame rate and board: from the
+# saved profile if there is one for the same inputs, else radius limit +
+# calibration, saved to cacheDir (None = always calibrate, don't save).
+def chooseLevel(geom, eyeRadius, fps, cacheDir):
+	finest = levelForRadius(eyeRadius)
+	key    = "%s|r%d|%gfps|v%d" % (boardModel(), eyeRadius, fps,
+	  LOD_VERSION)
+	fileName = os.path.join(cacheDir, LOD_PROFILES) if cacheDir else None
+	profiles = {}
+	if fileName:
+		try:
+			with open(fileName) as f: profiles = json.load(f)
+			return int(profiles[key]["level"])
+		except (IOError, OSError, ValueError, KeyError, TypeError):
+			if not isinstance(profiles, dict): profiles = {} # Not ours
+
+	level, costs = calibrate(geom, fps, finest)
+	if fileName:
+		profiles[key] = { "level": level, "radiusLevel": finest,
+		  "regenMs": [round(c * 1000.0, 3) for c in costs] }
+		try:
+			if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+			tmpName = fileName + ".tmp"
+			with open(tmpName, "w") as f:
+				json.dump(profiles, f, indent=1, sort_keys=True)
+			os.rename(tmpName, fileName)
+		except (IOError, OSError):
+			pass # Just calibrates again next time
+	return level
+
+
+class LodController(object):
+	# 'level' is the starting level and also the finest allowed
+	def __init__(self, level, fps):
+		self.finest   = level
+		self.level    = level
+		self.period   = 1.0 / fps
+		self.load     = None
+		self.over     = 0
+		self.under    = 0
+		self.upFrames = UP_FRAMES
+		self.since    = 0 # Frames since last change
+		self.wentUp   = False
+		self.steps    = 0
+
+	# Feed this frame's work time (seconds, excluding pacing sleep and
+	# time blocked in the buffer swap, which on a vsync-locked display
+	# fills the rest of the period whatever the load); returns new level
+	# to switch to, or None to stay.
+	def update(self, frameTime):
+		self.since += 1
+		if self.since <= 2: return None # Includes the rebuild itself
+		load = frameTime / self.period
+		if self.load is None: self.load = load
+		else: self.load += (load - self.load) * EMA_WEIGHT
+
+		if self.load > DOWN_LOAD:
+			self.over += 1
+			self.under = 0
+		elif self.load < UP_LOAD:
+			self.under += 1
+			self.over  = 0
+		else:
+			self.over = self.under = 0
+
+		if self.over >= DOWN_FRAMES and self.level < len(LOD_LEVELS) - 1:
+			if self.wentUp and self.since < self.upFrames:
+				self.upFrames = min(self.upFrames * 2,
+				  UP_FRAMES * UP_BACKOFF)
+			return self.change(self.level + 1, False)
+		if self.under >= self.upFrames and self.level > self.finest:
+			return self.change(self.level - 1, True)
+		return None
+
+	def change(self, level, up):
+		self.level  = level
+		self.load   = None # Rebuild frame isn't representative
+		self.over   = self.under = 0
+		self.since  = 0
+		self.wentUp = up
+		self.steps += 1
+		return level
+
+	def stats(self):
+		return "level %d (finest %d), %d changes" % (self.level,
+		  self.finest, self.steps)
@@ -0,0 +1,167 @@
+import numpy as np
+from collections import OrderedDict
+from gfxutil import *
+
+# Precomputed geometry for the flexible parts of the eye.  Regenerating
+# eyelid meshes every time a weight moves is most of the per-frame CPU
+# load during blinks; these tables trade a little memory for that work,
+# so a regen becomes a lookup of an already-built vertex array.
+
+
+# Mirror a mesh made by pointsMesh() for the other eye: reverse the point
+# order within each row of 'cols' vertices and negate X.  Same result as
+# passing flip=True to pointsMesh(), but from an existing vertex array.
+def mirrorMesh(verts, cols):
+	out = np.ascontiguousarray(verts.reshape(-1, cols, 3)[:,::-1])
+	out[:,:,0] *= -1.0
+	return out.reshape(-1, 3)
+
+
+# Eyelid meshes keyed by the (lower, upper) pair of lid weights, each
+# quantized to 'quantum' (the 1/4 pixel regen threshold computed in
+# eyes.py).  Only the unflipped mesh is built from the point lists; the
+# mirrored version for the other eye is derived from the same entry the
+# first time it's asked for.  Total size is capped at maxBytes, least
+# recently used pairs are evicted first.
+class LidMeshCache(object):
+	def __init__(self, openPts, closedPts, edgePts, steps, quantum,
+	  maxBytes):
+		self.openPts   = openPts
+		self.closedPts = closedPts
+		self.edgePts   = edgePts
+		self.steps     = steps
+		self.cols      = min(len(openPts), len(closedPts))
+		if quantum <= 0: quantum = 1.0 / 1024
+		self.quantum   = quantum
+		self.levels    = int(round(1.0 / quantum))
+		self.maxBytes  = maxBytes
+		self.bytes     = 0
+		self.entries   = OrderedDict()
+		self.hits      = 0
+		self.misses    = 0
+		self.evictions = 0
+
+	# Weight (0.0 to 1.0) to table index
+	def quantize(self, weight):
+		q = int(round(weight / self.quantum))
+		if   q < 0          : q = 0
+		elif q > self.levels: q = self.levels
+		return q
+
+	def build(self, q1, q2):
+		w1 = min(q1 * self.quantum, 1.0)
+		w2 = min(q2 * self.quantum, 1.0)
+		p1 = pointsInterp(self.openPts, self.closedPts, w1)
+		p2 = pointsInterp(self.openPts, self.closedPts, w2)
+		return pointsMesh(self.edgePts, p1, p2, self.steps, 0, False)
+
+	def evict(self):
+		while self.bytes > self.maxBytes and len(self.entries) > 1:
+			key, entry = self.entries.popitem(last=False)
+			for mesh in entry:
+				if mesh is not None: self.bytes -= mesh.nbytes
+			self.evictions += 1
+
+	# Return vertex array for lid swept between two weights (order
+	# doesn't matter; the mesh always runs from lesser to greater, as
+	# the regen code in eyes.py does).  flip=True for the right eye.
+	def mesh(self, weight1, weight2, flip=False):
+		q1  = self.quantize(weight1)
+		q2  = self.quantize(weight2)
+		key = (q1, q2) if q1 <= q2 else (q2, q1)
+		entry = self.entries.pop(key, None)
+		if entry is None:
+			self.misses += 1
+			entry        = [self.build(key[0], key[1]), None]
+			self.bytes  += entry[0].nbytes
+		else:
+			self.hits += 1
+		self.entries[key] = entry # (Re)insert as most recently used
+		if flip is True:
+			if entry[1] is None:
+				entry[1]    = mirrorMesh(entry[0], self.cols)
+				self.bytes += entry[1].nbytes
+			mesh = entry[1]
+		else:
+			mesh = entry[0]
+		self.evict()
+		return mesh
+
+	# Fill table at startup with every pair of weights up to 'span'
+	# quantization steps apart (the small per-frame moves of eyelid
+	# tracking), both eyes' versions, stopping if the memory cap is hit.
+	def prebuild(self, span):
+		for d in range(span + 1):
+			for q in range(self.levels + 1 - d):
+				if (q, q + d) in self.entries: continue
+				mesh  = self.build(q, q + d)
+				entry = [mesh, mirrorMesh(mesh, self.cols)]
+				size  = mesh.nbytes * 2
+				if self.bytes + size > self.maxBytes: return
+				self.entries[(q, q + d)] = entry
+				self.bytes += size
+
+	def stats(self):
+		return "%d hits, %d misses, %d evictions, %d entries, %d KB" % (
+		  self.hits, self.misses, self.evictions, len(self.entries),
+		  self.bytes / 1024)
+
+
+# Iris meshes indexed by pupil scale, quantized to 'quantum' (the iris
+# regen threshold).  Unlike the eyelids there's only one weight involved,
+# so the whole range from pupilMinPts to pupilMaxPts is small enough to
+# build up front; a pupil change is then an index into a list.  Point
+# lists or arrays are accepted (cyclops.py still uses lists).  Lookups
+# landing on the same entry as the previous one are counted as skips,
+# since the mesh already on the GPU is still correct.
+class IrisMeshCache(object):
+	def __init__(self, pupilMinPts, pupilMaxPts, irisPts, steps, z,
+	  quantum, prebuild=True):
+		self.pupilMinPts = pointsArray(pupilMinPts)
+		self.pupilMaxPts = pointsArray(pupilMaxPts)
+		self.irisPts     = pointsArray(irisPts)
+		self.steps       = steps
+		self.z           = z
+		if quantum <= 0: quantum = 1.0 / 1024
+		self.quantum     = quantum
+		self.levels      = int(round(1.0 / quantum))
+		self.meshes      = [None] * (self.levels + 1)
+		self.last        = -1
+		self.hits        = 0
+		self.misses      = 0
+		self.skips       = 0
+		if prebuild is True:
+			for q in range(self.levels + 1):
+				self.meshes[q] = self.build(q)
+
+	def quantize(self, p):
+		q = int(round(p / self.quantum))
+		if   q < 0          : q = 0
+		elif q > self.levels: q = self.levels
+		return q
+
+	def build(self, q):
+		interPupil = pointsInterp(self.pupilMinPts, self.pupilMaxPts,
+		  q * self.quantum)
+		return pointsMesh(None, interPupil, self.irisPts, self.steps,
+		  self.z, True)
+
+	# Return iris vertex array for pupil scale p (0.0 to 1.0), or None
+	# if it's the same mesh as returned last time (nothing to upload).
+	def mesh(self, p):
+		q = self.quantize(p)
+		if q == self.last:
+			self.skips += 1
+			return None
+		self.last = q
+		m = self.meshes[q]
+		if m is None:
+			self.misses += 1
+			m = self.meshes[q] = self.build(q)
+		else:
+			self.hits += 1
+		return m
+
+	def stats(self):
+		return "%d hits, %d misses, %d skips, %d levels" % (
+		  self.hits, self.misses, self.skips, self.levels + 1)
@@ -0,0 +1,142 @@
+import heapq
+import numpy as np
+
+# Multi-target tracking for the thermal camera's blobs.  uart.py used to
+# take the largest blob of each frame as the gaze target, so the eyes
+# jumped whenever two people swapped size rank (or one blob flickered
+# larger for a frame).  MultiTracker keeps tracks with persistent IDs
+# across frames instead:
+#
+# - association: squared distances between every track and every blob
+#   in one NumPy broadcast, then greedy nearest-neighbour matching
+#   (closest pair first) within GATE.  That's the same answer as an
+#   optimal (Hungarian) assignment while people stay further apart than
+#   they move in a frame, which is the usual case, at a fraction of the
+#   cost.  Closer than that (two blobs passing within a frame's movement
+#   of each other) greedy can take the wrong pair first and swap IDs
+#   where the optimal assignment wouldn't;
+# - ageing: a track is confirmed after CONFIRM_HITS frames matched, and
+#   dropped after MAX_MISSES frames in a row unmatched;
+# - focus (the one the eyes look at): held for at least DWELL_MIN
+#   seconds, then handed to a clearly larger track (SWITCH_RATIO) if
+#   there is one, or to the largest other track after DWELL_MAX seconds
+#   so the eyes look around a group; a new focus is picked as soon as
+#   the current one is dropped.
+#
+# Blobs per frame are capped at MAX_BLOBS (largest kept) and tracks at
+# MAX_TRACKS, so work per frame is bounded however noisy the camera.
+# Positions are camera frame fractions (0.0 to 1.0), as the blobs have.
+
+GATE         = 0.15 # Max blob movement per frame, frame fractions
+CONFIRM_HITS = 2
+MAX_MISSES   = 5
+DWELL_MIN    = 1.0  # Seconds
+DWELL_MAX    = 6.0  # Seconds (0 = stay on focus while it lasts)
+SWITCH_RATIO = 2.0  # Size advantage to take focus after DWELL_MIN
+SIZE_WEIGHT  = 0.3  # Smoothing of track size, 0-1 (1 = latest only)
+MAX_BLOBS    = 32
+MAX_TRACKS   = 64
+
+
+class Track(object):
+	__slots__ = ("id", "x", "y", "size", "hits", "misses", "born")
+
+	def __init__(self, id, x, y, size, now):
+		self.id     = id
+		self.x      = x
+		self.y      = y
+		self.size   = size
+		self.hits   = 1
+		self.misses = 0
+		self.born   = now
+
+	# Position as a gaze target in degrees, mapped as uart.py always has
+	def degrees(self):
+		return (self.x * 60.0 - 30.0, -(self.y * 60.0 - 30.0))
+
+
+class MultiTracker(object):
+	def __init__(self, gate=GATE, confirmHits=CONFIRM_HITS,
+	  maxMisses=MAX_MISSES, dwellMin=DWELL_MIN, dwellMax=DWELL_MAX,
+	  switchRatio=SWITCH_RATIO):
+		self.gate        = gate
+		self.confirmHits = confirmHits
+		self.maxMisses   = maxMisses
+		self.dwellMin    = dwellMin
+		self.dwellMax    = dwellMax
+		self.switchRatio = switchRatio
+		self.tracks      = []
+		self.nextId      = 1
+		self.focus       = None # Track being looked at
+		self.focusSince  = 0.0
+		self.switches    = 0
+
+	# One camera frame's blobs (dicts with x, y and s, as uart.py's
+	# parser gives) seen at time 'now'; returns the focus track, or None
+	def update(self, blobs, now):
+		if len(blobs) > MAX_BLOBS:
+			blobs = heapq.nlargest(MAX_BLOBS, blobs,
+			  key=lambda b: b.get('s', 0))
+		tracks  = self.tracks
+		matched = [False] * len(blobs)
+
+		for t in tracks: t.misses += 1
+		if tracks and blobs:
+			tp = np.array([(t.x, t.y) for t in tracks])
+			bp = np.array([(b['x'], b['y']) for b in blobs])
+			d  = ((tp[:, None, :] - bp[None, :, :]) ** 2).sum(axis=2)
+			ti, bi = np.nonzero(d <= self.gate * self.gate)
+			for k in np.argsort(d[ti, bi], kind="mergesort"):
+				t = tracks[ti[k]]
+				j = bi[k]
+				if t.misses == 0 or matched[j]: continue
+				b          = blobs[j]
+				t.x        = b['x']
+				t.y        = b['y']
+				t.size    += (b.get('s', 0) - t.size) * SIZE_WEIGHT
+				t.hits    += 1
+				t.misses   = 0
+				matched[j] = True
+
+		tracks[:] = [t for t in tracks if t.misses <= self.maxMisses]
+		for j, b in enumerate(blobs):
+			if matched[j] or len(tracks) >= MAX_TRACKS: continue
+			tracks.append(Track(self.nextId, b['x'], b['y'], b.get('s', 0),
+			  now))
+			self.nextId += 1
+
+		return self.choose(now)
+
+	def confirmed(self):
+		return [t for t in self.tracks if t.hits >= self.confirmHits]
+
+	# Dwell policy (see top)
+	def choose(self, now):
+		focus = self.focus
+		if focus is not None and focus not in self.tracks: focus = None
+		if focus is None:
+			candidates = self.confirmed()
+			if candidates:
+				focus = max(candidates, key=lambda t: t.size)
+		elif now - self.focusSince >= self.dwellMin:
+			others = [t for t in self.confirmed() if t is not focus]
+			if others:
+				largest = max(others, key=lambda t: t.size)
+				if (largest.size > focus.size * self.switchRatio or
+				  (self.dwellMax and
+				  now - self.focusSince >= self.dwellMax)):
+					focus = largest
+		if focus is not self.focus:
+			self.focus      = focus
+			self.focusSince = now
+			if focus is not None: self.switches += 1
+		return focus
+
+	# Confirmed tracks as (id, x, y, size), x and y in degrees
+	def snapshot(self):
+		return [(t.id,) + t.degrees() + (t.size,) for t in self.confirmed()]
+
+	def stats(self):
+		return "%d tracks (%d confirmed), %d ids, %d focus changes" % (
+		  len(self.tracks), len(self.confirmed()), self.nextId - 1,
+		  self.switches)
@@ -0,0 +1,104 @@
+import re
+import time
+
+# Frame pacing.  Left alone, the render loop draws as fast as it can, but
+# fbx2 only copies the framebuffer to the SPI screens at its own capped
+# rate (MAX_FPS_PI_1/MAX_FPS_PI_2 in fbx2.c); anything in between is
+# drawn and never shown, and on a single-core board that's CPU the UART
+# and ADC threads could have used.  FrameScheduler holds the loop to a
+# target rate with a fixed deadline per frame, sleeping off any time
+# left over, and counts the frames that overran.
+#
+# Deadlines are absolute (start + n * period), so sleep granularity
+# doesn't accumulate into drift.  If the buffer swap itself is blocking
+# for most of a frame period (swap locked to vsync at or below the
+# target rate), the display is already doing the pacing and no extra
+# sleep is added.  After a long stall the schedule restarts from now
+# rather than rushing out a burst of frames to catch up.
+
+FBX2_FPS_PI_1 = 30 # Same as MAX_FPS_PI_1 and MAX_FPS_PI_2 in fbx2.c
+FBX2_FPS_PI_2 = 60
+VSYNC_FRACTION = 0.75 # Swap blocking this much of a period = vsync paced
+LATE_FRACTION  = 0.10 # Frame this far past its deadline = missed
+
+
+# Frame rate fbx2 will copy at (when not given -f), using the same board
+# test as fbx2's boardType(): Pi 2 and later by mem_size in the kernel
+# command line, anything else is treated as a single-core Pi.
+def fbx2Fps():
+	try:
+		with open("/proc/cmdline") as f: cmdline = f.read()
+	except (IOError, OSError):
+		return FBX2_FPS_PI_1
+	m = re.search(r"mem_size=(0x[0-9a-fA-F]+|[0-9a-fA-F]+)", cmdline)
+	if m and int(m.group(1), 16) in (0x3F000000, 0x40000000):
+		return FBX2_FPS_PI_2
+	return FBX2_FPS_PI_1
+
+
+class FrameScheduler(object):
+	# targetFps of 0 matches fbx2's copy rate; negative disables pacing
+	# (frames are still counted)
+	def __init__(self, targetFps=0):
+		if not targetFps: targetFps = fbx2Fps()
+		self.fps      = targetFps
+		self.period   = 1.0 / targetFps if targetFps > 0 else 0.0
+		self.deadline = None
+		self.swapTime = 0.0
+		self.lastSwap = None
+		self.busy     = 0.0 # Last frame's time less pacing sleep
+		self.work     = 0.0 # ...and less time blocked in the swap
+		self.sleep    = 0.0
+		self.frames   = 0
+		self.missed   = 0
+		self.vsynced  = 0
+		self.slept    = 0.0
+		self.start    = time.time()
+
+	# Call in place of DISPLAY.loop_running() (or other swap function)
+	def swap(self, swapFunction):
+		t0 = time.time()
+		swapFunction()
+		now = time.time()
+		self.swapTime = now - t0
+		if self.lastSwap is not None:
+			self.busy = now - self.lastSwap - self.sleep
+			self.work = self.busy - self.swapTime
+		self.lastSwap = now
+		self.sleep    = 0.0
+		self.frames  += 1
+
+	# Then this, to wait out the rest of the frame period before starting
+	# the next frame (after the swap rather than before it, so inputs are
+	# read as late as possible).
+	def wait(self):
+		if not self.period: return
+		now = time.time()
+		if self.deadline is None:
+			self.deadline = now + self.period
+			return
+
+		late = now - self.deadline
+		if late > self.period * LATE_FRACTION:
+			self.missed += 1
+		if self.swapTime >= self.period * VSYNC_FRACTION:
+			# Swap did the waiting; next period runs from here
+			self.vsynced += 1
+			self.deadline = now + self.period
+		elif late > self.period:
+			# Stalled; resync instead of bursting to catch up
+			self.deadline = now + self.period
+		else:
+			if late < 0.0:
+				time.sleep(-late)
+				self.sleep  = -late
+				self.slept += -late
+			self.deadline += self.period
+
+	def stats(self):
+		elapsed = time.time() - self.start
+		if elapsed <= 0.0: elapsed = 1e-6
+		return ("target %g fps, %d frames (%.1f fps), %d missed, "
+		  "%d vsync paced, %.0f%% idle" % (self.fps, self.frames,
+		  self.frames / elapsed, self.missed, self.vsynced,
+		  100.0 * self.slept / elapsed))
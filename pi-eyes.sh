@@ -124,7 +124,7 @@ echo "Updating package index files..."
 apt-get update
 
 echo "Installing Python libraries..."
-apt-get install -y python-pip python-dev python-imaging python-smbus python-serial scipy
+apt-get install -y python-pip python-dev python-imaging python-smbus python-serial
 pip install numpy pi3d svg.path adafruit-ads1x15
 # smbus and ads1x15 Python libs are installed regardless whether ADC
 # is enabled; simplifies the Python code a little (no "uncomment this")
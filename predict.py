@@ -0,0 +1,129 @@
+# Latency-compensated target tracking.  By the time a camera target is
+# on screen it's stale several times over: the camera takes a frame
+# period to capture and send it, uart.py's smoothing adds its group delay
+# (1.5 camera frames for the 4-sample box filter), then the render loop
+# draws it, swaps, fbx2 copies it out, and the eyes ease towards it over
+# eyestate.py's 50 ms tracking move.  At ~10 camera frames/s that's a
+# couple of hundred milliseconds behind a walking person.
+#
+# TargetPredictor runs an alpha-beta filter (position and velocity) on
+# the timestamped targets, and each render frame extrapolates the
+# estimate forward by the whole delay: from when the scene was actually
+# captured to when the frame will actually be seen.  Gains, the latency
+# components and the limits on extrapolation can all be set per
+# deployment.
+
+ALPHA          = 0.6  # Position correction gain, 0-1
+BETA           = 0.2  # Velocity correction gain (stable below ~alpha)
+MAX_HORIZON    = 0.4  # Seconds; don't extrapolate further than this
+MAX_SPEED      = 200. # Degrees/s; velocity estimate clamp
+TIMEOUT        = 1.0  # Seconds without a target before track is dropped
+GAZE_LIMIT     = 30.0 # Degrees; eyestate.py's gaze range
+DISPLAY_FRAMES = 1.5  # Render frames from frame start to on screen
+EASE_TIME      = 0.05 # eyestate.py tracking move duration
+
+
+class TargetPredictor(object):
+	# sourceFrames: capture-to-arrival delay in camera frames (the
+	# camera's frame period is taken from its reported fps); sourceTime:
+	# fixed extra delay before arrival, seconds; displayTime: delay from
+	# predict() to on screen, seconds.
+	def __init__(self, sourceFrames=1.0, sourceTime=0.0, displayTime=0.0,
+	  alpha=ALPHA, beta=BETA, maxHorizon=MAX_HORIZON, maxSpeed=MAX_SPEED,
+	  timeout=TIMEOUT):
+		self.sourceFrames = sourceFrames
+		self.sourceTime   = sourceTime
+		self.displayTime  = displayTime
+		self.alpha        = alpha
+		self.beta         = beta
+		self.maxHorizon   = maxHorizon
+		self.maxSpeed     = maxSpeed
+		self.timeout      = timeout
+		self.time         = None # Arrival time of last observation in track
+		self.last         = None # ...and of last one seen at all
+		self.source       = 0.0  # Its capture-to-arrival delay
+		self.x = self.y   = 0.0
+		self.vx = self.vy = 0.0
+		self.tracks       = 0
+		self.observations = 0
+		self.target       = None # Last prediction
+		self.latency      = 0.0 # Last total delay compensated, seconds
+		self.latencySum   = 0.0
+		self.predictions  = 0
+
+	def reset(self):
+		self.time   = None
+		self.target = None
+
+	# New target (x, y) in degrees, arrived at time t; period is the
+	# camera's frame period in seconds (0 if unknown).  The same target
+	# may be passed again (e.g. once per render frame); it's only used
+	# once, going by t; returns True if it was new.
+	def observe(self, x, y, t, period=0.0):
+		if self.last is not None and t <= self.last: return False
+		self.last          = t
+		self.source        = self.sourceTime + self.sourceFrames * period
+		self.observations += 1
+		if self.time is None or t - self.time > self.timeout:
+			# New track
+			self.x, self.y   = x, y
+			self.vx = self.vy = 0.0
+			self.time        = t
+			self.tracks     += 1
+			return True
+		dt        = t - self.time
+		self.time = t
+		px        = self.x + self.vx * dt
+		py        = self.y + self.vy * dt
+		rx        = x - px
+		ry        = y - py
+		self.x    = px + self.alpha * rx
+		self.y    = py + self.alpha * ry
+		self.vx   = clamp(self.vx + self.beta * rx / dt, self.maxSpeed)
+		self.vy   = clamp(self.vy + self.beta * ry / dt, self.maxSpeed)
+		return True
+
+	# Target (x, y) as it should be when a frame started at 'now' is
+	# seen, or None if there's no current track; also kept as 'target'
+	def predict(self, now):
+		if self.time is None: return None
+		age = now - self.time
+		if age > self.timeout:
+			self.reset()
+			return None
+		horizon = self.source + age + self.displayTime
+		self.latency      = horizon
+		self.latencySum  += horizon
+		self.predictions += 1
+		if horizon > self.maxHorizon: horizon = self.maxHorizon
+		self.target = (clamp(self.x + self.vx * horizon, GAZE_LIMIT),
+		               clamp(self.y + self.vy * horizon, GAZE_LIMIT))
+		return self.target
+
+	# Once per render frame with the latest camera target: the target to
+	# look at, re-predicted only when a new observation arrives (so it
+	# doesn't move every frame), or None once the track has timed out
+	def update(self, x, y, t, period, now):
+		if self.observe(x, y, t, period): self.predict(now)
+		elif self.time is not None and now - self.time > self.timeout:
+			self.reset()
+		return self.target
+
+	def stats(self):
+		mean = self.latencySum / self.predictions if self.predictions else 0
+		return ("compensating %.0f ms (mean %.0f: source %.0f, display "
+		  "%.0f), %d tracks, %d observations" % (self.latency * 1000.0,
+		  mean * 1000.0, self.source * 1000.0, self.displayTime * 1000.0,
+		  self.tracks, self.observations))
+
+
+def clamp(value, limit):
+	if value < -limit: return -limit
+	if value > limit: return limit
+	return value
+
+
+# Display side delay for a render loop at 'fps': frame start to on screen
+# plus the eyes' easing towards the target
+def displayDelay(fps):
+	return DISPLAY_FRAMES / fps + EASE_TIME
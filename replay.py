@@ -0,0 +1,266 @@
+#!/usr/bin/python
+
+import argparse
+import random
+import runpy
+import struct
+import sys
+import time
+
+# Input recording and replay.  Everything the render loop takes from the
+# outside world -- the clock, camera targets/lux/fps and tracks, ADC
+# values, button snapshots, gaze sync state, mesh detail changes (which
+# depend on frame timing) and the random seed -- goes through one input
+# log's read(kind, fn):
+#
+#   Live      calls fn() and returns what it gives (the normal case)
+#   Recorder  likewise, and also writes it to a log file
+#   Player    returns what the log has instead, without calling fn()
+#
+# Reads are logged in the order they're made, and the render loop makes
+# the same reads in the same order given the same inputs, so a replay
+# goes exactly as the recorded run did, frame for frame and bit for bit
+# (values are kept as doubles), however fast or slow the machine it's on.
+# If the code under replay reads something different from the log the
+# replay stops with an error rather than carry on out of step.
+#
+# Log: header (magic "PERP", version), then one record per read: kind
+# (u8; high bit set = same value as last read of that kind, nothing
+# follows) and count (u16), then that many doubles.  A frame with no
+# input changes costs a few bytes plus its clock reading.
+#
+# Buttons are logged as the per-frame snapshots frame() acts on (held and
+# latched presses), not as raw edges, which depend on frame timing.
+#
+# Recording: set RECORD in eyes.py / cyclops.py to a path.  Replaying:
+#
+#   replay.py inputs.log                  eyes.py at recorded speed
+#   replay.py --fast inputs.log           as fast as it will go
+#   replay.py --script cyclops.py cyc.log
+#
+# The replay runs with fakehw.py's hardware stand-ins, as bench.py does
+# (under xvfb-run if there's no display), and prints each module's stats
+# at the end of the log, for comparing runs of the same workload.
+
+MAGIC   = b"PERP"
+VERSION = 1
+HEADER  = struct.Struct("<4sB")
+RECORD  = struct.Struct("<BH")
+SAME    = 0x80
+NAN     = float("nan")
+
+# Kinds of read (prefixed, as the eye scripts have settings named LOD etc.)
+(LOG_SEED, LOG_CLOCK, LOG_CAMERA, LOG_TRACKS, LOG_ADC, LOG_BUTTONS, LOG_SYNC,
+  LOG_LOD) = range(1, 9)
+
+
+def orNan(v): return NAN if v is None else v
+def orNone(v): return None if v != v else v
+
+
+# Each kind's value to a tuple of numbers and back
+def flatCamera(c):
+	target, stamp, fps, lux = c
+	x, y = target if target else (NAN, NAN)
+	return (x, y, orNan(stamp), orNan(fps), orNan(lux))
+
+def buildCamera(v):
+	target = None if v[0] != v[0] else (v[0], v[1])
+	return target, orNone(v[2]), orNone(v[3]), orNone(v[4])
+
+def flatTracks(tracks):
+	return tuple(n for t in tracks for n in t)
+
+def buildTracks(v):
+	return tuple((int(v[i]),) + v[i + 1:i + 4] for i in range(0, len(v), 4))
+
+# Snapshot time is the frame's clock reading, so isn't kept again; nor
+# are press times, which frame() doesn't use
+def flatButtons(b):
+	return (b.held, b.pressed)
+
+def buildButtons(v):
+	from gpioinput import ButtonSnapshot
+	return ButtonSnapshot(int(v[0]), int(v[1]), (), None)
+
+def flatSync(s):
+	return () if s is None else (s.x, s.y, s.pupil) + tuple(s.lids)
+
+def buildSync(v):
+	if not v: return None
+	from gazesync import GazeState
+	return GazeState(v[0], v[1], v[2], v[3:])
+
+def flatLod(level):
+	from lod import LOD_LEVELS
+	return () if level is None else (LOD_LEVELS.index(level),)
+
+def buildLod(v):
+	from lod import LOD_LEVELS
+	return LOD_LEVELS[int(v[0])] if v else None
+
+KINDS = {
+	LOG_SEED:    ("seed",    lambda s: (s,),  lambda v: int(v[0])),
+	LOG_CLOCK:   ("clock",   lambda t: (t,),  lambda v: v[0]),
+	LOG_CAMERA:  ("camera",  flatCamera,      buildCamera),
+	LOG_TRACKS:  ("tracks",  flatTracks,      buildTracks),
+	LOG_ADC:     ("adc",     tuple,           tuple),
+	LOG_BUTTONS: ("buttons", flatButtons,     buildButtons),
+	LOG_SYNC:    ("sync",    flatSync,        buildSync),
+	LOG_LOD:     ("lod",     flatLod,         buildLod),
+}
+
+
+class Live(object):
+	replaying = False
+
+	def read(self, kind, fn):
+		return fn()
+
+	# Seed for the random module; None = seeded from the OS as usual
+	def seed(self):
+		return None
+
+	def close(self): pass
+	def stats(self): return None
+
+
+class Recorder(Live):
+	def __init__(self, path):
+		self.file    = open(path, "wb")
+		self.last    = {}
+		self.reads   = 0
+		self.same    = 0
+		self.frames  = 0
+		self.size    = HEADER.size
+		self.file.write(HEADER.pack(MAGIC, VERSION))
+
+	def read(self, kind, fn):
+		value = fn()
+		v     = KINDS[kind][1](value)
+		data  = struct.pack("<%dd" % len(v), *v)
+		self.reads += 1
+		if kind == LOG_CLOCK: self.frames += 1
+		if self.last.get(kind) == data:
+			self.file.write(chr(kind | SAME))
+			self.same += 1
+			self.size += 1
+		else:
+			self.file.write(RECORD.pack(kind, len(v)) + data)
+			self.last[kind] = data
+			self.size += RECORD.size + len(data)
+		return value
+
+	def seed(self):
+		return self.read(LOG_SEED,
+		  lambda: random.SystemRandom().getrandbits(48))
+
+	def close(self):
+		self.file.close()
+
+	def stats(self):
+		return "%d reads (%d unchanged), %d clock reads, %d bytes" % (
+		  self.reads, self.same, self.frames, self.size)
+
+
+class Player(Live):
+	replaying = True
+
+	# realTime: hold clock reads back to the recorded pace; atEnd: called
+	# when the log runs out (else EOFError)
+	def __init__(self, path, realTime=True, atEnd=None):
+		with open(path, "rb") as f: self.data = f.read()
+		magic, version = HEADER.unpack_from(self.data, 0)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError("%s: not an input log (or a different "
+			  "version)" % path)
+		self.pos      = HEADER.size
+		self.last     = {}
+		self.realTime = realTime
+		self.atEnd    = atEnd
+		self.reads    = 0
+		self.first    = None # Recorded time of first clock read
+		self.latest   = None # ...and of latest
+		self.began    = None # Real time at first clock read
+
+	def read(self, kind, fn=None):
+		data = self.data
+		if not self.complete():
+			if self.atEnd: self.atEnd()
+			raise EOFError("end of input log")
+		k = ord(data[self.pos])
+		if k & ~SAME != kind:
+			raise ValueError("replay diverged at read %d: code read %s, "
+			  "log has %s" % (self.reads, KINDS[kind][0],
+			  KINDS.get(k & ~SAME, ("unknown",))[0]))
+		if k & SAME:
+			self.pos += 1
+			value = self.last[kind]
+		else:
+			count     = RECORD.unpack_from(data, self.pos)[1]
+			self.pos += RECORD.size
+			v         = struct.unpack_from("<%dd" % count, data, self.pos)
+			self.pos += 8 * count
+			value     = KINDS[kind][2](v)
+			self.last[kind] = value
+		self.reads += 1
+		if kind == LOG_CLOCK: self.pace(value)
+		return value
+
+	# Whole record at pos?  (A recorder that was killed can leave part of
+	# one at the end.)
+	def complete(self):
+		data, pos = self.data, self.pos
+		if pos >= len(data): return False
+		if ord(data[pos]) & SAME: return True
+		if pos + RECORD.size > len(data): return False
+		count = RECORD.unpack_from(data, pos)[1]
+		return pos + RECORD.size + 8 * count <= len(data)
+
+	def pace(self, t):
+		now = time.time()
+		if self.first is None:
+			self.first = t
+			self.began = now
+		self.latest = t
+		if self.realTime:
+			wait = (t - self.first) - (now - self.began)
+			if wait > 0.0: time.sleep(wait)
+
+	def seed(self):
+		return self.read(LOG_SEED)
+
+	def stats(self):
+		if self.first is None: return "%d reads" % self.reads
+		recorded = self.latest - self.first
+		elapsed  = time.time() - self.began
+		return "%d reads, %.1f s recorded in %.1f s (%.2fx)" % (self.reads,
+		  recorded, elapsed, recorded / elapsed if elapsed > 0 else 0.0)
+
+
+player = None # Set by the replay driver below
+
+
+# Input log for an eye script: the replay driver's Player if there is
+# one, else a Recorder if given a path, else Live
+def openLog(recordPath=None):
+	if player: return player
+	if recordPath: return Recorder(recordPath)
+	return Live()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+	  description="Replay an input log through an eye script")
+	parser.add_argument("log")
+	parser.add_argument("--script", default="eyes.py")
+	parser.add_argument("--fast", action="store_true",
+	  help="don't hold to recorded pace")
+	args = parser.parse_args()
+
+	import fakehw
+	fakehw.install("idle", 0) # Hardware the script opens; inputs are logged
+	import replay # The module the script will import, not this copy
+	replay.player = Player(args.log, realTime=not args.fast)
+	sys.argv = [args.script]
+	runpy.run_path(args.script, run_name="__main__")
@@ -0,0 +1,47 @@
+#include std_head_vs.inc
+
+// Same as pi3d's uv_light, except vertex positions are blended between
+// two keyframes here rather than being regenerated on the CPU (see
+// keyframe.py).  'vertex' is the position at weight 0.0 and normal.xy
+// the position at weight 1.0; normal.z is a per-vertex factor from 0.0
+// to 1.0 selecting between the two weights in unif[16][0] and [1].
+// Real normals for these flat meshes are always (0, 0, -1).
+
+varying vec2 texcoordout;
+varying vec3 lightVector;
+varying float lightFactor;
+
+void main(void) {
+  float w = mix(unif[16][0], unif[16][1], normal.z);
+  vec3 posn = vec3(mix(vertex.xy, normal.xy, w), vertex.z);
+  vec3 flatNormal = vec3(0.0, 0.0, -1.0);
+
+  vec4 relPosn = modelviewmatrix[0] * vec4(posn, 1.0);
+  if (unif[7][0] == 1.0) {                  // point light, unif[8] is location
+    lightVector = vec3(relPosn) - unif[8];
+    lightFactor = pow(length(lightVector), -2.0);
+    lightVector = normalize(lightVector);
+    lightVector.z *= -1.0;
+  } else {                                  // directional light
+    lightVector = normalize(unif[8]);
+    lightFactor = 1.0;
+  }
+  lightVector.z *= -1.0;
+  vec3 uvec = normalize(cross(flatNormal, vec3(0.0003, -1.0, 0.0003)));
+  vec3 vvec = normalize(cross(uvec, flatNormal));
+  vec3 normout = normalize(vec3(modelviewmatrix[0] * vec4(flatNormal, 0.0)));
+  uvec = vec3(modelviewmatrix[0] * vec4(uvec, 0.0));
+  vvec = vec3(modelviewmatrix[0] * vec4(vvec, 0.0));
+  lightVector = vec3(mat4(uvec.x, vvec.x, -normout.x, 0.0,
+                          uvec.y, vvec.y, -normout.y, 0.0,
+                          uvec.z, vvec.z, -normout.z, 0.0,
+                          0.0,    0.0,    0.0,        1.0) * vec4(lightVector, 0.0));
+
+  vec3 inray = vec3(relPosn - vec4(unif[6], 0.0)); // camera to this vertex
+  dist = length(inray);
+#include std_fog_start.inc
+
+  texcoordout = texcoord * unib[2].xy + unib[3].xy;
+
+  gl_Position = modelviewmatrix[1] * vec4(posn, 1.0);
+}
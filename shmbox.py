@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+# Shared-memory input mailbox.  Sensor producers (the camera reader, the
+# ADC thread, or another process altogether) publish their latest values
+# into fixed slots of a small file mapped from /dev/shm, and the render
+# loop reads them with no lock and no system call.  Each slot is guarded
+# by a seqlock: the writer bumps the slot's sequence number to odd, writes
+# the values and timestamp, then bumps it to even again; a reader copies
+# the slot and takes it only if the sequence number was even and the same
+# before and after, else it tries again.  So reads never block writers,
+# and a reader can't see half of one update and half of the next.
+#
+# Each slot has ONE writer (any process); readers are unlimited.  Slots
+# are 64-byte aligned so writers to different slots don't share cache
+# lines.  The sequence number also tells readers whether a slot has been
+# written since they last looked (it changes on every update).
+#
+# The file outlives the processes using it, so a writer clears its slots
+# when it opens the mailbox ('writes'), and a slot reads as empty until
+# it's published again: a restarted eye doesn't pick up the last run's
+# camera target.  Empty is a zero timestamp (all published ones are
+# real times), not a zero sequence number, which wraps round to zero.
+#
+#   file header  magic "PEMB", version, slot count (u32 each)
+#   slot         seq (u32), 4 pad, timestamp (f64, 0 = empty), values
+#                (f64 each)
+#
+# The sequence number is written on its own, before and after the rest,
+# so a reader never sees the new number alongside the old contents.
+# Python has no memory barriers to offer, so cross-process ordering rests
+# on the stores being done in order by separate calls; the stress test
+# in tests/test_shmbox.py is the check on a given board.
+#
+# Running this file prints the current contents ("shmbox.py [path]").
+
+MAILBOX_PATH = "/dev/shm/pi-eyes-inputs"
+MAGIC        = b"PEMB"
+VERSION      = 1
+HEADER       = struct.Struct("<4sII")
+SEQ          = struct.Struct("<I")
+BODY_OFFSET  = 8 # After seq and pad
+SLOT_ALIGN   = 64
+READ_TRIES   = 100 # Before giving up on a slot being written nonstop
+
+# Slots: name, number of values
+FIELDS = (
+  ("camera", 5), # Has target (0/1), x, y (degrees), lux, camera fps
+  ("adc"   , 4), # Channels 0-3, 0.0 to 1.0
+)
+
+
+class Snapshot(object):
+	__slots__ = ("values", "stamp", "seq")
+
+	def __init__(self, values, stamp, seq):
+		self.values = values
+		self.stamp  = stamp
+		self.seq    = seq
+
+
+class Mailbox(object):
+	# writes: names of the slots this process will publish to, which are
+	# cleared of anything left from before
+	def __init__(self, path=MAILBOX_PATH, fields=FIELDS, writes=()):
+		if not os.path.isdir(os.path.dirname(path)): # No /dev/shm
+			path = os.path.join(tempfile.gettempdir(),
+			  os.path.basename(path))
+		self.path    = path
+		self.slots   = {}
+		self.retries = 0
+		offset = SLOT_ALIGN
+		for name, count in fields:
+			body = struct.Struct("<d%dd" % count) # Timestamp, values
+			self.slots[name] = (offset, body)
+			size    = BODY_OFFSET + body.size
+			offset += (size + SLOT_ALIGN - 1) // SLOT_ALIGN * SLOT_ALIGN
+		self.size = offset
+
+		fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+		try:
+			if os.fstat(fd).st_size < self.size:
+				os.ftruncate(fd, self.size)
+			self.map = mmap.mmap(fd, self.size)
+		finally:
+			os.close(fd)
+		magic, version, count = HEADER.unpack_from(self.map, 0)
+		if magic != MAGIC:
+			# New (all zeros), so all slots are unwritten
+			HEADER.pack_into(self.map, 0, MAGIC, VERSION, len(fields))
+		elif version != VERSION or count != len(fields):
+			raise ValueError("%s: mailbox layout differs (version %d, "
+			  "%d slots)" % (path, version, count))
+		for name in writes: self.clear(name)
+
+	# Write a slot (this process must be its only writer)
+	def publish(self, name, values, stamp=None):
+		offset, body = self.slots[name]
+		m   = self.map
+		seq = SEQ.unpack_from(m, offset)[0]
+		if seq & 1: seq += 1 # A writer died mid-update; carry on
+		SEQ.pack_into(m, offset, (seq + 1) & 0xFFFFFFFF)
+		body.pack_into(m, offset + BODY_OFFSET,
+		  time.time() if stamp is None else stamp, *values)
+		SEQ.pack_into(m, offset, (seq + 2) & 0xFFFFFFFF)
+
+	# Mark a slot empty (this process must be its only writer)
+	def clear(self, name):
+		offset, body = self.slots[name]
+		count        = (body.size - 8) // 8
+		self.publish(name, (0.0,) * count, 0.0)
+
+	# Consistent copy of a slot as a Snapshot, or None if it's empty (or
+	# is being written continuously)
+	def read(self, name):
+		offset, body = self.slots[name]
+		m     = self.map
+		start = offset + BODY_OFFSET
+		for i in range(READ_TRIES):
+			seq = SEQ.unpack_from(m, offset)[0]
+			if seq & 1:
+				self.retries += 1
+				continue
+			data = body.unpack_from(m, start)
+			if SEQ.unpack_from(m, offset)[0] == seq:
+				if not data[0]: return None
+				return Snapshot(data[1:], data[0], seq)
+			self.retries += 1
+		return None
+
+	def close(self):
+		self.map.close()
+
+
+def dump(path=MAILBOX_PATH):
+	box = Mailbox(path)
+	now = time.time()
+	for name, count in FIELDS:
+		s = box.read(name)
+		if s is None: print "%-8s (not written)" % name
+		else: print "%-8s %s  seq %d, %.3f s ago" % (name,
+		  " ".join("%g" % v for v in s.values), s.seq, now - s.stamp)
+
+
+if __name__ == "__main__":
+	dump(sys.argv[1] if len(sys.argv) > 1 else MAILBOX_PATH)
@@ -0,0 +1,114 @@
+import math
+
+# Streaming smoothing filters for the camera's gaze target (uart.py's
+# TargetFilter).  That used to keep the last 4 positions in lists and run
+# scipy's lfilter() over them every frame with 15- and 5-tap averaging
+# kernels; with the window shorter than the kernel, that works out to the
+# sum of the last 4 positions over 15 (x) or 5 (y), recomputed from
+# scratch each time, and scipy alone took seconds and tens of MB to
+# import on a Pi Zero.  Each filter here keeps its own state and does a
+# fixed amount of work per sample:
+#
+#   ("box", window, scale)            sum of the last 'window' samples
+#                                     times scale (scale 1/window = mean)
+#   ("ema", weight)                   exponential moving average
+#   ("euro", minCutoff, beta, dCutoff) one-euro filter (Casiez et al.):
+#                                     cutoff rises with speed, so slow
+#                                     moves are smoothed, fast ones not
+#
+# makeFilter() builds one from a spec tuple as above.  update() takes a
+# sample and its time in seconds (used by the one-euro filter only) and
+# returns the filtered value.  tests/test_smoothing.py checks the box
+# filter against the old lfilter() arithmetic.
+
+RESUM_SAMPLES = 4096 # Box filter re-adds its window this often (drift)
+
+
+class BoxFilter(object):
+	def __init__(self, window, scale=None, initial=0.0):
+		self.window  = window
+		self.scale   = 1.0 / window if scale is None else scale
+		self.initial = initial
+		self.reset()
+
+	def reset(self):
+		self.ring  = [self.initial] * self.window
+		self.index = 0
+		self.total = self.initial * self.window
+		self.count = 0
+
+	def update(self, value, t=None):
+		i           = self.index
+		self.total += value - self.ring[i]
+		self.ring[i] = value
+		self.index  = (i + 1) % self.window
+		self.count += 1
+		if self.count >= RESUM_SAMPLES:
+			# Float error from add/subtract builds up; start clean
+			self.total = math.fsum(self.ring)
+			self.count = 0
+		return self.total * self.scale
+
+
+class EmaFilter(object):
+	# First sample is taken as is, unless 'initial' is given
+	def __init__(self, weight, initial=None):
+		self.weight  = weight
+		self.initial = initial
+		self.reset()
+
+	def reset(self):
+		self.value = self.initial
+
+	def update(self, value, t=None):
+		if self.value is None: self.value = value
+		else: self.value += (value - self.value) * self.weight
+		return self.value
+
+
+# Smoothing factor for a first-order low-pass at 'cutoff' Hz over dt s
+def lowPassAlpha(cutoff, dt):
+	tau = 1.0 / (2.0 * math.pi * cutoff)
+	return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter(object):
+	def __init__(self, minCutoff=1.0, beta=0.0, dCutoff=1.0):
+		self.minCutoff = minCutoff
+		self.beta      = beta
+		self.dCutoff   = dCutoff
+		self.reset()
+
+	def reset(self):
+		self.value = None
+		self.speed = 0.0
+		self.time  = None
+
+	def update(self, value, t):
+		if self.value is None:
+			self.value = value
+			self.time  = t
+			return value
+		dt = t - self.time
+		if dt <= 0.0: return self.value # Same or out-of-order sample
+		self.time   = t
+		speed       = (value - self.value) / dt
+		self.speed += (speed - self.speed) * lowPassAlpha(self.dCutoff, dt)
+		cutoff      = self.minCutoff + self.beta * abs(self.speed)
+		self.value += (value - self.value) * lowPassAlpha(cutoff, dt)
+		return self.value
+
+
+FILTERS = { "box": BoxFilter, "ema": EmaFilter, "euro": OneEuroFilter }
+
+def makeFilter(spec):
+	return FILTERS[spec[0]](*spec[1:])
+
+
+# How many samples a filter spec's output lags a steadily moving input
+# (group delay).  The one-euro filter's lag shrinks as speed rises; it's
+# taken as none.
+def delaySamples(spec):
+	if spec[0] == "box": return (spec[1] - 1) * 0.5
+	if spec[0] == "ema": return (1.0 - spec[1]) / spec[1]
+	return 0.0
@@ -0,0 +1,82 @@
+import time
+import pytest
+import fakehw
+from adcsched import AdcScheduler, dataRateFor, DATA_RATES, BUSY_SHARE
+
+
+# Fake ADS1015 that notes which calls it gets, for which channels
+class CountingADS1015(fakehw.FakeADS1015):
+	def __init__(self):
+		super(CountingADS1015, self).__init__()
+		self.calls = []
+
+	def read_adc(self, channel, gain=1, data_rate=None):
+		self.calls.append(("read", channel))
+		return super(CountingADS1015, self).read_adc(channel, gain,
+		  data_rate)
+
+	def start_adc(self, channel, gain=1, data_rate=None):
+		self.calls.append(("start", channel))
+		return super(CountingADS1015, self).start_adc(channel, gain,
+		  data_rate)
+
+
+def sample(monkeypatch, rates, seconds=1.5):
+	monkeypatch.setattr(fakehw.FakeADS1015, "feed",
+	  fakehw.Feed("luxnoise", 1))
+	adc   = CountingADS1015()
+	sched = AdcScheduler(adc, rates)
+	sched.daemon = True
+	sched.start()
+	time.sleep(seconds)
+	sched.running = False
+	sched.join()
+	return adc, sched
+
+
+def assertRates(sched, rates):
+	achieved = sched.rates()
+	assert sorted(achieved) == sorted(rates)
+	for c, want in rates.items():
+		assert abs(achieved[c] - want) < want * 0.15, sched.stats()
+
+
+def test_single_shot_rates_per_channel(monkeypatch):
+	rates      = {0: 60.0, 1: 60.0, 2: 30.0}
+	adc, sched = sample(monkeypatch, rates)
+	assertRates(sched, rates)
+	assert sched.counts[3] == 0
+	assert set(kind for kind, c in adc.calls) == set(["read"])
+	assert set(c for kind, c in adc.calls) == set(rates)
+	assert sched.dataRate == dataRateFor(150.0)
+	assert all(0.0 <= v <= 1.0 for v in sched.dest)
+
+
+def test_one_channel_converts_continuously(monkeypatch):
+	rates      = {2: 100.0}
+	adc, sched = sample(monkeypatch, rates)
+	assertRates(sched, rates)
+	assert adc.calls == [("start", 2)]
+	assert adc.channel is None # Stopped when done
+	assert sched.counts[0] == sched.counts[1] == sched.counts[3] == 0
+
+
+def test_data_rate_keeps_conversions_to_busy_share():
+	for total in (10.0, 64.0, 65.0, 300.0, 1000.0):
+		rate = dataRateFor(total)
+		assert total <= rate * BUSY_SHARE
+		slower = [r for r in DATA_RATES if r < rate]
+		assert not slower or total > slower[-1] * BUSY_SHARE
+	assert dataRateFor(1e6) == DATA_RATES[-1]
+
+
+def test_store_clips_scales_and_filters():
+	sched = AdcScheduler(None, {0: 10.0, 1: 10.0}, {1: ("ema", 0.5)})
+	sched.store(0, -20, 1.0)
+	assert sched.dest[0] == 0.0
+	sched.store(0, 5000, 2.0)
+	assert sched.dest[0] == 1.0 and sched.stamps[0] == 2.0
+	sched.store(1, 1649, 1.0)
+	sched.store(1, 0, 2.0)
+	assert sched.dest[1] == 0.5
+	assert sched.counts[:2] == [2, 2]
@@ -0,0 +1,39 @@
+import sys
+import numpy as np
+import pytest
+from gfxutil import latheArrays, scleraPoints
+
+pi3d = pytest.importorskip("pi3d")
+
+
+# pi3d's own lathe output, captured from the Buffer it would build
+def pi3dLathe(monkeypatch, path, sides):
+	shapeModule = sys.modules["pi3d.Shape"]
+	monkeypatch.setattr(shapeModule, "Buffer",
+	  lambda shape, verts, tex, idx, norms, *args: (verts, tex, idx, norms))
+	verts, tex, idx, norms = shapeModule.Shape._lathe.__func__(
+	  type("LatheShape", (object,), {})(), path, sides)
+	return (np.array(verts), np.array(norms), np.array(tex), np.array(idx))
+
+
+# latheArrays() is pi3d's lathe turned 90 degrees on X: (x, y, z) there
+# is (x, z, -y) here, for vertices and normals alike
+def reAxis(a):
+	return np.column_stack((a[:,0], a[:,2], -a[:,1]))
+
+
+@pytest.mark.parametrize("sides", [64, 32, 12])
+def test_lathe_matches_pi3d(monkeypatch, sides):
+	pts = [tuple(p) for p in scleraPoints(19.7, 20.3, 240.0, 24)]
+	verts, norms, tex, idx = latheArrays(pts, sides)
+	rv, rn, rt, ri = pi3dLathe(monkeypatch, pts, sides)
+	assert np.allclose(verts, reAxis(rv), atol=1e-3)
+	assert np.allclose(norms, reAxis(rn), atol=1e-6)
+	assert np.allclose(tex, rt, atol=1e-6)
+	assert (idx == ri).all()
+
+
+def test_lathe_first_ring_has_no_normal():
+	verts, norms, tex, idx = latheArrays(scleraPoints(20, 20, 100.0, 8), 8)
+	assert not norms[:9].any()
+	assert tex[:9, 1].max() == 0.0 and abs(tex[-1, 1] - 1.0) < 1e-6
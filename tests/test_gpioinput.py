@@ -0,0 +1,105 @@
+import time
+import fakehw
+from gpioinput import ButtonInput, BOUNCE
+
+
+# Button pins held at set levels, edges delivered by calling edge() by
+# hand; 'edges=False' is a kernel that won't do edge detection
+class StubGPIO(object):
+	IN, LOW, HIGH, PUD_UP, BOTH = 1, 0, 1, 22, 33
+
+	def __init__(self, edges=True):
+		self.levels = {}
+		self.edges  = edges
+
+	def setup(self, pin, direction, pull_up_down=None):
+		self.levels.setdefault(pin, self.HIGH)
+
+	def input(self, pin):
+		return self.levels[pin]
+
+	def add_event_detect(self, pin, edge, callback=None):
+		if not self.edges: raise RuntimeError("Failed to add edge detection")
+
+
+# Fake taps of 8 ms every TAP_PERIOD, with contact chatter, snapshotted
+# at 30 fps: polling the pin each frame misses most taps, edge detection
+# must see every one, and once only
+def test_taps_between_frames_are_caught_once():
+	seconds = 2.0
+	pin     = fakehw.BLINK_PINS[0]
+	gpio    = fakehw.FakeGPIO(fakehw.Feed("taps", 1), chatter=3)
+	buttons = ButtonInput(gpio, (pin,))
+	end     = time.time() + seconds
+	polled  = edged = 0
+	was     = False
+	while time.time() < end:
+		time.sleep(1.0 / 30) # Frame
+		down = gpio.input(pin) == gpio.LOW
+		if down and not was: polled += 1
+		was  = down
+		if buttons.snapshot().pressed: edged += 1
+	buttons.close()
+	gpio.cleanup()
+	taps = int(seconds / fakehw.TAP_PERIOD)
+	assert abs(edged - taps) <= 1, buttons.stats()
+	assert abs(buttons.presses - taps) <= 1, buttons.stats()
+	assert buttons.edges > 2 * buttons.presses # Chatter did happen
+	assert polled < edged
+
+
+def test_chatter_within_bounce_is_one_press():
+	gpio    = StubGPIO()
+	buttons = ButtonInput(gpio, (5,))
+	for level in (0, 1, 0, 1, 0): # Bouncing closed
+		gpio.levels[5] = level
+		buttons.edge(5)
+	snap = buttons.snapshot()
+	assert snap.down(0) and snap.isHeld(0)
+	assert buttons.presses == 1
+	gpio.levels[5] = 1
+	buttons.edge(5)
+	time.sleep(BOUNCE * 1.5)
+	gpio.levels[5] = 0
+	buttons.edge(5)
+	assert buttons.presses == 2
+
+
+# Chatter on letting go of a long press isn't a new press (it was, when
+# the bounce window ran from the press only)
+def test_chatter_on_release_is_no_press():
+	gpio    = StubGPIO()
+	buttons = ButtonInput(gpio, (5,))
+	gpio.levels[5] = 0
+	buttons.edge(5)
+	assert buttons.snapshot().down(0)
+	time.sleep(0.2)
+	for level in (1, 0, 1): # Bouncing open
+		gpio.levels[5] = level
+		buttons.edge(5)
+	assert buttons.presses == 1
+	assert not buttons.snapshot().down(0)
+
+
+def test_tap_between_snapshots_is_latched_once():
+	gpio    = StubGPIO()
+	buttons = ButtonInput(gpio, (5, -1, 6))
+	gpio.levels[6] = 0
+	buttons.edge(6)
+	gpio.levels[6] = 1
+	buttons.edge(6)
+	snap = buttons.snapshot()
+	assert snap.down(2) and not snap.isHeld(2)
+	assert not snap.down(0) and not snap.down(1)
+	assert not buttons.snapshot().down(2)
+
+
+def test_pins_without_edge_detection_are_polled():
+	gpio    = StubGPIO(edges=False)
+	buttons = ButtonInput(gpio, (5, 6))
+	assert len(buttons.polled) == 2
+	gpio.levels[6] = 0
+	snap = buttons.snapshot(1.0)
+	assert snap.isHeld(1) and snap.pressed == 2 and snap.stamps[1] == 1.0
+	assert buttons.snapshot(2.0).pressed == 0 # Still held; no new press
+	buttons.close() # Nothing to remove
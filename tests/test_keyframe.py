@@ -0,0 +1,139 @@
+import ctypes
+import os
+import numpy as np
+import pytest
+
+pi3d = pytest.importorskip("pi3d")
+from pi3d.constants import (opengles, GLint, GL_COMPILE_STATUS,
+  GL_LINK_STATUS)
+import keyframe
+from keyframe import (KeyframeMesh, irisKeyframes, lidKeyframes,
+  keyframeBlend, keyframeShader)
+from geomcache import compileGeometry
+from gfxutil import DynamicMesh, pointsInterp, pointsMesh
+
+REPO   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RADIUS = 100
+SIZE   = 256 # Offscreen display, pixels square
+
+
+@pytest.fixture(scope="module")
+def geom():
+	return compileGeometry(os.path.join(REPO, "graphics", "eye.svg"),
+	  RADIUS, 0.25)
+
+
+# What eyes.py regenerates on the CPU without GPU_DEFORM
+def cpuIris(g, p, steps, z):
+	return pointsMesh(None, pointsInterp(g["pupilMin"], g["pupilMax"], p),
+	  g["iris"], steps, z, True)
+
+def cpuLid(g, lid, w1, w2, steps, flip):
+	openPts, closedPts = g[lid + "Open"], g[lid + "Closed"]
+	return pointsMesh(g[lid + "Edge"], pointsInterp(openPts, closedPts, w1),
+	  pointsInterp(openPts, closedPts, w2), steps, 0, False, flip)
+
+
+@pytest.mark.parametrize("p", [0.0, 0.3, 0.75, 1.0])
+def test_iris_keyframes_match_regen(geom, p):
+	kf = irisKeyframes(geom["pupilMin"], geom["pupilMax"], geom["iris"], 4,
+	  -20.0)
+	assert np.allclose(keyframeBlend(kf[0], kf[1], kf[2], p, p),
+	  cpuIris(geom, p, 4, -20.0), atol=1e-4)
+
+
+@pytest.mark.parametrize("lid", ["upperLid", "lowerLid"])
+@pytest.mark.parametrize("flip", [False, True])
+@pytest.mark.parametrize("w1,w2", [(0.0, 0.0), (0.2, 0.6), (0.9, 0.4),
+  (1.0, 1.0)])
+def test_lid_keyframes_match_regen(geom, lid, flip, w1, w2):
+	kf = lidKeyframes(geom[lid + "Open"], geom[lid + "Closed"],
+	  geom[lid + "Edge"], 5, flip)
+	lo, hi = min(w1, w2), max(w1, w2) # updateLid() sorts them likewise
+	assert np.allclose(keyframeBlend(kf[0], kf[1], kf[2], w1, w2),
+	  cpuLid(geom, lid, lo, hi, 5, flip), atol=1e-4)
+
+
+# Offscreen pi3d display, as bench.py renders: under Xvfb with Mesa's
+# software GL (llvmpipe) when there's no screen
+@pytest.fixture(scope="module")
+def display():
+	if not os.environ.get("DISPLAY"):
+		pytest.skip("no display (run under xvfb-run)")
+	os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+	d = pi3d.Display.create(w=SIZE, h=SIZE, samples=0,
+	  background=(0.0, 0.0, 0.0, 1.0))
+	pi3d.Camera(is_3d=False, at=(0, 0, 0), eye=(0, 0, -1000))
+	pi3d.Light(lightpos=(0, -500, -500), lightamb=(0.2, 0.2, 0.2))
+	yield d
+	d.destroy()
+
+
+def statusOk(query, handle, status):
+	ok = GLint()
+	query(handle, status, ctypes.byref(ok))
+	return ok.value == 1
+
+
+def test_keyframe_shader_compiles_from_any_directory(display, tmpdir):
+	assert os.path.isabs(keyframe.KEYFRAME_SHADER)
+	with tmpdir.as_cwd():
+		shader = keyframeShader()
+	assert statusOk(opengles.glGetShaderiv, shader.vshader,
+	  GL_COMPILE_STATUS)
+	assert statusOk(opengles.glGetShaderiv, shader.fshader,
+	  GL_COMPILE_STATUS)
+	assert statusOk(opengles.glGetProgramiv, shader.program, GL_LINK_STATUS)
+
+
+def render(display, shape):
+	display.clear()
+	shape.draw()
+	return pi3d.screenshot().astype(np.int16)
+
+
+# Share of pixels that differ noticeably between two renders
+def mismatch(a, b):
+	return (np.abs(a - b).max(axis=2) > 16).mean()
+
+
+# The vertex shader against the CPU regen path, drawn the same way: all
+# but a few edge pixels (rasterized from float positions computed in two
+# different places) must match
+def test_keyframe_mesh_renders_as_regen(display, geom):
+	texture = pi3d.Texture(os.path.join(REPO, "graphics", "iris.jpg"),
+	  mipmap=False, filter=pi3d.GL_LINEAR)
+	regenShader = pi3d.Shader("uv_light")
+	gpuShader   = keyframeShader()
+	cols        = len(geom["pupilMin"]) - 1
+	irisKf      = irisKeyframes(geom["pupilMin"], geom["pupilMax"],
+	  geom["iris"], 4, -20.0)
+	gpu = KeyframeMesh(irisKf, cols, 4, True, 0, 0.05, False)
+	cpu = DynamicMesh(cols, 4, True, 0, 0.05, False)
+	for shape, shader in ((gpu, gpuShader), (cpu, regenShader)):
+		shape.set_textures([texture])
+		shape.set_shader(shader)
+
+	renders = []
+	for p in (0.2, 0.8):
+		gpu.setWeights(p, p)
+		cpu.update(cpuIris(geom, p, 4, -20.0))
+		a, b = render(display, gpu), render(display, cpu)
+		assert (b.max(axis=2) > 16).mean() > 0.05 # Drew something
+		assert mismatch(a, b) < 0.005
+		renders.append(a)
+	assert mismatch(renders[0], renders[1]) > 0.02 # Weight matters
+
+	lidKf = lidKeyframes(geom["upperLidOpen"], geom["upperLidClosed"],
+	  geom["upperLidEdge"], 5, True)
+	cols  = len(geom["upperLidOpen"])
+	gpu   = KeyframeMesh(lidKf, cols, 5, False, 0, 0.05, True)
+	cpu   = DynamicMesh(cols, 5, False, 0, 0.05, True)
+	for shape, shader in ((gpu, gpuShader), (cpu, regenShader)):
+		shape.set_textures([texture])
+		shape.set_shader(shader)
+	gpu.setWeights(0.3, 0.7)
+	cpu.update(cpuLid(geom, "upperLid", 0.3, 0.7, 5, True))
+	a, b = render(display, gpu), render(display, cpu)
+	assert (b.max(axis=2) > 16).mean() > 0.02
+	assert mismatch(a, b) < 0.005
@@ -0,0 +1,29 @@
+import json
+import time
+import lod
+from lod import LodController, chooseLevel, DOWN_FRAMES
+from pacing import FrameScheduler
+
+
+def test_profiles_not_a_dict_are_replaced(tmpdir, monkeypatch):
+	monkeypatch.setattr(lod, "calibrate", lambda geom, fps, finest:
+	  (2, [0.001, 0.002, 0.003]))
+	tmpdir.join(lod.LOD_PROFILES).write("[1, 2, 3]")
+	assert chooseLevel(None, 120, 30.0, str(tmpdir)) == 2
+	profiles = json.loads(tmpdir.join(lod.LOD_PROFILES).read())
+	assert [p["level"] for p in profiles.values()] == [2]
+	monkeypatch.setattr(lod, "calibrate", None) # Saved now
+	assert chooseLevel(None, 120, 30.0, str(tmpdir)) == 2
+
+
+# Swap blocking for most of the period (vsync) isn't load: a light frame
+# behind a vsync-locked swap must not step detail down
+def test_vsync_wait_is_not_work():
+	pacer = FrameScheduler(50)
+	lodControl = LodController(0, 50)
+	for i in range(DOWN_FRAMES + 10):
+		time.sleep(0.002) # Work
+		pacer.swap(lambda: time.sleep(0.017))
+		pacer.wait()
+		assert lodControl.update(pacer.work) is None
+	assert pacer.busy > 0.018 and pacer.work < 0.01
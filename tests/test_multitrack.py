@@ -0,0 +1,24 @@
+from multitrack import MultiTracker
+
+
+def blob(x, y, s):
+	return {'x': x, 'y': y, 's': s}
+
+
+# Two people walking past each other, a little apart vertically and
+# swapping size rank on the way (as they would nearing the camera): each
+# keeps its ID throughout, and the eyes stay on the one they started on
+def test_crossing_tracks_keep_their_ids():
+	tracker = MultiTracker(dwellMax=0)
+	ids     = None
+	for i in range(21):
+		a     = 0.2 + 0.03 * i
+		b     = 0.8 - 0.03 * i
+		focus = tracker.update([blob(a, 0.45, 40 + i), blob(b, 0.55, 50 - i)],
+		  i / 10.0)
+		byY   = dict((t.y, t.id) for t in tracker.tracks)
+		if ids is None: ids = (byY[0.45], byY[0.55])
+		assert (byY[0.45], byY[0.55]) == ids
+		assert len(byY) == 2 and len(tracker.tracks) == 2
+		if i: assert focus.id == ids[1] # Larger at first
+	assert tracker.nextId == 3 and tracker.switches == 1
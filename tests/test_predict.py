@@ -0,0 +1,65 @@
+from eyestate import EyeState, Inputs, step
+from predict import TargetPredictor, displayDelay
+
+PERIOD = 0.1  # Camera frame period, seconds
+FPS    = 30.0 # Render frames per second
+SPEED  = 15.0 # Degrees/s, a walking person across the camera's view
+DELAY  = 2.5  # Capture to arrival, camera frames (send + uart.py's filter)
+
+
+def sweep(t):
+	return -15.0 + SPEED * t
+
+
+# Mean error between the target each render frame looks at and where the
+# person is by the time that frame is seen, over the steady part of a
+# constant-speed sweep: the latest camera target as it is, or through
+# TargetPredictor
+def meanError(predictor):
+	seen  = displayDelay(FPS)
+	error = []
+	for i in range(int(2.0 * FPS)):
+		now     = i / FPS
+		arrived = int(now / PERIOD) * PERIOD
+		x       = sweep(arrived - DELAY * PERIOD)
+		if predictor:
+			x = predictor.update(x, 0.0, arrived, PERIOD, now)[0]
+		if now >= 0.7: error.append(abs(x - sweep(now + seen)))
+	return sum(error) / len(error)
+
+
+def test_prediction_leads_a_constant_speed_target():
+	predictor = TargetPredictor(sourceFrames=DELAY,
+	  displayTime=displayDelay(FPS))
+	late      = meanError(None)
+	led       = meanError(predictor)
+	assert late > 5.0 # 15 deg/s by ~0.4 s
+	assert led < 1.0 and led < late / 5
+	assert predictor.tracks == 1 and predictor.observations == 20
+
+
+def test_held_target_times_out():
+	predictor = TargetPredictor(timeout=0.5)
+	assert predictor.update(1.0, 2.0, 10.0, PERIOD, 10.0) == (1.0, 2.0)
+	assert predictor.update(1.0, 2.0, 10.0, PERIOD, 10.4) == (1.0, 2.0)
+	assert predictor.update(1.0, 2.0, 10.0, PERIOD, 10.6) is None
+
+
+# A target arriving partway through a move starts the next one from where
+# the eye is, with or without prediction; it used to start from where the
+# last move had, so the eye jumped back first
+def test_retarget_starts_from_current_position():
+	s = EyeState(0.0, 0.0, 0.0, autoblink=False, seed=1)
+	s.startX = s.destX = s.curX = 0.0
+	s.startY = s.destY = s.curY = 0.0
+	inputs = Inputs()
+	inputs.target = (-20.0, 0.0)
+	step(s, 0.0, inputs)
+	step(s, 0.025, inputs) # Halfway
+	x = s.curX
+	assert -20.0 < x < 0.0
+	inputs.target = (20.0, 0.0)
+	step(s, 0.025, inputs)
+	assert (s.startX, s.startY) == (x, s.curY)
+	step(s, 0.03, inputs)
+	assert x < s.curX < 20.0
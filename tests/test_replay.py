@@ -0,0 +1,79 @@
+import pytest
+from replay import (Recorder, Player, LOG_CLOCK, LOG_CAMERA, LOG_TRACKS,
+  LOG_ADC, LOG_BUTTONS, LOG_SYNC, LOG_LOD)
+from gazesync import GazeState
+from gpioinput import ButtonSnapshot
+from lod import LOD_LEVELS
+
+
+# One of every kind of read, in frame order, as the render loop gets them
+# back; then a frame where nothing changes, so it's all logged as SAME
+READS = [
+	(LOG_CLOCK,   1000.25),
+	(LOG_CAMERA,  (None, None, None, None)),
+	(LOG_CAMERA,  ((0.125, -0.5), 999.5, 30.0, 210.0)),
+	(LOG_TRACKS,  ()),
+	(LOG_TRACKS,  ((3, 0.25, -0.75, 1.5), (7, -0.1, 0.2, 0.05))),
+	(LOG_ADC,     (0.5, 0.25)),
+	(LOG_BUTTONS, ButtonSnapshot(0, 0, (), None)),
+	(LOG_BUTTONS, ButtonSnapshot(5, 4, (), None)),
+	(LOG_SYNC,    None),
+	(LOG_SYNC,    GazeState(12.5, -3.0, 0.4, (0.1, 0.2, 0.3, 0.4))),
+	(LOG_LOD,     None),
+	(LOG_LOD,     LOD_LEVELS[1]),
+	(LOG_CLOCK,   1000.28125),
+]
+SAMES = [READS[i] for i in (2, 4, 5, 7, 9, 11)] # Each kind's last value
+READS = READS + SAMES + [(LOG_CLOCK, 1000.3125)]
+
+
+def record(path):
+	log  = Recorder(path)
+	seed = log.seed()
+	got  = [log.read(kind, lambda: value) for kind, value in READS]
+	log.close()
+	return log, seed, got
+
+
+def test_every_kind_replays_as_recorded(tmpdir):
+	path = str(tmpdir.join("inputs.log"))
+	log, seed, got = record(path)
+	assert got == [value for kind, value in READS]
+	assert log.same == len(SAMES)
+	assert log.size == tmpdir.join("inputs.log").size()
+
+	player = Player(path, realTime=False)
+	assert player.seed() == seed
+	for kind, value in READS:
+		assert player.read(kind) == value
+	assert player.reads == len(READS) + 1
+
+
+def test_different_read_is_an_error(tmpdir):
+	path = str(tmpdir.join("inputs.log"))
+	record(path)
+	player = Player(path, realTime=False)
+	player.seed()
+	player.read(LOG_CLOCK)
+	with pytest.raises(ValueError) as e:
+		player.read(LOG_ADC)
+	assert "read 2" in str(e.value) and "camera" in str(e.value)
+
+
+# A recorder killed mid-write leaves part of a record: the replay ends
+# there, as if the log ended cleanly before it
+def test_truncated_record_ends_replay(tmpdir):
+	path = str(tmpdir.join("inputs.log"))
+	log  = Recorder(path)
+	log.read(LOG_CLOCK, lambda: 1.0)
+	log.read(LOG_CAMERA, lambda: ((0.5, 0.5), 1.0, 30.0, None))
+	log.close()
+	data = tmpdir.join("inputs.log").read_binary()
+	tmpdir.join("inputs.log").write_binary(data[:-3])
+
+	ended  = []
+	player = Player(path, realTime=False, atEnd=lambda: ended.append(1))
+	assert player.read(LOG_CLOCK) == 1.0
+	with pytest.raises(EOFError):
+		player.read(LOG_CAMERA)
+	assert ended == [1]
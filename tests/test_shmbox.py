@@ -0,0 +1,79 @@
+import os
+import time
+from shmbox import Mailbox, SEQ
+
+
+def mailbox(tmpdir, **kw):
+	return Mailbox(str(tmpdir.join("mailbox")), **kw)
+
+
+def test_publish_and_read(tmpdir):
+	box = mailbox(tmpdir)
+	assert box.read("camera") is None # Never written
+	box.publish("adc", (0.1, 0.2, 0.3, 0.4), 123.5)
+	s = box.read("adc")
+	assert s.values == (0.1, 0.2, 0.3, 0.4)
+	assert s.stamp == 123.5 and s.seq == 2
+	assert box.read("camera") is None
+
+
+def test_writer_clears_its_slots_on_open(tmpdir):
+	box = mailbox(tmpdir)
+	box.publish("camera", (1, 2, 3, 4, 5), 10.0)
+	box.publish("adc", (1, 2, 3, 4), 10.0)
+	box.close()
+	box = mailbox(tmpdir, writes=("camera",)) # A restarted camera reader
+	assert box.read("camera") is None
+	assert box.read("adc").values == (1, 2, 3, 4)
+
+
+def test_wrapped_seq_still_reads(tmpdir):
+	box       = mailbox(tmpdir)
+	offset, _ = box.slots["camera"]
+	SEQ.pack_into(box.map, offset, 0xFFFFFFFE)
+	box.publish("camera", (1, 2, 3, 4, 5), 10.0)
+	s = box.read("camera")
+	assert s.seq == 0 and s.values == (1, 2, 3, 4, 5)
+
+
+def test_resumes_after_writer_died_mid_update(tmpdir):
+	box       = mailbox(tmpdir)
+	offset, _ = box.slots["adc"]
+	SEQ.pack_into(box.map, offset, 7)
+	assert box.read("adc") is None # Odd for good: gives up
+	box.publish("adc", (1, 2, 3, 4), 10.0)
+	assert box.read("adc").seq == 10
+
+
+# Child process publishes values that are all the same number (also the
+# timestamp), as fast as it can, while this one reads: no read may mix
+# values from two updates
+def test_no_torn_reads(tmpdir):
+	path = str(tmpdir.join("mailbox"))
+	box  = Mailbox(path)
+	pid  = os.fork()
+	if pid == 0:
+		try:
+			writer = Mailbox(path)
+			end    = time.time() + 1.0
+			i      = 0
+			while time.time() < end:
+				for n in range(1000):
+					i += 1
+					writer.publish("camera", (i, i, i, i, i), i)
+					writer.publish("adc", (i, i, i, i), i)
+		finally:
+			os._exit(0)
+	reads = torn = last = 0
+	while True:
+		done = os.waitpid(pid, os.WNOHANG)[0]
+		for name in ("camera", "adc"):
+			s = box.read(name)
+			if s is None: continue
+			reads += 1
+			if any(v != s.stamp for v in s.values): torn += 1
+			last = max(last, s.stamp)
+		if done: break
+	assert reads > 1000 and last > 1000
+	assert torn == 0
+
@@ -0,0 +1,78 @@
+import random
+import pytest
+from smoothing import (BoxFilter, EmaFilter, OneEuroFilter, makeFilter,
+  delaySamples, RESUM_SAMPLES)
+
+
+# Old uart.py output: lfilter([1/n] * n, 1, points)[-1], points being
+# the last 'window' samples (zeros before the first).  Uses scipy if it's
+# there, else the same sum written out.
+def lfilterReference(samples, window, n):
+	try:
+		from scipy.signal import lfilter
+	except ImportError:
+		lfilter = None
+	points = [0] * window
+	out    = []
+	for s in samples:
+		points.pop(0)
+		points.append(s)
+		if lfilter:
+			out.append(lfilter([1.0 / n] * n, 1, points)[-1])
+		else:
+			out.append(sum(points[window - 1 - k] / float(n)
+			  for k in range(min(n, window))))
+	return out
+
+
+# Gaze-like input: a clamped random walk, in degrees
+def randomWalk(count, seed=1):
+	rng  = random.Random(seed)
+	walk = [0.0]
+	for i in range(count - 1):
+		walk.append(min(max(walk[-1] + rng.gauss(0.0, 3.0), -30.0), 30.0))
+	return walk
+
+
+# uart.py used 15 (x) and 5 (y) taps over its last 4 positions
+@pytest.mark.parametrize("n", [15, 5, 4, 2])
+def test_box_matches_lfilter(n):
+	walk = randomWalk(3 * RESUM_SAMPLES) # Spans a few re-sums
+	f    = BoxFilter(min(n, 4), 1.0 / n)
+	ref  = lfilterReference(walk, 4, n)
+	assert max(abs(f.update(s) - r) for s, r in zip(walk, ref)) < 1e-9
+
+
+def test_box_mean_and_reset():
+	f = makeFilter(("box", 3))
+	assert [f.update(v) for v in (3.0, 6.0, 9.0, 12.0)] == [1.0, 3.0,
+	  6.0, 9.0]
+	f.reset()
+	assert f.update(3.0) == 1.0
+
+
+def test_ema():
+	f = EmaFilter(0.5)
+	assert f.update(4.0) == 4.0 # First sample as is
+	assert f.update(0.0) == 2.0
+	assert f.update(0.0) == 1.0
+	assert EmaFilter(0.5, 0.0).update(4.0) == 2.0
+
+
+def test_one_euro_smooths_slow_moves_more_than_fast():
+	def lag(speed, beta):
+		f = OneEuroFilter(1.0, beta)
+		for i in range(120): v = f.update(speed * i / 60.0, i / 60.0)
+		return speed * 119 / 60.0 - v
+	assert lag(1.0, 0.0) > 0.0
+	assert lag(50.0, 0.5) / 50.0 < lag(1.0, 0.5) / 1.0
+	f = OneEuroFilter()
+	f.update(1.0, 1.0)
+	assert f.update(5.0, 1.0) == 1.0 # Same time: no change
+
+
+@pytest.mark.parametrize("spec", [("box", 5), ("ema", 0.25)])
+def test_delay_samples(spec):
+	f = makeFilter(spec)
+	for i in range(200): v = f.update(float(i))
+	assert abs((199 - v) - delaySamples(spec)) < 1e-6
@@ -0,0 +1,27 @@
+import os
+import pytest
+from texbundle import bundleTextures
+
+pytest.importorskip("PIL")
+
+GRAPHICS = os.path.join(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__))), "graphics")
+IMAGES = { "iris": os.path.join(GRAPHICS, "iris.jpg"),
+  "sclera": os.path.join(GRAPHICS, "sclera.png"),
+  "lid": os.path.join(GRAPHICS, "lid.png"),
+  "dom": os.path.join(GRAPHICS, "eye.svg") }
+
+
+def test_bundle_built_then_loaded(tmpdir):
+	cacheDir = str(tmpdir.join("cache"))
+	maps     = bundleTextures("eye", IMAGES, 120, cacheDir)
+	assert sorted(maps) == ["iris", "lid", "sclera"]
+	assert maps["iris"].shape[0] <= 512 and maps["lid"].shape[2] == 4
+	again = bundleTextures("eye", IMAGES, 120, cacheDir)
+	assert (again["sclera"] == maps["sclera"]).all()
+
+
+# Read-only install: no bundle, the image files are used as they are
+def test_unwritable_cache_dir_falls_back_to_files():
+	maps = bundleTextures("eye", IMAGES, 120, "/proc/nope/cache")
+	assert maps == dict((k, v) for k, v in IMAGES.items() if k != "dom")
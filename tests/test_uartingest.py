@@ -0,0 +1,33 @@
+import errno
+import os
+import time
+import pytest
+import fakehw
+
+pytest.importorskip("serial")
+import uartingest
+
+
+# A read failing with EIO (USB serial adapter unplugged) is logged and
+# the port opened again, after which frames come through as before
+def test_read_error_reopens_port(monkeypatch):
+	fakehw.FakeSerial.feed = fakehw.Feed("targets", 1)
+	monkeypatch.setattr(uartingest.serial, "Serial",
+	  lambda *args, **kwargs: fakehw.FakeSerial())
+	read  = os.read
+	fails = [1]
+	def unplugged(fd, size):
+		if fails:
+			del fails[:]
+			raise OSError(errno.EIO, "Input/output error")
+		return read(fd, size)
+	monkeypatch.setattr(uartingest.os, "read", unplugged)
+	ingest = uartingest.UartIngest()
+	ingest.daemon = True
+	ingest.start()
+	end = time.time() + 2.0
+	while time.time() < end and not ingest.frames: time.sleep(0.05)
+	ingest.stop()
+	assert ingest.opens == 2
+	assert "Input/output error" in ingest.error
+	assert ingest.frames > 0 and ingest.targets is not None
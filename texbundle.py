@@ -0,0 +1,106 @@
+import mmap
+import numpy as np
+import os
+import struct
+
+# Texture bundles: the images for one graphics set, already decoded and
+# downsampled to the size they're drawn at, stored as raw RGB/RGBA pixels
+# in one file.  Loading a bundle is an mmap() and some array views handed
+# straight to pi3d.Texture, instead of a full-size JPEG/PNG decode through
+# PIL for every map on every boot (which also briefly holds the full-size
+# image in memory).  PIL is only needed to build a bundle.
+#
+# Layout (little-endian): header "<4sII" (magic, version, count), then
+# count entries "<16sIIIQ" (name, width, height, channels, data offset),
+# then pixel data, each image starting on a 64-byte boundary.
+
+BUNDLE_MAGIC   = b"PEYT"
+BUNDLE_VERSION = 1
+HEADER         = struct.Struct("<4sII")
+ENTRY          = struct.Struct("<16sIIIQ")
+ALIGN          = 64
+
+
+# Pick texture size for an eye of given radius (pixels): smallest power
+# of two at least 4 radii across (roughly one texel per pixel around the
+# iris and sclera), never more than the source image.
+def textureSize(eyeRadius, sourceSize):
+	size = 16
+	while size < eyeRadius * 4 and size < sourceSize: size *= 2
+	return min(size, sourceSize)
+
+
+# Decode image files and write bundle.  'images' is a dict of name ->
+# image file, 'radius' the eye radius used to size each one.
+def buildBundle(fileName, images, radius):
+	from PIL import Image
+	entries = []
+	blobs   = []
+	offset  = HEADER.size + ENTRY.size * len(images)
+	for name in sorted(images):
+		im = Image.open(images[name])
+		im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+		w, h = im.size
+		size = textureSize(radius, max(w, h))
+		if size < max(w, h):
+			w, h = max(1, w * size // max(w, h)), max(1, h * size // max(w, h))
+			im   = im.resize((w, h), Image.LANCZOS)
+		pixels = np.asarray(im, dtype=np.uint8)
+		offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+		entries.append(ENTRY.pack(name.encode("ascii"), w, h,
+		  pixels.shape[2], offset))
+		blobs.append((offset, pixels.tobytes()))
+		offset += len(blobs[-1][1])
+
+	tmpName = fileName + ".tmp"
+	with open(tmpName, "wb") as f:
+		f.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries)))
+		for e in entries: f.write(e)
+		for offset, data in blobs:
+			f.write(b"\0" * (offset - f.tell()))
+			f.write(data)
+	os.rename(tmpName, fileName)
+
+
+# Map bundle file and return dict of name -> (height,width,channels)
+# uint8 array views into it.  The mapping is copy-on-write, so if GL
+# upload code wants to touch the pixels the file stays as it was.
+def loadBundle(fileName):
+	with open(fileName, "rb") as f:
+		mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+	magic, version, count = HEADER.unpack_from(mm, 0)
+	if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+		raise ValueError("%s: not a version %d texture bundle" % (
+		  fileName, BUNDLE_VERSION))
+	textures = {}
+	for i in range(count):
+		name, w, h, channels, offset = ENTRY.unpack_from(mm,
+		  HEADER.size + ENTRY.size * i)
+		name = name.rstrip(b"\0").decode("ascii")
+		textures[name] = np.frombuffer(mm, dtype=np.uint8,
+		  count=w * h * channels, offset=offset).reshape(h, w, channels)
+	return textures
+
+
+# Return texture arrays for one graphics set (dict of name -> image file,
+# as in eyes.py's 'graphics' table; non-image entries are ignored), from
+# a bundle in cacheDir.  The bundle is (re)built first if it's missing
+# or older than any of its source images; if it can't be written there
+# (read-only install, etc.) the image files are returned as they are,
+# for pi3d.Texture to load the usual way.
+def bundleTextures(setName, images, radius, cacheDir):
+	images   = dict((k, v) for k, v in images.items()
+	  if os.path.splitext(v)[1].lower() in (".jpg", ".jpeg", ".png"))
+	fileName = os.path.join(cacheDir, "%s-%d.texb" % (setName, radius))
+	try:
+		stamp = os.path.getmtime(fileName)
+		if not any(os.path.getmtime(f) > stamp for f in images.values()):
+			return loadBundle(fileName)
+	except (OSError, ValueError): # Missing, or from another version
+		pass
+	try:
+		if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+		buildBundle(fileName, images, radius)
+		return loadBundle(fileName)
+	except (IOError, OSError):
+		return images
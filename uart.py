@@ -4,7 +4,8 @@ import sys
 import time
 import serial
 import threading
-from scipy.signal import lfilter
+from multitrack import MultiTracker
+from smoothing import makeFilter
 
 
 UART_PORT    = "/dev/ttyAMA0"
@@ -12,36 +13,98 @@ UART_BAUD    = 115200
 
 POINTS_COUNT = 4
 
+# Target smoothing, as smoothing.py filter specs.  These give the same
+# output as the old lfilter() code: sum of the last POINTS_COUNT
+# positions over 15 (x) and 5 (y).
+FILTER_X     = ("box", POINTS_COUNT, 1.0 / 15)
+FILTER_Y     = ("box", POINTS_COUNT, 1.0 / 5)
 
+
+# Camera line protocol, one frame at a time: "lux:<v>" starts a frame,
+# "blob:x=<v>:y=<v>:s=<v>" lines add blobs, "fps:<v>" completes it.
+# feed() takes one line and returns the frame (a dict) when complete.
+class FrameParser(object):
+    latest = None
+
+    def feed(self, line):
+        if ':' not in line:
+            return None
+
+        parts = line.split(':')
+        if parts[0] == 'lux':
+            # reset the latest
+            try:
+                lux = float(parts[1])
+            except:
+                return None
+            self.latest = {
+                'lux': lux,
+                'blobs': [],
+            }
+        elif parts[0] == 'blob' and self.latest:
+            blob = {}
+            for item in parts[1:]:
+                if '=' not in item:
+                    continue
+                try:
+                    k, v = item.split('=')
+                    blob[k] = float(v)
+                except:
+                    blob = None
+                    break
+            if blob and len(blob):
+                self.latest['blobs'].append(blob)
+        elif parts[0] == 'fps' and self.latest:
+            latest = self.latest
+            self.latest = None
+            try:
+                latest['fps'] = float(parts[1])
+            except:
+                return None
+            # it's complete
+            return latest
+        return None
+
+
+# Gaze target from the tracked blob the eyes are looking at (see
+# multitrack.py), in degrees, smoothed over frames (see smoothing.py).
+# target() returns (x, y), or None if nothing is being tracked.
+class TargetFilter(object):
+    def __init__(self, x=FILTER_X, y=FILTER_Y):
+        self.x = makeFilter(x)
+        self.y = makeFilter(y)
+        self.tracker = MultiTracker()
+
+    # 'now' is the frame's arrival time (for time-aware filters)
+    def target(self, latest, now=None):
+        if now is None:
+            now = time.time()
+        focus = self.tracker.update(latest.get('blobs', ()), now)
+        if not focus:
+            return None
+
+        t = focus.degrees()
+        return (self.x.update(t[0], now), self.y.update(t[1], now))
+
+
+# Reads the serial port and writes "x,y,lux,fps,tracks" lines to stdout,
+# for eyes.py's subprocess UART mode (in-process mode is uartingest.py).
+# tracks is every confirmed track as "id:x:y:size" (degrees), separated
+# by ';', and empty when there are none.
 class uartThread(threading.Thread):
     sio = None
-    targets = None
-    lux = None
-    points_x = None
-    points_y = None
+    parser = None
+    filter = None
 
     def __init__(self, uart):
         super(uartThread, self).__init__()
         #self.sio = io.TextIOWrapper(io.BufferedReader(uart))
         self.sio = uart
-        self.targets = ()
-        self.lux = 0.0
-        self.points_x = [0] * POINTS_COUNT
-        self.points_y = [0] * POINTS_COUNT
-
-        n = 15
-        self.b_x = [1.0 / n] * n
-        self.a_x = 1
-
-        n = 5
-        self.b_y = [1.0 / n] * n
-        self.a_y = 1
-
+        self.parser = FrameParser()
+        self.filter = TargetFilter()
         self.running = True
 
     def run(self):
-        latest = None
-
         # Purge any buffered bytes
         self.sio.reset_input_buffer()
 
@@ -53,50 +116,12 @@ class uartThread(threading.Thread):
                 time.sleep(0.1)
                 continue
 
-            if ':' not in line:
-                continue
-
-            parts = line.split(':')
-            if parts[0] == 'lux':
-                # reset the latest
-                try:
-                    lux = float(parts[1])
-                except:
-                    continue
-                latest = {
-                    'lux': lux,
-                    'blobs': [],
-                }
-            elif parts[0] == 'blob' and latest:
-                blob = {}
-                for item in parts[1:]:
-                    if '=' not in item:
-                        continue
-                    try:
-                        k, v = item.split('=')
-                        blob[k] = float(v)
-                    except:
-                        blob = None
-                        break
-                if blob and len(blob):
-                    latest['blobs'].append(blob)
-            elif parts[0] == 'fps' and latest:
-                try:
-                    latest['fps'] = float(parts[1])
-                except:
-                    latest = None
-                    continue
-                # it's complete, process the contents
+            latest = self.parser.feed(line)
+            if latest:
                 self.process(latest)
-                latest = None
 
     def process(self, latest):
-        # sort the blobs by size, use the largest
-        t = ()
-        if 'blobs' in latest and len(latest['blobs']) > 0:
-            blob = sorted(latest['blobs'], key=lambda x:x.get('s', 0), reverse=True)[0]
-            # store with coords converted into x,y tuples scaled to our usable range
-            t = ( (blob['x'] * 60.0 - 30.0), -(blob['y'] * 60.0 - 30.0) )
+        t = self.filter.target(latest)
 
         if t and False:
             sys.stderr.write("new x:%1.1f y:%1.1f lux:%1.1f fps:%1.1f      \r" % (
@@ -105,33 +130,25 @@ class uartThread(threading.Thread):
                    latest['lux'] if 'lux' in latest else 0.0,
                    latest['fps'] if 'fps' in latest else 0.0))
 
-        if t:
-            # accumulate points in a rolling buffer
-            self.points_x.pop(0)
-            self.points_y.pop(0)
-            self.points_x.append(t[0])
-            self.points_y.append(t[1])
-
-            # run a filter on the accumulated points
-            x = lfilter(self.b_x, self.a_x, self.points_x)
-            y = lfilter(self.b_y, self.a_y, self.points_y)
-
-            t = (x[-1], y[-1])
-        else:
+        if not t:
             t = (None, None)
 
-        sys.stdout.write("%s,%s,%s,%s\n" % (t[0], t[1], latest['lux'], latest['fps']))
+        tracks = ';'.join("%d:%r:%r:%r" % track
+                          for track in self.filter.tracker.snapshot())
 
+        sys.stdout.write("%s,%s,%s,%s,%s\n" % (t[0], t[1], latest['lux'],
+                                               latest['fps'], tracks))
 
-uart = serial.Serial(UART_PORT)
-uart.baudrate = UART_BAUD
 
-uart_thread = uartThread(uart)
-uart_thread.daemon = True
-uart_thread.start()
+if __name__ == "__main__":
+    uart = serial.Serial(UART_PORT)
+    uart.baudrate = UART_BAUD
 
-del uart
+    uart_thread = uartThread(uart)
+    uart_thread.daemon = True
+    uart_thread.start()
 
-while True:
-    time.sleep(1)
+    del uart
 
+    while True:
+        time.sleep(1)
@@ -0,0 +1,177 @@
+import errno
+import os
+import select
+import sys
+import threading
+import time
+import serial
+from frametrace import tracer
+from camproto import *
+from uart import UART_PORT, UART_BAUD, TargetFilter
+
+# In-process camera input.  uart.py runs as its own process, reading the
+# serial port a line at a time, filtering, and printing CSV down a pipe
+# for eyes.py's uartThread to parse back into floats: two processes, two
+# text parses and a pipe hop per camera frame.  UartIngest does the same
+# work in a thread of the eye process.  It waits on the port's fd with
+# select(), reads everything that has arrived in one go, splits frames out
+# of a bytearray (camproto.py; binary frames if the camera takes the
+# request, else its ASCII lines) and publishes each frame's target and
+# light level straight to the attributes the render loop reads, under the
+# same lock and names as uartThread.
+#
+# If the port can't be opened (camera unplugged, port busy) or goes away,
+# the error is logged and opening is retried, backing off from
+# OPEN_RETRY to OPEN_RETRY_MAX seconds; until then there's no camera
+# data, as with a camera that sees nothing.
+
+READ_SIZE   = 4096
+MAX_PENDING = 4096 # Bytes without a complete frame before they're dropped
+SELECT_WAIT = 0.5  # Seconds; bounds how long stop() takes to be noticed
+REQUEST_GAP = 2.0  # Seconds between binary requests while getting ASCII
+OPEN_RETRY     = 1.0  # Seconds before first retry of a failed open
+OPEN_RETRY_MAX = 30.0 # ...doubling up to this
+
+
+class UartIngest(threading.Thread):
+	# binary=True asks the camera for binary frames (ASCII is still taken
+	# if it doesn't switch)
+	# mailbox: also publish to this shmbox.Mailbox's "camera" slot
+	def __init__(self, port=UART_PORT, baud=UART_BAUD, binary=True,
+	  mailbox=None):
+		super(UartIngest, self).__init__()
+		self.port      = port
+		self.baud      = baud
+		self.binary    = binary
+		self.mailbox   = mailbox
+		self.requested = None # time.time() binary was last asked for
+		self.uart      = None
+		self.lock      = threading.Lock()
+		self.running   = True
+		self.decoder   = StreamDecoder()
+		self.filter    = TargetFilter()
+		self.buffer    = bytearray()
+		# Published, under lock
+		self.targets   = None # Gaze target (x, y) in degrees, or None
+		self.tracks    = ()   # All tracks (id, x, y, size), degrees
+		self.focus     = None # ID of the track targets follows
+		self.lux       = None
+		self.fps       = None # Camera's own frame rate
+		self.stamp     = None # time.time() the latest frame was read
+		# Reader's own counts
+		self.frames    = 0
+		self.reads     = 0
+		self.bytes     = 0
+		self.discarded = 0
+		self.opens     = 0
+		self.error     = None # Why the port last failed, if it did
+
+	def run(self):
+		while self.running:
+			if not self.open(): break
+			self.read()
+			try:
+				self.uart.close()
+			except (IOError, OSError):
+				pass # Already gone
+			self.uart = None
+
+	# Open the port, retrying with backoff until it opens or stop() is
+	# called; returns whether it's open
+	def open(self):
+		delay = OPEN_RETRY
+		while self.running:
+			try:
+				self.uart = serial.Serial(self.port, self.baud, timeout=0)
+				self.uart.reset_input_buffer() # Purge any buffered bytes
+				self.opens += 1
+				if self.binary: self.request(time.time())
+				return True
+			except (IOError, OSError, ValueError) as e:
+				if str(e) != self.error:
+					sys.stderr.write("camera port %s: %s; retrying\n" % (
+					  self.port, e))
+				self.error = str(e)
+			end = time.time() + delay
+			while self.running and time.time() < end: time.sleep(0.1)
+			delay = min(delay * 2.0, OPEN_RETRY_MAX)
+		return False
+
+	# Read from the open port until stop() or the port goes away
+	def read(self):
+		fd = self.uart.fileno()
+		while self.running:
+			try:
+				ready = select.select([fd], [], [], SELECT_WAIT)[0]
+				if not ready: continue
+				data = os.read(fd, READ_SIZE)
+			except (IOError, OSError, select.error) as e:
+				if e.args and e.args[0] == errno.EINTR: continue # Signal
+				# EIO etc.: USB serial adapter unplugged; reopen
+				self.error = str(e)
+				sys.stderr.write("camera port %s: %s; reopening\n" % (
+				  self.port, e))
+				return
+			if not data: # Port went away; reopen
+				self.error = "port closed"
+				sys.stderr.write("camera port %s closed; reopening\n" %
+				  self.port)
+				return
+			with tracer.span("uart"):
+				self.feed(data, time.time())
+
+	# Ask the camera for binary frames; it's asked again if ASCII keeps
+	# arriving (camera reset, or busy when first asked)
+	def request(self, now):
+		self.requested = now
+		try:
+			self.uart.write(REQUEST_BINARY)
+		except (IOError, OSError):
+			pass
+
+	# Add bytes read at time 'now'; decodes all complete frames,
+	# publishing the last one
+	def feed(self, data, now):
+		buf         = self.buffer
+		buf        += data
+		self.reads += 1
+		self.bytes += len(data)
+		frames, used = self.decoder.feed(buf)
+		del buf[:used]
+		if len(buf) > MAX_PENDING:
+			self.discarded += len(buf)
+			del buf[:]
+		if not frames: return
+		for frame in frames:
+			# Every frame goes through the filter, only the newest is
+			# published
+			t = self.filter.target(frame, now)
+			self.frames += 1
+		tracker = self.filter.tracker
+		tracks  = tracker.snapshot()
+		with self.lock:
+			self.targets = t
+			self.tracks  = tracks
+			self.focus   = tracker.focus.id if tracker.focus else None
+			self.lux     = frame['lux']
+			self.fps     = frame['fps']
+			self.stamp   = now
+		if self.mailbox:
+			self.mailbox.publish("camera", (1.0,) + t + (frame['lux'],
+			  frame['fps']) if t else (0.0, 0.0, 0.0, frame['lux'],
+			  frame['fps']), now)
+		if (self.binary and self.uart and 'seq' not in frame and
+		  now - self.requested >= REQUEST_GAP):
+			self.request(now)
+
+	def stop(self):
+		self.running = False
+
+	def stats(self):
+		if not self.opens:
+			return "port %s never opened (%s)" % (self.port, self.error)
+		return ("%d frames (%s), %d reads, %d bytes, %d discarded, "
+		  "opened %d times%s; %s" % (self.frames, self.decoder.stats(),
+		  self.reads, self.bytes, self.discarded, self.opens,
+		  ", last error: %s" % self.error if self.error else "",
+		  self.filter.tracker.stats()))